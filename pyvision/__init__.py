@@ -1,24 +1,101 @@
 """
 This is the top-level namespace for the pyvision 3 library
+
+Only the constants and exceptions are imported eagerly. The other public
+names are resolved on first access, at which point the submodule defining
+them (and any heavy dependencies, such as opencv, shapely, or matplotlib)
+is imported. This keeps "import pyvision" fast for short-lived processes,
+while pv3.Image, pv3.MotionDetector, etc. work as always.
 """
+import importlib
+
 from .constants import *
 from .pv_exceptions import *
-from .geometry import Point, Rect, CenteredRect, in_bounds, integer_bounds, integer_coords_array
-from .image import Image
 
-from .affine import AffineTransformer, AffineRotation, AffineTranslate
+# Maps each lazily-resolved public name to the submodule that defines it
+_LAZY_NAMES = {
+    "POLY_SLEEPYCAT": ".constants",
+
+    "Point": ".geometry",
+    "Rect": ".geometry",
+    "CenteredRect": ".geometry",
+    "RectArray": ".geometry",
+    "in_bounds": ".geometry",
+    "integer_bounds": ".geometry",
+    "integer_coords_array": ".geometry",
+
+    "Image": ".image",
+    "ImageWriter": ".imagewriter",
+
+    "AffineTransformer": ".affine",
+    "AffineRotation": ".affine",
+    "AffineTranslate": ".affine",
+
+    "ImageBuffer": ".imagebuffer",
+    "CompressedImageBuffer": ".imagebuffer",
+    "SharedImage": ".sharedmem",
+    "SharedImageBuffer": ".sharedmem",
+    "SharedImageHandle": ".sharedmem",
+    "ImageMontage": ".montage",
+    "compose_montage": ".montage",
+    "VideoMontage": ".montage",
+
+    "prefetch_map": ".parallel",
+
+    "VideoInterface": ".video",
+    "Video": ".video",
+    "VideoFromFileList": ".video",
+    "VideoFromImageStack": ".video",
+
+    "FrameDifferenceModel": ".video_proc.backgroundsubtract",
+    "MedianModel": ".video_proc.backgroundsubtract",
+    "ApproximateMedianModel": ".video_proc.backgroundsubtract",
+    "AbstractBGModel": ".video_proc.backgroundsubtract",
+    "StaticModel": ".video_proc.backgroundsubtract",
+    "BG_SUBTRACT_STATIC": ".video_proc.backgroundsubtract",
+    "BG_SUBTRACT_FRAME_DIFF": ".video_proc.backgroundsubtract",
+    "BG_SUBTRACT_MEDIAN": ".video_proc.backgroundsubtract",
+    "BG_SUBTRACT_APPROX_MEDIAN": ".video_proc.backgroundsubtract",
+    "MotionDetector": ".video_proc.motiondetection",
+    "MD_BOUNDING_RECTS": ".video_proc.motiondetection",
+    "MD_STANDARDIZED_RECTS": ".video_proc.motiondetection",
+    "ClipRecorder": ".video_proc.cliprecorder",
+
+    "crop_regions": ".dataset_tools.crops",
+    "crop_negative_regions": ".dataset_tools.crops",
+    "random_rect_gen": ".dataset_tools.crops",
+    "extract_crops": ".dataset_tools.extraction",
+    "read_manifest": ".dataset_tools.extraction",
+    "PHashIndex": ".dataset_tools.dedup",
+    "phash": ".dataset_tools.dedup",
+    "dedup_tiles": ".dataset_tools.dedup",
+    "TileArchive": ".dataset_tools.tile_archive",
+    "TileArchiveWriter": ".dataset_tools.tile_archive",
+    "tiles_from_archive": ".dataset_tools.tile_archive",
+    "TileSelector": ".dataset_tools.tile_selection",
+    "tiles_from_dir": ".dataset_tools.tile_selection",
+    "tiles_from_files": ".dataset_tools.tile_selection",
+    "tiles_from_dir_parallel": ".dataset_tools.tile_selection",
+    "tiles_from_files_parallel": ".dataset_tools.tile_selection",
+    "tiles_from_vid": ".dataset_tools.tile_selection",
+}
+
+__all__ = sorted(name for name in globals() if name.isupper()) + \
+    ["OutOfBoundsError"] + sorted(_LAZY_NAMES)
 
-from .imagebuffer import ImageBuffer
-from .montage import ImageMontage
 
-from .video import VideoInterface, Video, VideoFromFileList, VideoFromImageStack
-from pyvision.video_proc.backgroundsubtract import \
-    FrameDifferenceModel, MedianModel, ApproximateMedianModel, AbstractBGModel, StaticModel, \
-    BG_SUBTRACT_STATIC, BG_SUBTRACT_FRAME_DIFF, BG_SUBTRACT_MEDIAN, BG_SUBTRACT_APPROX_MEDIAN
-from pyvision.video_proc.motiondetection import \
-    MotionDetector, MD_BOUNDING_RECTS, MD_STANDARDIZED_RECTS
+def __getattr__(name):
+    """
+    Resolves the lazily-imported public names of the package.
+    """
+    try:
+        module_name = _LAZY_NAMES[name]
+    except KeyError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name)) from None
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value  # subsequent lookups won't come through here
+    return value
 
-from pyvision.dataset_tools.crops import crop_regions, crop_negative_regions, random_rect_gen
-from pyvision.dataset_tools.tile_selection import TileSelector, \
-    tiles_from_dir, tiles_from_files, tiles_from_vid
 
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
@@ -4,13 +4,9 @@ Created on Dec 18, 2015
 @author: Stephen O'Hara
 """
 import os
-import inspect
-from pkg_resources import resource_filename
-import pyvision as pv3
-import shapely.geometry as sg
 
 
-PACKAGE_DIR = os.path.dirname(inspect.getfile(pv3))
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Common RGB colors (for use with pyvision annotations)
 RGB_BLACK = (0, 0, 0)  # not zeros, because that can be confusing with masks
@@ -64,18 +60,27 @@ BGR_COLORS = {"black": BGR_BLACK, "white": BGR_WHITE, "gray": BGR_GRAY,
 
 #  It's useful to have some built-in constants referring to
 #  sample data files to make demonstrations and tests easy.
-IMG_DRIVEWAY = resource_filename("pyvision", "data/driveway.jpg")
-IMG_PRIUS = resource_filename("pyvision", "data/prius_gray.jpg")
-IMG_SLEEPYCAT = resource_filename("pyvision", "data/sleepycat.jpg")
-IMG_MASK = resource_filename("pyvision", "data/test_mask.tif")
-IMG_MASK_RESULT = resource_filename("pyvision", "data/test_mask_result.tif")
-VID_PRIUS = resource_filename("pyvision", "data/prius_movie.mov")
+IMG_DRIVEWAY = os.path.join(PACKAGE_DIR, "data", "driveway.jpg")
+IMG_PRIUS = os.path.join(PACKAGE_DIR, "data", "prius_gray.jpg")
+IMG_SLEEPYCAT = os.path.join(PACKAGE_DIR, "data", "sleepycat.jpg")
+IMG_MASK = os.path.join(PACKAGE_DIR, "data", "test_mask.tif")
+IMG_MASK_RESULT = os.path.join(PACKAGE_DIR, "data", "test_mask_result.tif")
+VID_PRIUS = os.path.join(PACKAGE_DIR, "data", "prius_movie.mov")
 
 # A sample polygon roughly outlining the sleepy cat
 COORDS_SLEEPYCAT = [(285, 460), (408, 323), (545, 368), (561, 352), (530, 280), (645, 184), (714, 240),
                     (713, 114), (784, 91), (808, 286), (871, 450), (816, 651), (664, 735), (428, 656),
                     (388, 573), (350, 565), (329, 516), (277, 493)]
-POLY_SLEEPYCAT = sg.Polygon(COORDS_SLEEPYCAT)
+
+
+def __getattr__(name):
+    # POLY_SLEEPYCAT is built on first access, so that shapely is not
+    # imported just to load the constants.
+    if name == "POLY_SLEEPYCAT":
+        import shapely.geometry as sg
+        globals()[name] = sg.Polygon(COORDS_SLEEPYCAT)
+        return globals()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 if __name__ == '__main__':
     pass
@@ -7,8 +7,7 @@ author: Stephen O'Hara
 created: April 14, 2016
 """
 import pyvision as pv3
-import shapely.geometry as sg
-import shapely.ops as so
+import cv2
 import numpy as np
 
 
@@ -40,31 +39,36 @@ def crop_regions(image, shapes, crop_size=None):
     """
 
     if crop_size is not None:
-        cw, ch = crop_size
         centers = [(shp.centroid.x, shp.centroid.y) for shp in shapes]
-        rects = [pv3.CenteredRect(cx, cy, cw, ch) for (cx, cy) in centers]
+        rects = pv3.RectArray.from_centers(centers, crop_size)
     else:
-        rects = [sg.box(*shp.bounds) for shp in shapes]
-
-    # crops = [image.crop(r) for r in rects]
-    crops = []
-    for r in rects:
-        try:
-            crop = image.crop(r)
-        except pv3.OutOfBoundsError:
-            print("{} is out of bounds in {}".format(str(r.bounds), image.desc))
-            crop = None
-        crops.append(crop)
+        rects = pv3.RectArray.from_shapes(shapes)
+
+    ok = rects.in_bounds(image.size)
+    for bounds in rects.bounds[~ok]:
+        print("{} is out of bounds in {}".format(str(tuple(bounds)), image.desc))
+
+    crops = [None] * len(rects)
+    if crop_size is not None:
+        # all the crops are the same size, so extract them as a single batch
+        batch = image.crop_many(rects[ok], out_size=tuple(crop_size), as_type="PV")
+        for idx, crop in zip(np.flatnonzero(ok), batch):
+            crops[idx] = crop
+    else:
+        for idx in np.flatnonzero(ok):
+            crops[idx] = image.crop(rects[idx:idx+1])
     return crops
 
 
-def crop_negative_regions(image, shapes, crop_size, N=10):
+def crop_negative_regions(image, shapes, crop_size, N=10, rng=None):
     """
     This function is useful for creating negative or 'background'
     samples from an image where you already have known foreground
-    regions. Basically, it generates randomly located rectangles of
-    the specified crop size in the image, then removes any that intersect
-    with any of the foreground shapes. The user specifies how many
+    regions. The foreground shapes are rasterized into an occupancy
+    mask, and the integral image of the mask is used to find every
+    position where a rectangle of the crop size would not overlap
+    any foreground pixel. N of those positions are then sampled
+    at random, without replacement. The user specifies how many
     negative samples to crop from the image.
 
     Parameters
@@ -76,29 +80,72 @@ def crop_negative_regions(image, shapes, crop_size, N=10):
         The fixed size rectangles to be used for background crops
     N: integer
         The number of crops to generate from this image
+    rng: numpy.random.Generator, int, or None
+        The random generator, or a seed for one, used to sample the
+        crop positions. None means use fresh, unpredictable entropy.
 
     Returns
     -------
     A list of crops, where each is a pyvision image
+
+    Raises a ValueError if there are fewer than N valid crop positions
+    in the image.
     """
-    positive_area = so.cascaded_union(shapes)
-    validated_crops = []
+    (img_w, img_h) = image.size
+    (c_w, c_h) = crop_size
+
+    if c_w > img_w or c_h > img_h:
+        valid = np.empty(0, dtype='int')
+    else:
+        occupied = _occupancy_mask(image.size, shapes)
+        integral = cv2.integral(occupied)
+        # the number of foreground pixels in the crop with its top-left corner at each (x, y)
+        counts = integral[c_h:, c_w:] - integral[:-c_h, c_w:] - integral[c_h:, :-c_w] + integral[:-c_h, :-c_w]
+        valid = np.flatnonzero(counts == 0)
 
-    while len(validated_crops) < N:
-        rect_gen = random_rect_gen(image.size, crop_size, N=N*2)
-        for rect in rect_gen:
-            if not rect.intersects(positive_area):
-                validated_crops.append(image.crop(rect))
-            if len(validated_crops) >= N:
-                break
+    if len(valid) < N:
+        raise ValueError("Only {} background crop positions of size {} are available in {}, {} requested.".format(
+            len(valid), crop_size, image.desc, N))
 
-    return validated_crops
+    rng = np.random.default_rng(rng)
+    picks = rng.choice(valid, size=N, replace=False)
+    (ys, xs) = np.divmod(picks, img_w - c_w + 1)
+    rects = pv3.RectArray.from_xywh(np.column_stack((xs, ys, np.full(N, c_w), np.full(N, c_h))))
+    return image.crop_many(rects, as_type="PV")
 
 
-def random_rect_gen(image_size, crop_size, N=1):
+def _occupancy_mask(image_size, shapes):
+    """
+    Rasterizes shapes into a mask with the given (w, h) size, where pixels covered
+    by any shape are 1, and others are 0. The holes of polygons are not covered.
+    Geometries other than polygons cover their integer bounding boxes.
+    """
+    (img_w, img_h) = image_size
+    mask = np.zeros((img_h, img_w), dtype='uint8')
+    for shape in shapes:
+        for part in getattr(shape, "geoms", [shape]):
+            if part.is_empty:
+                continue
+            if hasattr(part, "exterior"):
+                # each polygon is filled separately, so that overlapping polygons
+                # don't cancel out like holes do
+                rings = [np.array(part.exterior.coords, dtype='int32')] + \
+                        [np.array(x.coords, dtype='int32') for x in part.interiors]
+                cv2.fillPoly(mask, rings, color=1)
+                for ring in rings:
+                    cv2.polylines(mask, [ring], True, color=1)  # boundary pixels count too
+            else:
+                (minx, miny, maxx, maxy) = pv3.integer_bounds(part)
+                mask[max(miny, 0):maxy+1, max(minx, 0):maxx+1] = 1
+    return mask
+
+
+def random_rect_gen(image_size, crop_size, N=1, rng=None, non_overlapping=False, min_spacing=0,
+                    yield_shapes=False, max_rounds=100):
     """
     Generates random rectangles (crop boundaries) of the specified size from within
-    the image_size bounds.
+    the image_size bounds. The top-left corners are sampled uniformly from all the
+    positions where the rectangle fits within the image.
 
     Parameters
     ----------
@@ -109,19 +156,120 @@ def random_rect_gen(image_size, crop_size, N=1):
         The (w, h) of the crop rectangles, must be smaller than the image_size
     N: integer
         The number of random crop rects to create, default is 1
+    rng: numpy.random.Generator, int, or None
+        The random generator, or a seed for one. None means use fresh,
+        unpredictable entropy.
+    non_overlapping: boolean
+        If True, then no two of the rectangles will overlap. Default is False.
+    min_spacing: integer
+        If greater than zero, then the rectangles will not overlap, and will also be
+        separated by at least this many pixels, horizontally or vertically.
+    yield_shapes: boolean
+        If True, then a generator of shapely polygons is returned instead of a RectArray.
+    max_rounds: integer
+        When placing non-overlapping rectangles, the number of rounds of candidate
+        sampling to attempt before giving up.
 
     Returns
     -------
-    The rectangles as shapely polygons
+    The rectangles as a RectArray, which can also be iterated to get shapely polygons,
+    or as a generator of shapely polygons if yield_shapes is True.
+
+    Raises a ValueError if the crop size is larger than the image, or if N
+    non-overlapping rectangles could not be placed.
     """
     img_w, img_h = image_size
     c_w, c_h = crop_size
+    if c_w > img_w or c_h > img_h:
+        raise ValueError("Crop size {} is larger than the image size {}".format(crop_size, image_size))
+
+    rng = np.random.default_rng(rng)
+    if non_overlapping or min_spacing > 0:
+        xs, ys = _place_separated(rng, img_w - c_w, img_h - c_h, c_w + min_spacing, c_h + min_spacing,
+                                  N, max_rounds)
+    else:
+        xs = rng.integers(0, img_w - c_w + 1, size=N)
+        ys = rng.integers(0, img_h - c_h + 1, size=N)
+
+    rects = pv3.RectArray.from_xywh(np.column_stack((xs, ys, np.full(N, c_w), np.full(N, c_h))))
+    if yield_shapes:
+        return iter(rects)
+    return rects
+
+
+# The offsets of a grid cell's 8 neighbors
+_NEIGHBORS = [(dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dy, dx) != (0, 0)]
+
+
+def _place_separated(rng, max_x, max_y, sep_x, sep_y, N, max_rounds):
+    """
+    Samples N points from [0, max_x] x [0, max_y] such that every pair of points is
+    at least sep_x apart horizontally or sep_y apart vertically, using parallel dart
+    throwing on a grid of (sep_x, sep_y) cells.
+
+    Each cell can hold at most one point, so a candidate need only be checked against
+    the points in its own and its 8 neighboring cells. In each round, a batch of candidates
+    is drawn, those conflicting with already-accepted points are discarded, and among the
+    rest, each candidate with a higher (random) priority than all of its conflicting
+    candidates is accepted, as in Luby's independent set algorithm.
+
+    Returns
+    -------
+    The (xs, ys) integer arrays of the points
+    """
+    grid_w = max_x // sep_x + 1
+    grid_h = max_y // sep_y + 1
+    if N > grid_w * grid_h:
+        raise ValueError("At most {} rectangles can be placed with the given size and spacing, "
+                         "{} requested.".format(grid_w * grid_h, N))
+
+    # the index of the accepted point in each cell, or -1. Padded by one cell on each side.
+    grid = np.full((grid_h + 2, grid_w + 2), -1, dtype='int64')
+    xs = np.empty(N, dtype='int64')
+    ys = np.empty(N, dtype='int64')
+    count = 0
+
+    for _ in range(max_rounds):
+        need = N - count
+        if need == 0:
+            break
+        M = max(2 * need, 256)
+        cx = rng.integers(0, max_x + 1, size=M)
+        cy = rng.integers(0, max_y + 1, size=M)
+        gx = cx // sep_x + 1
+        gy = cy // sep_y + 1
+
+        # discard candidates that conflict with accepted points
+        ok = grid[gy, gx] < 0
+        for (dy, dx) in _NEIGHBORS:
+            nb = grid[gy + dy, gx + dx]
+            ok &= ~((nb >= 0) & (np.abs(cx - xs[nb]) < sep_x) & (np.abs(cy - ys[nb]) < sep_y))
+        (cx, cy, gx, gy) = (cx[ok], cy[ok], gx[ok], gy[ok])
+
+        # candidates in the same cell always conflict, so keep the highest priority one in each
+        priority = rng.random(len(cx))
+        order = np.argsort(-priority)
+        _, first = np.unique(gy[order] * grid.shape[1] + gx[order], return_index=True)
+        keep = order[first]
+        (cx, cy, gx, gy, priority) = (cx[keep], cy[keep], gx[keep], gy[keep], priority[keep])
+
+        # then keep those with a higher priority than any conflicting neighbor
+        candidates = np.full_like(grid, -1)
+        candidates[gy, gx] = np.arange(len(cx))
+        win = np.ones(len(cx), dtype='bool')
+        for (dy, dx) in _NEIGHBORS:
+            nb = candidates[gy + dy, gx + dx]
+            win &= ~((nb >= 0) & (np.abs(cx - cx[nb]) < sep_x) & (np.abs(cy - cy[nb]) < sep_y) &
+                     (priority[nb] > priority))
 
-    offset_x = c_w // 2
-    offset_y = c_h // 2
+        accepted = rng.permutation(np.flatnonzero(win))[:need]
+        k = len(accepted)
+        xs[count:count + k] = cx[accepted]
+        ys[count:count + k] = cy[accepted]
+        grid[gy[accepted], gx[accepted]] = np.arange(count, count + k)
+        count += k
 
-    rand_xs = np.random.randint(offset_x, high=img_w-offset_x, size=N)
-    rand_ys = np.random.randint(offset_y, high=img_h-offset_y, size=N)
-    for (cx, cy) in zip(rand_xs, rand_ys):
-        rect = pv3.CenteredRect(cx, cy, crop_size[0], crop_size[1])
-        yield rect
+    if count < N:
+        raise ValueError("Only {} of {} rectangles could be placed with the given size and spacing.".format(
+            count, N))
+    return xs, ys
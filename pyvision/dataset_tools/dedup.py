@@ -0,0 +1,272 @@
+"""
+Tools for removing near-duplicate tiles from a data set, such as the
+highly redundant crops that come from consecutive video frames.
+
+Each tile is summarized by a 64-bit perceptual hash (pHash), which is
+computed for batches of tiles at a time. Similar looking images have
+hashes that differ in only a few bits, so near-duplicates are found by
+the Hamming distance between hashes. The PHashIndex finds all the stored
+hashes within a small distance of a query without comparing against every
+one of them, using multi-index hashing: the 64 bits are split into
+max_distance + 1 chunks, and any hash within max_distance bits of the
+query must match it exactly on at least one chunk.
+
+Example
+-------
+unique_tiles = dedup_tiles(pv3.tiles_from_vid(vid), max_distance=6)
+ts = pv3.TileSelector(unique_tiles)
+"""
+# pylint: disable=E1101
+import itertools
+
+import cv2
+import numpy as np
+import pyvision as pv3
+
+# The size of the grayscale thumbnail that is hashed, and of the low-frequency block kept
+_HASH_IMAGE_SIZE = 32
+_HASH_BLOCK_SIZE = 8
+
+# The number of bits set in each byte value
+_POPCOUNT = np.array([bin(x).count("1") for x in range(256)], dtype='uint8')
+
+
+def _dct_matrix(n):
+    """
+    The orthonormal DCT-II matrix D, such that D @ x is the DCT of the vector x.
+    """
+    k = np.arange(n)[:, np.newaxis]
+    i = np.arange(n)[np.newaxis, :]
+    d = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    d[0, :] = np.sqrt(1.0 / n)
+    return d.astype('float32')
+
+
+# only the low-frequency rows are needed
+_DCT = _dct_matrix(_HASH_IMAGE_SIZE)[:_HASH_BLOCK_SIZE]
+
+
+def phash(images):
+    """
+    Computes the perceptual hashes of a batch of images. Each image is reduced to a
+    32x32 grayscale thumbnail, the 8x8 block of its lowest DCT frequencies is taken,
+    and each bit of the hash records whether a coefficient is above the block's median.
+
+    Parameters
+    ----------
+    images: list of pyvision images or cv2 ndarrays, or a single pyvision image
+
+    Returns
+    -------
+    An ndarray of N uint64 hashes, or a single hash if a single image was given.
+    """
+    if isinstance(images, pv3.Image):
+        return phash([images])[0]
+
+    n = _HASH_IMAGE_SIZE
+    if len(images) == 0:
+        return np.zeros(0, dtype='uint64')
+    stack = np.empty((len(images), n, n), dtype='float32')
+    for i, img in enumerate(images):
+        mat = img.data if isinstance(img, pv3.Image) else img
+        if mat.ndim == 3:
+            mat = cv2.cvtColor(mat, cv2.COLOR_BGR2GRAY)
+        stack[i] = cv2.resize(mat, (n, n), interpolation=cv2.INTER_AREA)
+
+    # 2D DCT of the whole stack as two matrix products, keeping the top-left 8x8 block
+    block = (_DCT @ stack @ _DCT.T).reshape(len(images), -1)
+    bits = block > np.median(block, axis=1, keepdims=True)
+    return np.packbits(bits, axis=1).view('>u8').ravel().astype('uint64')
+
+
+def hamming_distance(hashes, other):
+    """
+    Parameters
+    ----------
+    hashes: uint64 ndarray or int
+    other: uint64 ndarray or int
+        Broadcastable against hashes
+
+    Returns
+    -------
+    The number of bits that differ between the hashes and the other hashes, as an int array
+    """
+    xor = np.bitwise_xor(np.asarray(hashes, dtype='uint64'), np.asarray(other, dtype='uint64'))
+    shape = xor.shape
+    counts = _POPCOUNT[np.ascontiguousarray(xor).reshape(-1).view('uint8')]
+    return counts.reshape(shape + (8,)).sum(axis=-1, dtype='int')
+
+
+class PHashIndex(object):
+    """
+    An index of perceptual hashes, supporting fast lookup of all the stored
+    hashes within a given Hamming distance of a query hash.
+    """
+
+    def __init__(self, max_distance=4):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        max_distance: int
+            The largest Hamming distance that queries will support. Hashes within this
+            distance of each other are considered near-duplicates. Smaller values give
+            faster lookups.
+        """
+        if not 0 <= max_distance < 64:
+            raise ValueError("max_distance must be in the range [0, 63], not {}".format(max_distance))
+        self.max_distance = max_distance
+        self.ids = []
+        self._hashes = np.zeros(1024, dtype='uint64')  # grown as required
+
+        # split the 64 bits into max_distance + 1 chunks of (nearly) equal width
+        num_chunks = max_distance + 1
+        widths = np.full(num_chunks, 64 // num_chunks)
+        widths[:64 % num_chunks] += 1
+        self._shifts = np.concatenate(([0], np.cumsum(widths)[:-1])).astype('uint64')
+        self._masks = np.array([(1 << int(w)) - 1 for w in widths], dtype='uint64')
+        self._tables = [{} for _ in range(num_chunks)]  # chunk value -> list of positions
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def hashes(self):
+        """
+        The stored hashes, as a uint64 ndarray in the order they were added
+        """
+        return self._hashes[:len(self.ids)]
+
+    def _chunks(self, hashes):
+        return (hashes[:, np.newaxis] >> self._shifts) & self._masks
+
+    def add(self, hashes, ids=None):
+        """
+        Adds hashes to the index.
+
+        Parameters
+        ----------
+        hashes: uint64 ndarray, or a single hash
+        ids: list or None
+            An identifier for each hash, such as a tile id, that is returned by queries.
+            If None, the position of each hash in the index is used.
+        """
+        hashes = np.atleast_1d(np.asarray(hashes, dtype='uint64'))
+        start = len(self.ids)
+        if ids is None:
+            ids = range(start, start + len(hashes))
+        elif len(ids) != len(hashes):
+            raise ValueError("The number of ids must match the number of hashes.")
+
+        if start + len(hashes) > len(self._hashes):
+            grown = np.zeros(max(2 * len(self._hashes), start + len(hashes)), dtype='uint64')
+            grown[:start] = self._hashes[:start]
+            self._hashes = grown
+        self._hashes[start:start + len(hashes)] = hashes
+        self.ids.extend(ids)
+
+        for pos, chunks in enumerate(self._chunks(hashes).tolist(), start):
+            for table, value in zip(self._tables, chunks):
+                table.setdefault(value, []).append(pos)
+
+    def _candidates(self, hash_value):
+        """
+        The positions of the stored hashes that match the hash on at least one chunk
+        """
+        chunks = self._chunks(np.array([hash_value], dtype='uint64'))[0].tolist()
+        found = [table.get(value, ()) for table, value in zip(self._tables, chunks)]
+        return np.unique(np.fromiter(itertools.chain.from_iterable(found), dtype='int64'))
+
+    def query(self, hash_value, max_distance=None):
+        """
+        Finds the stored hashes near a query hash.
+
+        Parameters
+        ----------
+        hash_value: uint64
+        max_distance: int or None
+            Defaults to the max_distance of the index, and may not be larger.
+
+        Returns
+        -------
+        A list of (id, distance) tuples for all the stored hashes within max_distance
+        of the query, sorted by distance.
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        elif max_distance > self.max_distance:
+            raise ValueError("This index supports queries up to a distance of {}".format(self.max_distance))
+        positions = self._candidates(hash_value)
+        dists = hamming_distance(self._hashes[positions], hash_value)
+        near = np.flatnonzero(dists <= max_distance)
+        near = near[np.argsort(dists[near], kind="stable")]
+        return [(self.ids[positions[i]], int(dists[i])) for i in near]
+
+    def add_unique(self, hashes, ids=None):
+        """
+        Adds only those hashes that are not within max_distance of a hash already in
+        the index, including those added earlier in the same call.
+
+        Parameters
+        ----------
+        hashes: uint64 ndarray
+        ids: list or None
+            See add(...)
+
+        Returns
+        -------
+        A boolean array, True for each hash that was unique, and so was added.
+        """
+        hashes = np.atleast_1d(np.asarray(hashes, dtype='uint64'))
+        if ids is None:
+            ids = [None] * len(hashes)
+        unique = np.zeros(len(hashes), dtype='bool')
+        for i, hash_value in enumerate(hashes):
+            positions = self._candidates(hash_value)
+            if len(positions) == 0 or \
+                    hamming_distance(self._hashes[positions], hash_value).min() > self.max_distance:
+                unique[i] = True
+                self.add(hash_value, None if ids[i] is None else [ids[i]])
+        return unique
+
+
+def dedup_tiles(tile_generator, max_distance=4, batch_size=64, index=None):
+    """
+    Wraps a tile generator, dropping tiles that are near-duplicates of a tile
+    already yielded. Tiles are hashed in batches.
+
+    Parameters
+    ----------
+    tile_generator: generator or iterable
+        Yields (tile_id, tile_image, label) tuples, such as from tiles_from_vid(...)
+    max_distance: int
+        Tiles whose perceptual hashes differ in at most this many bits (out of 64)
+        are considered duplicates. Ignored if an index is provided.
+    batch_size: int
+        The number of tiles hashed at a time
+    index: PHashIndex or None
+        The index of hashes of tiles considered already seen, which will be updated
+        with the hashes of the yielded tiles. This allows a data set to be deduplicated
+        against previously curated data. If None, a new index is used.
+
+    Returns
+    -------
+    A tile generator, yielding the (tile_id, tile_image, label) tuples of the
+    unique tiles. Tiles that failed to load (None) are passed through.
+    """
+    if index is None:
+        index = PHashIndex(max_distance)
+
+    tile_generator = iter(tile_generator)  # so that a list is consumed batch by batch
+    while True:
+        batch = list(itertools.islice(tile_generator, batch_size))
+        if not batch:
+            break
+        loaded = [i for (i, item) in enumerate(batch) if item[1] is not None]
+        hashes = phash([batch[i][1] for i in loaded])
+        keep = np.ones(len(batch), dtype='bool')
+        keep[loaded] = index.add_unique(hashes, [batch[i][0] for i in loaded])
+        for (item, is_kept) in zip(batch, keep):
+            if is_kept:
+                yield item
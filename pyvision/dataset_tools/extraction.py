@@ -0,0 +1,377 @@
+"""
+Tools for extracting training crops from a large collection of images, using
+all the cores of a machine.
+
+The input is a manifest of records, one per image, giving the image path and the
+shapes (such as annotated object polygons) in that image. Each record is processed
+in a worker process, which loads the image, extracts the positive crops with
+crop_regions and, optionally, negative crops with crop_negative_regions, and
+encodes them. The main process writes the encoded crops into shards, either
+tar files or tile archives (see tile_archive.py), and appends a line per finished
+image to a JSON-lines index in the output directory.
+
+The index doubles as the checkpoint. A line is only written once the image's
+crops are in a shard, so if a run is interrupted, running it again with the same
+manifest skips the images that already appear in the index, except those that
+failed with an error, which are retried. Crops written for an
+image whose index line was never written are simply orphaned in their shard.
+
+Manifest
+--------
+A manifest file has one JSON object per line, like:
+{"image": "/data/img0001.jpg", "shapes": [[[10, 10], [50, 10], [50, 40]], ...], "labels": ["car", ...]}
+where each shape is a list of polygon (x, y) vertices, or a WKT string, and "labels"
+is optional. A manifest can also be given as a list of such dicts, or of
+(image_path, shapes) tuples, with the shapes as shapely geometries.
+
+Example
+-------
+stats = extract_crops("manifest.jsonl", "crops_out", crop_size=(64, 64), negatives_per_image=10)
+"""
+import concurrent.futures as cf
+import glob
+import io
+import json
+import os
+import tarfile
+import time
+
+import cv2
+import numpy as np
+import pyvision as pv3
+from pyvision.dataset_tools.tile_archive import TileArchiveWriter
+
+INDEX_FILE = "index.jsonl"
+SHARD_PATTERN = "shard-{:05d}"
+
+
+def read_manifest(filename):
+    """
+    Reads a JSON-lines manifest file, see the module documentation for the format.
+
+    Parameters
+    ----------
+    filename: str
+
+    Returns
+    -------
+    A list of manifest records (dicts)
+    """
+    records = []
+    with open(filename) as infile:
+        for line in infile:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def read_index(out_dir):
+    """
+    Reads the index of an extraction output directory.
+
+    Parameters
+    ----------
+    out_dir: str
+        The output directory given to extract_crops
+
+    Returns
+    -------
+    A list of index entries (dicts), one per finished image, in the order they were
+    written. An image that was retried after an error has a later entry superseding
+    the first. Each entry has the keys: record (the
+    position of the image in the manifest), image, crops and error. Each item of crops is
+    a dict with the keys: shard, name (of the crop within the shard), kind ("pos" or "neg"),
+    bounds (the integer crop bounds in the image), and label.
+    """
+    entries = []
+    index_file = os.path.join(out_dir, INDEX_FILE)
+    if not os.path.exists(index_file):
+        return entries
+    with open(index_file) as infile:
+        for line in infile:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue  # a partially-written line from an interrupted run
+    return entries
+
+
+def extract_crops(manifest, out_dir, crop_size=None, negatives_per_image=0, negative_size=None,
+                  fmt=".jpg", quality=None, num_workers=None, max_in_flight=None,
+                  shard_size=10000, shard_format="tar", seed=0, retry_errors=True):
+    """
+    Extracts crops from every image in a manifest into shards in the output
+    directory, resuming a previous run to the same directory if there is one.
+
+    Parameters
+    ----------
+    manifest: str or list
+        A manifest file name, or a list of manifest records, see the module documentation.
+    out_dir: str
+        The output directory, which will be created if required.
+    crop_size: tuple (w, h) or None
+        Passed to crop_regions. If None, the bounding box of each shape is cropped.
+    negatives_per_image: int
+        The number of negative (background) crops to extract from each image, default 0.
+    negative_size: tuple (w, h) or None
+        The size of the negative crops. Defaults to the crop_size.
+    fmt: str
+        The encoding format of the crops, such as ".jpg" or ".png"
+    quality: int or None
+        The encoding quality, see pyvision.image.encode_params
+    num_workers: int or None
+        The number of worker processes. None means one per cpu, and 0 means process
+        the images in this process, which can be handy for debugging.
+    max_in_flight: int or None
+        The maximum number of images submitted to the workers but not yet written, which
+        bounds the memory used for pending results. Defaults to 4 per worker.
+    shard_size: int
+        The number of crops written to each shard before starting the next.
+    shard_format: str
+        "tar" (default) writes each shard as a tar file of image files. "archive" writes
+        each shard as a TileArchive, see pyvision.dataset_tools.tile_archive, in which
+        case the name of each crop in the index is its position in the archive.
+    seed: int
+        Seeds the negative crop sampling. Each image's sampling depends only on the
+        seed and its position in the manifest, so results are reproducible regardless
+        of the number of workers or whether the run was resumed.
+    retry_errors: bool
+        If True (default), resuming a run processes the images that failed with an error
+        again, such as after a transient I/O failure. The new index entry of a retried
+        image supersedes its earlier entry. If False, failed images are skipped like
+        finished ones.
+
+    Returns
+    -------
+    A dictionary of statistics about this run: images (processed), skipped (already
+    done in a previous run), crops, errors, shards (the names of the shards written),
+    and elapsed_seconds.
+    """
+    if shard_format not in ("tar", "archive"):
+        raise ValueError("shard_format must be 'tar' or 'archive', not {}".format(shard_format))
+    if isinstance(manifest, str):
+        manifest = read_manifest(manifest)
+    if negatives_per_image > 0 and negative_size is None:
+        if crop_size is None:
+            raise ValueError("A negative_size is required when crop_size is None.")
+        negative_size = crop_size
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    if max_in_flight is None:
+        max_in_flight = 4 * max(num_workers, 1)
+
+    os.makedirs(out_dir, exist_ok=True)
+    latest = {entry["record"]: entry for entry in read_index(out_dir)}
+    done = set(idx for (idx, entry) in latest.items() if entry["error"] is None or not retry_errors)
+    todo = (idx for idx in range(len(manifest)) if idx not in done)
+    options = {"crop_size": crop_size, "negatives": negatives_per_image, "negative_size": negative_size,
+               "fmt": fmt, "quality": quality, "seed": seed}
+
+    # new shards are started for each run, so interrupted shards are never appended to
+    first_shard = len(glob.glob(os.path.join(out_dir, "shard-*.tar"))) + \
+        len(glob.glob(os.path.join(out_dir, "shard-*.idx")))
+    shards = _TarShards(out_dir, shard_size, first_shard) if shard_format == "tar" else \
+        _ArchiveShards(out_dir, shard_size, first_shard)
+    stats = {"images": 0, "skipped": len(done), "crops": 0, "errors": 0}
+    start_time = time.perf_counter()
+
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    with open(index_path, "a") as index_file:
+        if index_file.tell() > 0:
+            with open(index_path, "rb") as infile:
+                infile.seek(-1, os.SEEK_END)
+                if infile.read(1) != b"\n":
+                    index_file.write("\n")  # terminate a line partially written by an interrupted run
+        try:
+            if num_workers == 0:
+                for idx in todo:
+                    _write_result(_extract_record(idx, manifest[idx], options), manifest, shards, index_file, stats)
+            else:
+                with cf.ProcessPoolExecutor(max_workers=num_workers) as pool:
+                    pending = set()
+                    for idx in todo:
+                        if len(pending) >= max_in_flight:
+                            finished, pending = cf.wait(pending, return_when=cf.FIRST_COMPLETED)
+                            for future in finished:
+                                _write_result(future.result(), manifest, shards, index_file, stats)
+                        pending.add(pool.submit(_extract_record, idx, manifest[idx], options))
+                    for future in cf.as_completed(pending):
+                        _write_result(future.result(), manifest, shards, index_file, stats)
+        finally:
+            shards.close()
+
+    stats["shards"] = shards.names
+    stats["elapsed_seconds"] = time.perf_counter() - start_time
+    return stats
+
+
+class _Shards(object):
+    """
+    Writes named blobs into a numbered sequence of shards, starting a new
+    shard after every shard_size blobs.
+    """
+    ext = ""
+
+    def __init__(self, out_dir, shard_size, first_num=0):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.names = []  # the shards written so far
+        self._num = first_num
+        self._count = 0
+        self._shard = None
+
+    def write(self, name, data, label=None):
+        """
+        Returns
+        -------
+        A tuple (shard_name, key), where key locates the data within the shard.
+        """
+        if self._shard is None or self._count >= self.shard_size:
+            self.close()
+            shard_name = SHARD_PATTERN.format(self._num) + self.ext
+            self._shard = self._open(os.path.join(self.out_dir, shard_name))
+            self.names.append(shard_name)
+            self._num += 1
+            self._count = 0
+        key = self._write(name, data, label)
+        self._count += 1
+        return self.names[-1], key
+
+    def close(self):
+        if self._shard is not None:
+            self._shard.close()
+            self._shard = None
+
+
+class _TarShards(_Shards):
+    """
+    Shards written as tar files, the key of each blob is its member name.
+    """
+    ext = ".tar"
+
+    def _open(self, path):
+        return tarfile.open(path, mode="w")
+
+    def _write(self, name, data, label):
+        info = tarfile.TarInfo(name=name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._shard.addfile(info, io.BytesIO(data))
+        return name
+
+    def flush(self):
+        if self._shard is not None:
+            self._shard.fileobj.flush()
+
+
+class _ArchiveShards(_Shards):
+    """
+    Shards written as tile archives, the key of each blob is its position in the archive.
+    """
+    def _open(self, path):
+        return TileArchiveWriter(path)
+
+    def _write(self, name, data, label):
+        return self._shard.add_encoded(data, label)
+
+    def flush(self):
+        if self._shard is not None:
+            self._shard.flush()
+
+
+def _write_result(result, manifest, shards, index_file, stats):
+    """
+    Writes the crops of one finished record to the shards, then checkpoints
+    the record by appending its entry to the index.
+    """
+    idx, crops, error = result
+    entry = {"record": idx, "image": _record_image(manifest[idx]), "crops": [], "error": error}
+    for (name, data, meta) in crops:
+        # an image's crops may span two shards
+        (meta["shard"], meta["name"]) = shards.write(name, data, meta["label"])
+        entry["crops"].append(meta)
+    shards.flush()
+    index_file.write(json.dumps(entry) + "\n")
+    index_file.flush()
+    stats["images"] += 1
+    stats["crops"] += len(crops)
+    stats["errors"] += error is not None
+
+
+def _record_image(record):
+    return record.get("image") if isinstance(record, dict) else record[0]
+
+
+def _to_shape(shape):
+    """
+    Converts a manifest shape, which is either a shapely geometry, a WKT string,
+    or a list of polygon vertices, to a shapely geometry. Raises a ValueError
+    for a malformed shape.
+    """
+    import shapely.errors
+    import shapely.geometry as sg
+    import shapely.wkt
+    try:
+        if isinstance(shape, str):
+            return shapely.wkt.loads(shape)
+        if isinstance(shape, (list, tuple)):
+            return sg.Polygon(shape)
+    except (ValueError, TypeError, shapely.errors.ShapelyError) as e:
+        raise ValueError("Invalid shape {!r}: {}".format(shape, e))
+    return shape
+
+
+def _extract_record(idx, record, options):
+    """
+    Worker function, extracts and encodes the crops for one manifest record.
+
+    Returns
+    -------
+    A tuple (idx, crops, error), where crops is a list of (name, encoded_bytes, meta) and
+    error is None or a description of what went wrong. A record that fails part way may
+    still have some crops.
+    """
+    crops = []
+    try:
+        _extract_crops_into(crops, idx, record, options)
+    except (ValueError, IOError, KeyError, TypeError, cv2.error) as e:
+        return idx, crops, str(e) or type(e).__name__
+    return idx, crops, None
+
+
+def _extract_crops_into(crops, idx, record, options):
+    if isinstance(record, dict):
+        if "image" not in record:
+            raise ValueError("The manifest record has no 'image'.")
+        (image_file, shapes, labels) = (record["image"], record.get("shapes", []), record.get("labels"))
+    else:
+        (image_file, shapes, labels) = (record[0], record[1], None)
+    shapes = [_to_shape(s) for s in shapes]
+    if labels is None:
+        labels = [None] * len(shapes)
+    elif len(labels) != len(shapes):
+        raise ValueError("The manifest record has {} labels for {} shapes.".format(len(labels), len(shapes)))
+
+    try:
+        image = pv3.Image(image_file)
+    except AttributeError:
+        raise IOError("Unable to load {}".format(image_file))
+
+    ext = options["fmt"] if options["fmt"].startswith(".") else "." + options["fmt"]
+    positives = pv3.crop_regions(image, shapes, crop_size=options["crop_size"]) if shapes else []
+    for k, (crop, label) in enumerate(zip(positives, labels)):
+        if crop is not None:
+            crops.append(_encode_crop(crop, "{:08d}_pos_{:04d}{}".format(idx, k, ext), "pos", label, options))
+    if options["negatives"] > 0:
+        rng = np.random.default_rng([options["seed"], idx])
+        negatives = pv3.crop_negative_regions(image, shapes, options["negative_size"],
+                                              N=options["negatives"], rng=rng)
+        for k, crop in enumerate(negatives):
+            crops.append(_encode_crop(crop, "{:08d}_neg_{:04d}{}".format(idx, k, ext), "neg", None, options))
+
+
+def _encode_crop(crop, name, kind, label, options):
+    data = crop.encode(options["fmt"], quality=options["quality"], annotated=False)
+    meta = {"kind": kind, "bounds": [int(v) for v in crop.metadata["crop_bounds"]], "label": label}
+    return name, data, meta
@@ -0,0 +1,313 @@
+"""
+A packed archive format for large collections of small image tiles (crops).
+
+Storing each tile as its own file makes listing and reading millions of tiles
+dominated by file system overhead. A tile archive instead appends the encoded
+tiles to a single data file, and keeps a fixed-size record per tile in an index
+file, so any tile can be found in O(1) without reading the others.
+
+An archive named "tiles" consists of three files:
+tiles.dat           The encoded tiles (e.g. jpeg files), concatenated
+tiles.idx           A raw array of INDEX_DTYPE records, one per tile, which can be
+                    memory-mapped with np.memmap("tiles.idx", dtype=INDEX_DTYPE)
+tiles.labels.json   The list of distinct label strings. Each index record refers to
+                    its tile's label by position in this list, or -1 for no label.
+
+Example
+-------
+with TileArchiveWriter("tiles") as writer:
+    for (tile_id, tile, label) in pv3.tiles_from_dir("crops"):
+        writer.add(tile, label)
+
+archive = TileArchive("tiles")
+ts = pv3.TileSelector(archive.tiles(), chunk_size=48, layout=(6, 8))
+"""
+# pylint: disable=E1101
+import json
+import mmap
+import os
+
+import cv2
+import numpy as np
+import pyvision as pv3
+from pyvision.image import encode_params
+from pyvision.parallel import prefetch_map
+
+# The record stored in the .idx file for each tile
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("label", "<i4")])
+
+
+def _archive_files(path):
+    """
+    Returns the (data, index, labels) file names for an archive path,
+    which may be given with or without the .dat extension.
+    """
+    if path.endswith(".dat"):
+        path = path[:-4]
+    return path + ".dat", path + ".idx", path + ".labels.json"
+
+
+class TileArchiveWriter(object):
+    """
+    Appends tiles to a tile archive.
+    """
+
+    def __init__(self, path, fmt=".jpg", quality=None, mode="w"):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        path: str
+            The archive path, without an extension. The .dat, .idx, and .labels.json
+            files will be created from it.
+        fmt: str
+            The encoding format used for tiles added as images, such as ".jpg" or ".png".
+        quality: int or None
+            The encoding quality, see pyvision.image.encode_params
+        mode: str
+            "w" (default) to create a new archive, replacing any existing one, or
+            "a" to append to an existing archive.
+        """
+        if mode not in ("w", "a"):
+            raise ValueError("mode must be 'w' or 'a', not {}".format(mode))
+        self.path = path
+        self.fmt = fmt
+        self.quality = quality
+        (dat_file, idx_file, self._labels_file) = _archive_files(path)
+
+        self._labels = []
+        if mode == "a" and os.path.exists(self._labels_file):
+            with open(self._labels_file) as infile:
+                self._labels = json.load(infile)
+        self._label_ids = {lbl: i for (i, lbl) in enumerate(self._labels)}
+
+        self._dat = open(dat_file, mode + "b")
+        self._idx = open(idx_file, mode + "b")
+        self._offset = self._dat.seek(0, os.SEEK_END)
+        self._count = self._idx.seek(0, os.SEEK_END) // INDEX_DTYPE.itemsize
+        self._record = np.zeros(1, dtype=INDEX_DTYPE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, tile, label=None):
+        """
+        Encodes and appends a tile to the archive.
+
+        Parameters
+        ----------
+        tile: pyvision Image or cv2 ndarray
+        label: str or None
+
+        Returns
+        -------
+        The index of the tile in the archive
+        """
+        if isinstance(tile, pv3.Image):
+            data = tile.encode(self.fmt, quality=self.quality, annotated=False)
+        else:
+            ext, params = encode_params(self.fmt, self.quality)
+            ok, buf = cv2.imencode(ext, tile, params)
+            if not ok:
+                raise IOError("Unable to encode tile as {}".format(ext))
+            data = buf.tobytes()
+        return self.add_encoded(data, label)
+
+    def add_encoded(self, data, label=None):
+        """
+        Appends an already-encoded tile (the bytes of an image file) to the archive.
+
+        Parameters
+        ----------
+        data: bytes
+        label: str or None
+
+        Returns
+        -------
+        The index of the tile in the archive
+        """
+        if label is None:
+            label_id = -1
+        else:
+            label_id = self._label_ids.get(label)
+            if label_id is None:
+                label_id = len(self._labels)
+                self._labels.append(label)
+                self._label_ids[label] = label_id
+                # before any index record refers to the new label
+                self._write_labels()
+
+        self._dat.write(data)
+        self._record[0] = (self._offset, len(data), label_id)
+        self._idx.write(self._record.tobytes())
+        self._offset += len(data)
+        self._count += 1
+        return self._count - 1
+
+    def flush(self):
+        """
+        Flushes the tiles added so far to disk, so they can be read by a TileArchive.
+        """
+        self._dat.flush()
+        self._idx.flush()
+        self._write_labels()
+
+    def _write_labels(self):
+        # replaced atomically, so that readers never see a partial file
+        tmp_file = self._labels_file + ".tmp"
+        with open(tmp_file, "w") as outfile:
+            json.dump(self._labels, outfile)
+        os.replace(tmp_file, self._labels_file)
+
+    def close(self):
+        if self._dat.closed:
+            return
+        self.flush()
+        self._dat.close()
+        self._idx.close()
+
+
+class TileArchive(object):
+    """
+    Random access reader of a tile archive. The data and index files are memory-mapped,
+    so opening even a very large archive is instantaneous, and tiles are only read
+    from disk when accessed.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        path: str
+            The archive path, as given to the TileArchiveWriter.
+        """
+        self.path = path
+        (dat_file, idx_file, labels_file) = _archive_files(path)
+        with open(labels_file) as infile:
+            self.labels = json.load(infile)
+
+        # ignore any partial record at the end, left by an interrupted writer
+        count = os.path.getsize(idx_file) // INDEX_DTYPE.itemsize
+        if count > 0:
+            self.index = np.memmap(idx_file, dtype=INDEX_DTYPE, mode="r", shape=(count,))
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+
+        self._dat_file = open(dat_file, "rb")
+        if os.path.getsize(dat_file) > 0:
+            self._data = mmap.mmap(self._dat_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, idx):
+        """
+        Returns the tile at position idx as a pyvision image.
+        """
+        return pv3.Image(self.decode(idx))
+
+    def get_bytes(self, idx):
+        """
+        Returns the encoded tile at position idx, the bytes of an image file.
+        """
+        rec = self.index[idx]
+        offset = int(rec["offset"])
+        return self._data[offset:offset + int(rec["length"])]
+
+    def get_label(self, idx):
+        """
+        Returns the label string of the tile at position idx, or None.
+        """
+        label_id = int(self.index[idx]["label"])
+        return None if label_id < 0 else self.labels[label_id]
+
+    def decode(self, idx, flags=cv2.IMREAD_UNCHANGED):
+        """
+        Returns the tile at position idx as a cv2 ndarray.
+        """
+        mat = cv2.imdecode(np.frombuffer(self.get_bytes(idx), dtype='uint8'), flags)
+        if mat is None:
+            raise IOError("Unable to decode tile {} of {}".format(idx, self.path))
+        return mat
+
+    def tiles(self, start=0, stop=None, num_workers=4, read_ahead=64):
+        """
+        A tile generator over the archive, for use with the TileSelector and the
+        other tools that consume tile generators. Tiles are decoded by a pool of
+        threads, ahead of the consumer.
+
+        Parameters
+        ----------
+        start: int
+            The position of the first tile to yield
+        stop: int or None
+            One past the position of the last tile to yield, None meaning the end
+            of the archive.
+        num_workers: int
+            The number of decoding threads. cv2 releases the GIL while decoding, so
+            this scales well.
+        read_ahead: int
+            The maximum number of tiles decoded ahead of the consumer
+
+        Returns
+        -------
+        A generator that yields tuples of the form (id_str, tile_image, label_str), where
+        id_str is the position of the tile in the archive. tile_image is None for
+        any tile that could not be decoded.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        decoded = prefetch_map(self._load_tile, range(start, stop), num_workers=num_workers,
+                                read_ahead=read_ahead)
+        for (idx, tile) in decoded:
+            yield (str(idx), tile, self.get_label(idx))
+
+    def _load_tile(self, idx):
+        try:
+            return pv3.Image(self.decode(idx))
+        except IOError:
+            print("Warning: Unable to decode tile {} of {}".format(idx, self.path))
+            return None
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._dat_file.close()
+        self.index = None
+
+
+def tiles_from_archive(path, start=0, stop=None, num_workers=4):
+    """
+    Returns a tile generator over a tile archive, see TileArchive.tiles(...)
+
+    Parameters
+    ----------
+    path: str
+        The archive path, as given to the TileArchiveWriter.
+    start: int
+    stop: int or None
+    num_workers: int
+
+    Returns
+    -------
+    A tile generator, yielding tuples like: (str(idx), tile_image, label_str)
+    """
+    with TileArchive(path) as archive:
+        for item in archive.tiles(start=start, stop=stop, num_workers=num_workers):
+            yield item
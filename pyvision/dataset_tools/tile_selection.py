@@ -9,27 +9,83 @@ image montage object and cv2's high gui interface.
 author: Stephen O'Hara
 created: April 15, 2016
 """
+import concurrent.futures as cf
 import glob
+import itertools
+import json
 import os
 import pyvision as pv3
 import cv2
 import numpy as np
+from pyvision.parallel import prefetch_map
 
 
 class TileSelector(object):
     """
     A tile selector instance provides a user interface for selecting some tiles
     out of a larger set, using an image montage display.
+
+    While a page of tiles is on screen, the next page (loading its tiles, and
+    building its montage) is prepared on a background thread, so the user
+    doesn't wait between pages. Selections can also be saved to a file as each
+    page is completed, so that a long session interrupted part way through can
+    be resumed.
+
+    The background thread is stopped once the last page is processed. When calling
+    process_chunk() directly, and possibly stopping early, use the selector as a
+    context manager or call close().
     """
-    def __init__(self, tile_generator, chunk_size=48, layout=(6, 8), tile_size=None):
+    def __init__(self, tile_generator, chunk_size=48, layout=(6, 8), tile_size=None,
+                 selection_file=None, prefetch=True):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        tile_generator: generator
+            Yields (tile_id, tile_image, label) tuples, such as from tiles_from_dir(...)
+        chunk_size: int
+            The number of tiles per page
+        layout: tuple (rows, cols)
+            The montage layout of each page
+        tile_size: tuple (w, h) or None
+            The size of the montage thumbnails. If None, the size of the first
+            tile of each page is used.
+        selection_file: str or None
+            If given, then the ids of the tiles shown and selected on each page are
+            appended to this file, as a line of JSON, as each page is completed. If the
+            file already exists, the session is resumed: the selections are reloaded,
+            and the tiles from the completed pages are skipped. The same tile generator
+            must be used for the resumed session.
+        prefetch: boolean
+            If True (default), the next page is prepared in the background while the
+            current page is shown.
+        """
         self.tile_gen = tile_generator
         self.chunk_size = chunk_size
         self.layout = layout
         self.tile_size = tile_size
+        self.selection_file = selection_file
         self.selected = []
         self.done = False
         self.err_image = self._make_err_image()
 
+        self._pages_done = 0
+        self._skip = 0  # the number of tiles in the completed pages of a resumed session
+        if selection_file is not None and os.path.exists(selection_file):
+            with open(selection_file) as infile:
+                for line in infile:
+                    try:
+                        page = json.loads(line)
+                    except ValueError:
+                        continue  # a partially-written line
+                    self.selected += page["selected"]
+                    self._skip += len(page["ids"])
+                    self._pages_done = max(self._pages_done, page["page"])
+
+        self._pool = cf.ThreadPoolExecutor(max_workers=1) if prefetch else None
+        self._next_page = None  # the future of the page being prepared, if any
+
     @staticmethod
     def _make_err_image():
         """
@@ -43,7 +99,19 @@ class TileSelector(object):
         red_img = cv2.resize(red_img, (100, 100))
         return pv3.Image(red_img)
 
-    def process_chunk(self, page_num=1):
+    def _prepare_page(self):
+        """
+        Pulls the next chunk of tiles from the tile generator and builds their montage.
+
+        Returns
+        -------
+        A tuple (montage, ids, is_last), or None if there are no more tiles.
+        """
+        if self._skip > 0:
+            for _ in itertools.islice(self.tile_gen, self._skip):
+                pass
+            self._skip = 0
+
         tiles = []
         labels = []
         ids = []
@@ -63,13 +131,7 @@ class TileSelector(object):
 
         # if the generator happens to be empty
         if count == 0:
-            return
-
-        # if we got here yet count < chunk_size, then
-        # the generator must be out of tiles, so we have the
-        # final/partial chunk to process
-        if count < self.chunk_size:
-            self.done = True
+            return None
 
         if self.tile_size is None:
             sz = max(tiles[0].size)
@@ -77,9 +139,34 @@ class TileSelector(object):
         else:
             tile_size = self.tile_size
 
-        # build the montage and display it
+        # build the montage, which draws the page
         imnt = pv3.ImageMontage(tiles, layout=self.layout, tile_size=tile_size,
                                 labels='index', highlight_selected=True)
+
+        # if count < chunk_size, then the generator must be
+        # out of tiles, so this is the final/partial chunk
+        return imnt, ids, count < self.chunk_size
+
+    def process_chunk(self, page_num=1):
+        if self._next_page is not None:
+            page = self._next_page.result()
+            self._next_page = None
+        else:
+            page = self._prepare_page()
+
+        if page is None:
+            self.done = True
+            self.close()
+            return
+        (imnt, ids, is_last) = page
+        if is_last:
+            self.done = True
+            self.close()
+        elif self._pool is not None:
+            # prepare the next page while the user works on this one
+            self._next_page = self._pool.submit(self._prepare_page)
+
+        # display the montage
         win_title = "Tile selector: Page {}".format(page_num)
         imnt.show(window_title=win_title)
         cv2.destroyWindow(win_title)
@@ -87,12 +174,48 @@ class TileSelector(object):
         # add the selected from this chunk to the whole
         selected_ids = [ids[x] for x in imnt.get_highlighted()]
         self.selected += selected_ids
+        self._pages_done = page_num
+
+        if self.selection_file is not None:
+            with open(self.selection_file, "a") as outfile:
+                outfile.write(json.dumps({"page": page_num, "ids": ids, "selected": selected_ids}) + "\n")
 
     def process_all(self):
-        page = 1
-        while not self.done:
-            self.process_chunk(page_num=page)
-            page += 1
+        page = self._pages_done + 1
+        try:
+            while not self.done:
+                self.process_chunk(page_num=page)
+                page += 1
+        finally:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Stops the background page preparation, if any.
+        """
+        if self._pool is not None:
+            if self._next_page is not None:
+                self._next_page.cancel()
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self._next_page = None
+
+
+def _load_tile(filen):
+    """
+    Loads an image tile from disk, returning None (with a warning) if it can't be read.
+    """
+    try:
+        return pv3.Image(filen)
+    except AttributeError:
+        print("Warning: Unable to load {}".format(filen))
+        return None
 
 
 def tiles_from_files(filenames, labels=None):
@@ -119,11 +242,42 @@ def tiles_from_files(filenames, labels=None):
 
     for idx, filen in enumerate(filenames):
         lbl = None if labels is None else labels[idx]
-        try:
-            tile = pv3.Image(filen)
-        except AttributeError:
-            print("Warning: Unable to load {}".format(filen))
-            tile = None
+        tile = _load_tile(filen)
+        yield (str(idx), tile, lbl)
+
+
+def tiles_from_files_parallel(filenames, labels=None, num_workers=8, read_ahead=64, ordered=True):
+    """
+    The same as tiles_from_files, except that the tiles are loaded by a pool
+    of threads, ahead of the consumer. This hides the latency of reading and
+    decoding, which is especially helpful with network-mounted data.
+
+    Parameters
+    ----------
+    filenames: list of strings
+        The full paths of the image crops to load
+    labels: list of strings
+        Optional labels to associate with each image tile, see tiles_from_files
+    num_workers: int
+        The number of loading threads
+    read_ahead: int
+        The maximum number of tiles loaded ahead of the consumer
+    ordered: boolean
+        If True (default), the tiles are yielded in the order of the filenames.
+        Otherwise, they are yielded in the order they finish loading.
+
+    Returns
+    -------
+    A tile generator, yielding tuples like: (str(idx), tile_image, label_str), where idx
+    is the position of the file in filenames
+    """
+    if labels is not None:
+        assert len(filenames) == len(labels)
+
+    loaded = prefetch_map(lambda item: _load_tile(item[1]), enumerate(filenames),
+                           num_workers=num_workers, read_ahead=read_ahead, ordered=ordered)
+    for ((idx, _), tile) in loaded:
+        lbl = None if labels is None else labels[idx]
         yield (str(idx), tile, lbl)
 
 
@@ -150,15 +304,41 @@ def tiles_from_dir(dirname, pattern="*.jpg"):
     idx = 0
     for filen in filenames:
         tile_id = os.path.basename(filen)
-        try:
-            tile = pv3.Image(filen)
-        except AttributeError:
-            print("Warning: Unable to load {}".format(filen))
-            tile = None
+        tile = _load_tile(filen)
         yield (tile_id, tile, str(idx))
         idx += 1
 
 
+def tiles_from_dir_parallel(dirname, pattern="*.jpg", num_workers=8, read_ahead=64, ordered=True):
+    """
+    The same as tiles_from_dir, except that the tiles are loaded by a pool
+    of threads, ahead of the consumer. See tiles_from_files_parallel.
+
+    Parameters
+    ----------
+    dirname: str
+        Directory holding the images to yield
+    pattern
+        Match string, defaults to "*.jpg" for determining which files to include.
+    num_workers: int
+        The number of loading threads
+    read_ahead: int
+        The maximum number of tiles loaded ahead of the consumer
+    ordered: boolean
+        If True (default), the tiles are yielded in the (arbitrary) order the files
+        are listed. Otherwise, they are yielded in the order they finish loading.
+
+    Returns
+    -------
+    A tile generator, yielding tuples like: (base_file_name, tile_image, str(idx))
+    """
+    filenames = glob.iglob(os.path.join(dirname, pattern))
+    loaded = prefetch_map(_load_tile, filenames, num_workers=num_workers,
+                           read_ahead=read_ahead, ordered=ordered)
+    for idx, (filen, tile) in enumerate(loaded):
+        yield (os.path.basename(filen), tile, str(idx))
+
+
 def tiles_from_vid(pv_video, start_frame=0, end_frame=None):
     """
     A tile generator from a pyvision video object
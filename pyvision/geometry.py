@@ -3,12 +3,18 @@ Some simple geometry primitives (Point, Rect) that basically wrap
 shapely geometries, but are used for convenience. For example,
 shapely.geometry.box takes (minx, miny, maxx, maxy) coordinates, but
 it's often much more convenient to specify a rectangle as (x, y, width, height)...
+
+When working with many rectangles at once, such as thousands of detections
+per frame, use a RectArray instead, which stores N rectangles in a single
+(N, 4) numpy array and provides vectorized operations on them. Conversion
+to/from shapely is only done when required.
 """
 
-import shapely.geometry as sg
-from shapely.geometry.point import Point as sgPoint
 import numpy as np
 
+# Note: shapely is imported within the functions that need it, so that
+# it is only loaded when shapes are actually used.
+
 
 def Point(x, y):
     """
@@ -23,6 +29,7 @@ def Point(x, y):
     -------
     shapely.geometry.point.Point object
     """
+    from shapely.geometry.point import Point as sgPoint
     return sgPoint(x, y)
 
 
@@ -44,6 +51,7 @@ def Rect(x, y, w, h):
     -------
     shapely.geometry.Polygon object representing the rectangle
     """
+    import shapely.geometry as sg
     return sg.box(x, y, x+w-1, h+y-1)
 
 
@@ -74,15 +82,19 @@ def in_bounds(rect, image):
 
     Parameters
     ----------
-    rect: shapely rectangle with integer coordinates, as per this module's Rect() output.
+    rect: shapely rectangle with integer coordinates, as per this module's Rect() output,
+        or a RectArray.
     image: pyvision image
 
     Returns
     -------
-    Boolean, true if no part of rect is outside the bounds of image.
+    Boolean, true if no part of rect is outside the bounds of image. If rect is a
+    RectArray, then a boolean array with one value per rectangle is returned.
     """
-    image_bounds = Rect(0, 0, image.width, image.height)
-    return image_bounds.contains(rect)
+    if isinstance(rect, RectArray):
+        return rect.in_bounds(image.size)
+    (minx, miny, maxx, maxy) = rect.bounds
+    return minx >= 0 and miny >= 0 and maxx <= image.width - 1 and maxy <= image.height - 1
 
 
 def integer_coords_array(shape):
@@ -111,10 +123,267 @@ def integer_bounds(shape):
 
     Parameters
     ----------
-    shape: a shapely geometry supporting the .bounds attribute
+    shape: a shapely geometry supporting the .bounds attribute, or a RectArray
 
     Returns
     -------
-    (minx, miny, maxx, maxy) as integer values.
+    (minx, miny, maxx, maxy) as integer values. If shape is a RectArray, then an (N, 4)
+    integer ndarray is returned instead.
     """
+    if isinstance(shape, RectArray):
+        return shape.integer_bounds()
     return tuple(np.array(shape.bounds, dtype='int'))
+
+
+class RectArray(object):
+    """
+    An array of N axis-aligned rectangles, stored as an (N, 4) ndarray of
+    (minx, miny, maxx, maxy) bounds. The same convention as Rect(...) is used,
+    so the max coordinates are inclusive: a rectangle of width w starting at x
+    spans the pixels x..x+w-1, and its area is w*h pixels.
+
+    Indexing a RectArray with an integer returns a shapely rectangle, and iterating
+    over it yields shapely rectangles, so it can be used by code that expects a list of
+    rects. Indexing with a slice, or an index or boolean array, returns a RectArray.
+    """
+
+    def __init__(self, bounds):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        bounds: array-like (N, 4)
+            The (minx, miny, maxx, maxy) of each rectangle. A single rectangle
+            may be given as a 4-tuple.
+        """
+        bounds = np.array(bounds, dtype='float64')
+        if bounds.size == 0:
+            bounds = bounds.reshape((0, 4))
+        elif bounds.ndim == 1:
+            bounds = bounds.reshape((1, -1))
+        if bounds.ndim != 2 or bounds.shape[1] != 4:
+            raise ValueError("RectArray bounds must have shape (N, 4), not {}".format(bounds.shape))
+        self.bounds = bounds
+
+    @classmethod
+    def from_xywh(cls, xywh):
+        """
+        Parameters
+        ----------
+        xywh: array-like (N, 4)
+            The (x, y, w, h) of each rectangle, like the inputs to Rect(...)
+            and the output of cv2.boundingRect(...)
+        """
+        xywh = np.array(xywh, dtype='float64').reshape((-1, 4))
+        bounds = xywh.copy()
+        bounds[:, 2:] += xywh[:, 0:2] - 1
+        return cls(bounds)
+
+    @classmethod
+    def from_centers(cls, centers, sizes):
+        """
+        Parameters
+        ----------
+        centers: array-like (N, 2)
+            The (cx, cy) center of each rectangle
+        sizes: array-like (N, 2), or a single (w, h) tuple
+            The (w, h) of each rectangle, positioned as per CenteredRect(...)
+        """
+        centers = np.array(centers, dtype='float64').reshape((-1, 2))
+        sizes = np.broadcast_to(np.array(sizes, dtype='float64'), centers.shape)
+        xy = centers - sizes // 2
+        return cls.from_xywh(np.hstack((xy, sizes)))
+
+    @classmethod
+    def from_shapes(cls, shapes):
+        """
+        Parameters
+        ----------
+        shapes: list of shapely geometries
+            The bounding box of each shape will be used.
+        """
+        return cls([shp.bounds for shp in shapes])
+
+    def __len__(self):
+        return self.bounds.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._to_shape(self.bounds[key])
+        return RectArray(self.bounds[key])
+
+    def __iter__(self):
+        for b in self.bounds:
+            yield self._to_shape(b)
+
+    def __repr__(self):
+        return "RectArray({})".format(self.bounds.tolist())
+
+    @staticmethod
+    def _to_shape(b):
+        import shapely.geometry as sg
+        return sg.box(*b)
+
+    def to_shapes(self):
+        """
+        Returns
+        -------
+        A list of shapely rectangles (polygons), one per rectangle in this array.
+        """
+        return list(self)
+
+    @property
+    def x(self):
+        return self.bounds[:, 0]
+
+    @property
+    def y(self):
+        return self.bounds[:, 1]
+
+    @property
+    def widths(self):
+        return self.bounds[:, 2] - self.bounds[:, 0] + 1
+
+    @property
+    def heights(self):
+        return self.bounds[:, 3] - self.bounds[:, 1] + 1
+
+    @property
+    def xywh(self):
+        """
+        An (N, 4) ndarray of the (x, y, w, h) of each rectangle
+        """
+        return np.column_stack((self.x, self.y, self.widths, self.heights))
+
+    @property
+    def centers(self):
+        """
+        An (N, 2) ndarray of the (cx, cy) center of each rectangle
+        """
+        return (self.bounds[:, 0:2] + self.bounds[:, 2:4]) / 2.0
+
+    def is_empty(self):
+        """
+        Returns
+        -------
+        A boolean array, True for rectangles with no area, such as the result
+        of intersecting rectangles that don't overlap.
+        """
+        return (self.widths <= 0) | (self.heights <= 0)
+
+    def area(self):
+        """
+        Returns
+        -------
+        An array of the area, in pixels, of each rectangle.
+        """
+        return np.maximum(self.widths, 0) * np.maximum(self.heights, 0)
+
+    def integer_bounds(self):
+        """
+        Returns
+        -------
+        The bounds as an (N, 4) integer ndarray, truncated in the same way as
+        integer_bounds(...) does for a single shape.
+        """
+        return self.bounds.astype('int')
+
+    def in_bounds(self, size):
+        """
+        Parameters
+        ----------
+        size: tuple (w, h)
+            The image size
+
+        Returns
+        -------
+        A boolean array, True for each rectangle that is entirely within the image.
+        """
+        (w, h) = size
+        b = self.bounds
+        return (b[:, 0] >= 0) & (b[:, 1] >= 0) & (b[:, 2] <= w - 1) & (b[:, 3] <= h - 1)
+
+    def clip(self, size):
+        """
+        Parameters
+        ----------
+        size: tuple (w, h)
+            The image size
+
+        Returns
+        -------
+        A new RectArray with each rectangle clipped to the bounds of the image.
+        Rectangles entirely outside the image will be empty, see is_empty().
+        """
+        (w, h) = size
+        b = self.bounds.copy()
+        b[:, 0:2] = np.maximum(b[:, 0:2], 0)
+        b[:, 2] = np.minimum(b[:, 2], w - 1)
+        b[:, 3] = np.minimum(b[:, 3], h - 1)
+        return RectArray(b)
+
+    def intersection(self, other):
+        """
+        Element-wise intersection of the rectangles in this array with those
+        in other, which must be the same length (or a single rectangle).
+
+        Returns
+        -------
+        A RectArray of the overlapping regions. Pairs that don't overlap
+        yield empty rectangles, see is_empty().
+        """
+        o = _as_rect_array(other).bounds
+        b = np.hstack((np.maximum(self.bounds[:, 0:2], o[:, 0:2]),
+                       np.minimum(self.bounds[:, 2:4], o[:, 2:4])))
+        return RectArray(b)
+
+    def union(self, other):
+        """
+        Element-wise union of the rectangles in this array with those in other,
+        which must be the same length (or a single rectangle).
+
+        Returns
+        -------
+        A RectArray of the smallest rectangles enclosing each pair.
+        """
+        o = _as_rect_array(other).bounds
+        b = np.hstack((np.minimum(self.bounds[:, 0:2], o[:, 0:2]),
+                       np.maximum(self.bounds[:, 2:4], o[:, 2:4])))
+        return RectArray(b)
+
+    def iou(self, other):
+        """
+        Pairwise intersection-over-union between the rectangles in this
+        array and those in other.
+
+        Parameters
+        ----------
+        other: RectArray (M rectangles), or a list of shapely shapes
+
+        Returns
+        -------
+        An (N, M) array of IoU values in the range [0, 1].
+        """
+        a = self.bounds[:, np.newaxis, :]
+        b = _as_rect_array(other).bounds[np.newaxis, :, :]
+        iw = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]) + 1
+        ih = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]) + 1
+        inter = np.maximum(iw, 0) * np.maximum(ih, 0)
+        union = self.area()[:, np.newaxis] + _as_rect_array(other).area()[np.newaxis, :] - inter
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(union > 0, inter / union, 0.0)
+
+
+def _as_rect_array(rects):
+    """
+    Converts a RectArray, an (N, 4) array of bounds, a single shapely shape, or a list of
+    shapely shapes to a RectArray.
+    """
+    if isinstance(rects, RectArray):
+        return rects
+    if isinstance(rects, np.ndarray):
+        return RectArray(rects)
+    if hasattr(rects, "bounds"):
+        return RectArray(rects.bounds)
+    return RectArray.from_shapes(rects)
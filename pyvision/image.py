@@ -14,44 +14,144 @@ onto the image array itself.
 # with the cv2 module.
 # pylint: disable=E1101
 
+import pickle
+
 import cv2
 import numpy as np
 # import numpy.ma as ma  # masked arrays, used for annotations
 
+# Note: matplotlib (optional, used by imshow) and shapely (used for annotating
+# shapes) are imported where required, so they don't slow down importing
+# this module.
 
-try:
-    import matplotlib.pyplot as plot
-except ImportError:
-    print("Error importing matplotlib.")
-    print("Matplotlib integration will not work")
+from .pv_exceptions import OutOfBoundsError
+from .geometry import in_bounds, integer_bounds, RectArray, _as_rect_array
 
-try:
-    import shapely.geometry as sg
-except ImportError:
-    print("Error importing shapely.")
-    print("Shapely is required for annotating shapes (polygons) on images.")
-    print("Shapely is also used to determine if a crop is in bounds, etc.")
+# The maximum number of encoded results kept by each image, see Image.encode
+ENCODE_CACHE_SIZE = 4
 
-from .pv_exceptions import OutOfBoundsError
-from .geometry import in_bounds, integer_bounds
+# The supported ways of filling the out-of-bounds part of a crop, see Image.crop_many
+PAD_MODES = ("constant", "edge", "reflect")
 
 
 class ImageAnnotationError(ValueError):
     pass
 
 
+def encode_params(fmt=".jpg", quality=None):
+    """
+    Normalizes an image format string and builds the parameter list
+    expected by cv2.imencode / cv2.imwrite for that format.
+
+    Parameters
+    ----------
+    fmt: str
+        The image format as a file extension, with or without the leading
+        dot, such as ".jpg", "png", or ".webp".
+    quality: int or None
+        For jpeg and webp, the encoding quality (0-100). For png, this is
+        the compression level (0-9). None means use the opencv default.
+
+    Returns
+    -------
+    A tuple (ext, params) where ext is the normalized extension (like ".jpg")
+    and params is the list of cv2 encoding flags to use.
+    """
+    ext = fmt.lower() if fmt.startswith(".") else "." + fmt.lower()
+    params = []
+    if quality is not None:
+        if ext in (".jpg", ".jpeg"):
+            params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        elif ext == ".png":
+            params = [cv2.IMWRITE_PNG_COMPRESSION, int(quality)]
+        elif ext == ".webp":
+            params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    return ext, params
+
+
+def _border_indices(start, stop, n, pad_mode):
+    """
+    Maps the pixel coordinates start..stop-1 along an axis of length n to valid
+    coordinates, per the pad_mode. For "constant", out-of-range coordinates are
+    clamped, and must be overwritten by the caller.
+    """
+    idx = np.arange(start, stop)
+    if pad_mode == "reflect" and n > 1:
+        # reflect about the edge pixels, as with cv2.BORDER_REFLECT_101
+        period = 2 * (n - 1)
+        idx = np.mod(idx, period)
+        return np.where(idx < n, idx, period - idx)
+    return np.clip(idx, 0, n - 1)
+
+
+def _pickle_array(arr, protocol):
+    """
+    Prepares an ndarray for pickling. With pickle protocol 5 or newer, the array
+    contents are wrapped in a PickleBuffer so that they can be transferred
+    out-of-band (without copying) when the pickler is given a buffer_callback.
+    """
+    if protocol >= 5:
+        arr = np.ascontiguousarray(arr)
+        return pickle.PickleBuffer(arr), arr.shape, arr.dtype.str
+    return arr
+
+
+def _unpickle_array(obj):
+    """
+    Inverse of _pickle_array. Arrays restored from out-of-band buffers view those
+    buffers directly, and so will be read-only if the buffers are.
+    """
+    if isinstance(obj, tuple):
+        (buf, shape, dtype) = obj
+        return np.frombuffer(buf, dtype=dtype).reshape(shape)
+    return obj
+
+
+def _rebuild_image(cls, desc, data, annotation_data, transparency, metadata):
+    """
+    Reconstructs a pickled pyvision image, see Image.__reduce_ex__. The image data
+    views the out-of-band buffer it was sent in, if that buffer is writable, and is
+    otherwise copied, so that the image can be modified.
+    """
+    img = cls.__new__(cls)
+    data = _unpickle_array(data)
+    if not data.flags.writeable:
+        # such as a view of a read-only out-of-band buffer (bytes); images are drawn on in place
+        data = data.copy()
+    Image.__init__(img, data, desc=desc)
+    img.annotation_transparency = transparency
+    if annotation_data is None:
+        # the annotation layer was empty (entirely transparent)
+        if not img._default_transparency():
+            img.annotation_data[:] = transparency
+    else:
+        annotation_data = _unpickle_array(annotation_data)
+        if not annotation_data.flags.writeable:
+            annotation_data = annotation_data.copy()
+        img.annotation_data = annotation_data
+    img._metadata = metadata
+    return img
+
+
 class Image(object):
     """
     A pyvision3 Image object contains the image data, an
     annotations layer, and many convenient methods.
     Supports 1 channel and 3 channel images.
+
+    Images are kept compact, as applications may hold hundreds of thousands
+    of small crops at once. Attributes are stored in __slots__, the size
+    attributes are derived from the data, and the annotations layer and
+    metadata dictionary are only allocated when first used.
     """
+    __slots__ = ("desc", "_data", "_annotation_data", "annotation_transparency", "_metadata",
+                 "_version", "_encode_cache", "_encode_cache_version", "__weakref__")
 
     def __init__(self, source, *args, desc="Pyvision Image", **kwargs):
         """
         The constructor wraps a cv2.imread(...) function,
-        passing in the args and kwargs appropriately, and
-        then allocating data for the annotations layer.
+        passing in the args and kwargs appropriately. The
+        annotations layer is allocated when first drawn upon.
 
         Parameters
         ----------
@@ -86,6 +186,20 @@ class Image(object):
         #Wrapping of a numpy/cv2 ndarray
         img4 = pv3.Image( np.zeros( (480,640), dtype='uint8' ) )
         """
+        # the version is incremented whenever the pixels or annotations change,
+        # and is used to invalidate cached results derived from them.
+        self._version = 0
+        self._encode_cache = None
+        self._encode_cache_version = 0
+
+        # Annotation data is a separate BGR image array, created on first use.
+        self._annotation_data = None
+        self.annotation_transparency = (1, 1, 1)
+
+        # metadata dictionary can be used to pass arbitrary info with the image,
+        # also created on first use.
+        self._metadata = None
+
         self.desc = desc
         if isinstance(source, np.ndarray):
             self.data = source
@@ -97,16 +211,10 @@ class Image(object):
             x = np.fromstring(buf, dtype='uint8')
             self.data = cv2.imdecode(x, cv2.IMREAD_UNCHANGED)
 
-        self.height, self.width = self.data.shape[0:2]
-        self.size = (self.width, self.height)
-        self.nchannels = self.data.shape[2] if len(self.data.shape) == 3 else 1
-
-        # Annotation data is a separate BGR image array.
-        self.annotation_data = np.zeros((self.height, self.width, 3), dtype="uint8")+1
-        self.annotation_transparency = (1, 1, 1)
-
-        # metadata dictionary can be used to pass arbitrary info with the image
-        self.metadata = {}
+        if self._data is None:
+            # cv2 returns None when the source can't be read. AttributeError
+            # is what earlier versions of this class raised in this case.
+            raise AttributeError("Unable to load image data from {}".format(source))
 
     def __str__(self):
         txt = "Pyvision3 Image: {}".format(self.desc)
@@ -120,6 +228,129 @@ class Image(object):
     def __getitem__(self, slc):
         return self.data[slc]
 
+    def __reduce_ex__(self, protocol):
+        """
+        Supports pickling. With pickle protocol 5 or newer, the image data and
+        annotations are provided as out-of-band PickleBuffers, and the annotation
+        layer is omitted entirely when it has nothing drawn on it.
+
+        Examples
+        --------
+        buffers = []
+        payload = pickle.dumps(img, protocol=5, buffer_callback=buffers.append)
+        img2 = pickle.loads(payload, buffers=buffers)
+        """
+        if self._annotations_empty():
+            annotation_data = None
+        else:
+            annotation_data = _pickle_array(self.annotation_data, protocol)
+        return _rebuild_image, (type(self), self.desc, _pickle_array(self.data, protocol),
+                                annotation_data, self.annotation_transparency, self._metadata)
+
+    def _annotations_empty(self):
+        """
+        Returns True if every pixel of the annotation layer is transparent.
+        """
+        if self.annotation_transparency is None:
+            return False
+        if self._annotation_data is None:
+            return self._default_transparency()
+        return not np.any(self.annotation_data != np.array(self.annotation_transparency, dtype='uint8'))
+
+    @property
+    def data(self):
+        """
+        The image data, a cv2 (numpy) ndarray.
+        """
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self.mark_modified()
+
+    def _default_transparency(self):
+        """
+        True if the transparency color matches the initial fill value of the
+        annotations layer, meaning an unallocated layer is fully transparent.
+        """
+        return self.annotation_transparency is not None and \
+            tuple(self.annotation_transparency) == (1, 1, 1)
+
+    @property
+    def height(self):
+        """
+        The image height in pixels
+        """
+        return self._data.shape[0]
+
+    @property
+    def width(self):
+        """
+        The image width in pixels
+        """
+        return self._data.shape[1]
+
+    @property
+    def size(self):
+        """
+        The image size as a tuple (width, height)
+        """
+        return self._data.shape[1], self._data.shape[0]
+
+    @property
+    def nchannels(self):
+        """
+        The number of channels, 1 (grayscale) or 3 (BGR color)
+        """
+        return self._data.shape[2] if self._data.ndim == 3 else 1
+
+    @property
+    def metadata(self):
+        """
+        A dictionary that can be used to pass arbitrary info with the image.
+        """
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value):
+        self._metadata = value
+
+    @property
+    def annotation_data(self):
+        """
+        The annotations layer, a BGR uint8 ndarray the same size as the image data.
+        """
+        if self._annotation_data is None:
+            self._annotation_data = np.zeros((self.height, self.width, 3), dtype="uint8")+1
+        return self._annotation_data
+
+    @annotation_data.setter
+    def annotation_data(self, value):
+        self._annotation_data = value
+        self.mark_modified()
+
+    @property
+    def version(self):
+        """
+        An integer that increases every time the image data or annotations are
+        modified through the methods of this class. Useful as part of a cache key
+        for results computed from this image.
+        """
+        return self._version
+
+    def mark_modified(self):
+        """
+        Notifies the image that its data or annotations have changed, invalidating
+        any cached results such as those of the encode method. This is called
+        automatically by the annotation methods and when data or annotation_data
+        are reassigned, but must be called by the user after modifying the
+        pixels of img.data (or img.annotation_data) in place.
+        """
+        self._version += 1
+
     def as_grayscale(self, as_type="CV"):
         """
         Parameters
@@ -150,6 +381,7 @@ class Image(object):
         color:  (B, G, R) color tuple, default is (1, 1, 1).
         """
         self.annotation_transparency = color
+        self.mark_modified()
 
     def as_annotated(self, alpha=0.5, as_type="CV"):
         """
@@ -185,7 +417,10 @@ class Image(object):
         else:
             tmp_img = self.data.copy()
 
-        if self.annotation_transparency is not None:
+        if self._annotation_data is None and self._default_transparency():
+            # nothing has been drawn, so there is nothing to blend
+            pass
+        elif self.annotation_transparency is not None:
             pixs = np.nonzero((self.annotation_data != self.annotation_transparency).all(axis=2))
             tmp_img[pixs] = ((1.0 - alpha) * tmp_img[pixs] +
                             alpha * self.annotation_data[pixs]).astype('uint8')
@@ -206,7 +441,7 @@ class Image(object):
 
         Parameters
         ----------
-        shape: shapely.geometry shape object
+        shape: shapely.geometry shape object, or a RectArray
         color:
             An RGB tuple indicating the color, red is (255,0,0)
         fill_color:
@@ -226,6 +461,13 @@ class Image(object):
         """
         # TODO: annotate_shape should support all shapely geometries
         # TODO: annotations should support alpha-channel fills for partial transparency
+        if isinstance(shape, RectArray):
+            if fill_color is not None:
+                self.annotate_rects(shape, color=fill_color, thickness=-1)
+            self.annotate_rects(shape, color, *args, **kwargs)
+            return
+
+        import shapely.geometry as sg
         if isinstance(shape, sg.LinearRing) or isinstance(shape, sg.LineString):
             self._draw_segments(shape, color, *args, **kwargs)
         elif isinstance(shape, sg.MultiLineString):
@@ -238,6 +480,7 @@ class Image(object):
                 exterior = np.array(shape.exterior.coords, dtype='int')
                 interiors = [np.array(x.coords, dtype='int') for x in shape.interiors]
                 cv2.fillPoly(self.annotation_data, [exterior] + interiors, color=c)
+                self.mark_modified()
             # draw external ring of polygon
             self._draw_segments(shape.exterior, color, *args, **kwargs)
             # draw interior rings (holes) if any
@@ -254,7 +497,8 @@ class Image(object):
         point:  tuple (int: x, int: y) or shapely Point object
         color:  tuple (r,g,b)
         """
-        pt = (int(point.x), int(point.y)) if isinstance(point, sg.point.Point) else point
+        # shapely points (or anything else with x, y members) vs. tuples
+        pt = (int(point.x), int(point.y)) if hasattr(point, "x") else point
         self.annotate_circle(pt, 3, color, thickness=-1)
 
     def annotate_circle(self, ctr, radius, color=(255, 0, 0), *args, **kwargs):
@@ -278,6 +522,7 @@ class Image(object):
         c = self._fix_color_tuple(color)
         ctr = (int(ctr[0]), int(ctr[1]))
         cv2.circle(self.annotation_data, ctr, radius, c, *args, **kwargs)
+        self.mark_modified()
 
     def annotate_line(self, pt1, pt2, color, *args, **kwargs):
         """
@@ -295,6 +540,7 @@ class Image(object):
         """
         c = self._fix_color_tuple(color)
         cv2.line(self.annotation_data, pt1, pt2, c, *args, **kwargs)
+        self.mark_modified()
 
     def annotate_rect(self, pt1, pt2, color=(255, 0, 0), *args, **kwargs):
         """
@@ -318,6 +564,36 @@ class Image(object):
         """
         c = self._fix_color_tuple(color)
         cv2.rectangle(self.annotation_data, pt1, pt2, color=c, *args, **kwargs)
+        self.mark_modified()
+
+    def annotate_rects(self, rects, color=(255, 0, 0), thickness=1, line_type=cv2.LINE_8):
+        """
+        Draws many rectangles at once, with a single call into opencv.
+
+        Parameters
+        ----------
+        rects: RectArray, or a list of shapely rectangles
+        color: tuple (r,g,b)
+            The rgb color of the rectangles
+        thickness: int
+            The line thickness, use -1 to draw filled rectangles.
+        line_type: cv2 line type, defaults to cv2.LINE_8
+        """
+        if not isinstance(rects, RectArray):
+            rects = RectArray.from_shapes(rects)
+        if len(rects) == 0:
+            return
+        c = self._fix_color_tuple(color)
+        b = rects.integer_bounds()
+        # the four corners of each rectangle, as an (N, 4, 2) array
+        corners = np.stack((b[:, [0, 1]], b[:, [2, 1]], b[:, [2, 3]], b[:, [0, 3]]), axis=1)
+        polys = list(corners.astype('int32'))
+        if thickness < 0:
+            cv2.fillPoly(self.annotation_data, polys, color=c, lineType=line_type)
+        else:
+            cv2.polylines(self.annotation_data, polys, True, color=c, thickness=thickness,
+                          lineType=line_type)
+        self.mark_modified()
 
     def annotate_text(self, txt, point, color=(0, 0, 0), bg_color=None,
                       font_face=cv2.FONT_HERSHEY_PLAIN, font_scale=1, *args, **kwargs):
@@ -354,6 +630,7 @@ class Image(object):
 
         cv2.putText(self.annotation_data, txt, point, fontFace=font_face,
                     fontScale=font_scale, color=c, *args, **kwargs)
+        self.mark_modified()
 
     def annotate_mask(self, mask_img, transparency=(0, 0, 0)):
         """
@@ -375,6 +652,7 @@ class Image(object):
         if transparency is not None:
             pix = np.nonzero((self.annotation_data == transparency).all(axis=2))
             self.annotation_data[pix] = self.annotation_transparency
+            self.mark_modified()
 
     def _draw_segments(self, simple_shape, color, *args, **kwargs):
         """
@@ -435,7 +713,8 @@ class Image(object):
         """
         new_data = self.data.copy()
         new_img = Image(new_data)
-        new_img.annotation_data = self.annotation_data.copy()
+        if self._annotation_data is not None:
+            new_img.annotation_data = self._annotation_data.copy()
         return new_img
 
     def crop(self, rect):
@@ -445,7 +724,7 @@ class Image(object):
 
         Parameters
         ----------
-        rect:   shapely rectangle (polygon)
+        rect:   shapely rectangle (polygon), or a RectArray holding a single rectangle
 
         Returns
         -------
@@ -456,14 +735,119 @@ class Image(object):
         Raises an OutOfBounds exception if the rectangle being cropped is
         partially or fully outside the bounds of the image.
         """
-        if not in_bounds(rect, self):
-            raise OutOfBoundsError("Cropping rectangle {} is out of bounds.".format(rect.bounds))
-        (minx, miny, maxx, maxy) = integer_bounds(rect)
+        if isinstance(rect, RectArray):
+            if len(rect) != 1:
+                raise ValueError("Image.crop requires a RectArray of length 1, not {}.".format(len(rect)))
+            bounds = rect.bounds[0]
+            ok = rect.in_bounds(self.size)[0]
+            (minx, miny, maxx, maxy) = rect.integer_bounds()[0]
+        else:
+            bounds = rect.bounds
+            ok = in_bounds(rect, self)
+            (minx, miny, maxx, maxy) = integer_bounds(rect)
+        if not ok:
+            raise OutOfBoundsError("Cropping rectangle {} is out of bounds.".format(tuple(bounds)))
         cropped = self.data[miny:(maxy+1), minx:(maxx+1)].copy()
         crop_image = Image(cropped)
         crop_image.metadata["crop_bounds"] = (minx, miny, maxx, maxy)
         return crop_image
 
+    def crop_many(self, rects, out_size=None, pad_mode=None, pad_value=0, as_type="CV",
+                  interpolation=cv2.INTER_LINEAR):
+        """
+        Crops a batch of rectangular regions from this image, optionally resizing
+        each to a common size, into a single (N, h, w, c) output array. This is
+        much faster than calling crop() and resize() for each region when extracting
+        many small crops, for example to feed a classifier.
+
+        Parameters
+        ----------
+        rects: RectArray, (N, 4) ndarray of bounds, or list of shapely rectangles
+        out_size: tuple (w, h) or None
+            The size of each output crop. If None, then every rectangle must have
+            the same (integer) size, and the crops are not resized.
+        pad_mode: str or None
+            If None (default), then an OutOfBoundsError is raised if any rectangle is
+            partially or fully outside the image, as with crop(). Otherwise, the
+            out-of-bounds part of each crop is filled according to the mode, one of
+            PAD_MODES: "constant" (with pad_value), "edge" (replicating the border pixels),
+            or "reflect" (mirroring the image about the border pixels).
+        pad_value: scalar or tuple
+            The fill value used when pad_mode is "constant".
+        as_type: str in ("CV","PV")
+            If "CV" (default), the crops are returned as a single ndarray of shape
+            (N, h, w, c), or (N, h, w) for a single-channel image. If "PV", then a list
+            of pyvision images is returned, each viewing its slice of the batch array.
+            The crops are not copied, so holding on to any one of them keeps the whole
+            batch in memory. Copy the crops that are kept long after the rest, such as
+            with Image(crop.data.copy()).
+        interpolation: int
+            The cv2 interpolation flag used when resizing.
+
+        Returns
+        -------
+        The batch of crops, as described by as_type. Each pyvision image returned will
+        have the "crop_bounds" metadata of the integer crop coordinates used to generate it,
+        as with crop().
+        """
+        rects = _as_rect_array(rects)
+        if pad_mode is not None and pad_mode not in PAD_MODES:
+            raise ValueError("pad_mode must be None or one of {}, not {}".format(PAD_MODES, pad_mode))
+
+        ok = rects.in_bounds(self.size)
+        if pad_mode is None and not ok.all():
+            bad = np.flatnonzero(~ok)
+            raise OutOfBoundsError("{} of {} cropping rectangles are out of bounds, the first is {}.".format(
+                len(bad), len(rects), tuple(rects.bounds[bad[0]])))
+
+        # flooring is the same as integer_bounds(...) for in-bounds rectangles, and keeps
+        # the size of rectangles that extend past the top or left of the image consistent
+        ib = np.floor(rects.bounds).astype('int')
+        widths = ib[:, 2] - ib[:, 0] + 1
+        heights = ib[:, 3] - ib[:, 1] + 1
+        N = len(rects)
+
+        if out_size is None:
+            if N > 0 and (np.any(widths != widths[0]) or np.any(heights != heights[0])):
+                raise ValueError("The rectangles vary in size, so an out_size must be specified.")
+            (out_w, out_h) = (int(widths[0]), int(heights[0])) if N > 0 else (0, 0)
+        else:
+            (out_w, out_h) = out_size
+
+        mat = self.data
+        (img_h, img_w) = mat.shape[:2]
+        out = np.empty((N, out_h, out_w) + mat.shape[2:], dtype=mat.dtype)
+
+        for i in range(N):
+            (minx, miny, maxx, maxy) = ib[i]
+            if ok[i]:
+                src = mat[miny:(maxy+1), minx:(maxx+1)]
+            else:
+                rows = _border_indices(miny, maxy + 1, img_h, pad_mode)
+                cols = _border_indices(minx, maxx + 1, img_w, pad_mode)
+                src = mat[rows[:, np.newaxis], cols]
+                if pad_mode == "constant":
+                    src[:max(0, -miny)] = pad_value
+                    src[max(0, img_h - miny):] = pad_value
+                    src[:, :max(0, -minx)] = pad_value
+                    src[:, max(0, img_w - minx):] = pad_value
+
+            if out_size is None:
+                out[i] = src
+            else:
+                # writes directly into the batch array, no intermediate allocation
+                cv2.resize(src, (out_w, out_h), dst=out[i], interpolation=interpolation)
+
+        if as_type == "PV":
+            crops = []
+            for i in range(N):
+                crop_image = Image(out[i])
+                crop_image.metadata["crop_bounds"] = tuple(int(v) for v in ib[i])
+                crops.append(crop_image)
+            return crops
+        else:
+            return out
+
     def resize(self, new_size, keep_aspect=False, as_type="CV"):
         """
         Returns a copy of the image after resizing to a new size.
@@ -494,10 +878,10 @@ class Image(object):
 
             # Create new image with resized tmp image centered
             tmp = cv2.resize(self.data, (w, h))
-            new = np.zeros((new_size[1], new_size[0], self.nchannels), dtype=tmp.dtype)
+            new = np.zeros((new_size[1], new_size[0]) + tmp.shape[2:], dtype=tmp.dtype)
             x = (new_size[0] - w) // 2
             y = (new_size[1] - h) // 2
-            new[y:(y+h), x:(x+w), :] = tmp
+            new[y:(y+h), x:(x+w)] = tmp
         else:
             new = cv2.resize(self.data, new_size)
 
@@ -572,6 +956,7 @@ class Image(object):
             return key
         else:
             # display in a matplotlib figure
+            import matplotlib.pyplot as plot
             if img_array.shape[-1] == 3:
                 # Note cv2 image arrays are BGR order, but matplotlib expects
                 # RGB order. So we're swapping channel 0 with channel 2
@@ -594,7 +979,51 @@ class Image(object):
         tmp.show(window_title=window_title, highgui=highgui, delay=delay, pos=pos,
                  annotations=False)
 
-    def save(self, filename, *args, as_annotated=True, **kwargs):
+    def encode(self, fmt=".jpg", quality=None, annotated=True, alpha=0.5):
+        """
+        Encodes the image data (or the annotated image data) into an in-memory
+        image file, such as a jpeg or png, using cv2.imencode.
+
+        Results are cached per image, keyed on the encoding parameters, so
+        repeatedly encoding an unchanged image is cheap. The cache is invalidated
+        whenever the image is modified via its methods (see mark_modified).
+
+        Parameters
+        ----------
+        fmt: str
+            The image format as a file extension, such as ".jpg" (default) or ".png".
+        quality: int or None
+            The encoding quality, see pyvision.image.encode_params for details.
+        annotated: boolean
+            If True (default) then the annotated version of the image is encoded.
+        alpha: float
+            The annotation opacity used when annotated is True, see as_annotated.
+
+        Returns
+        -------
+        The encoded image as a bytes object.
+        """
+        ext, params = encode_params(fmt, quality)
+        key = (ext, tuple(params), annotated, alpha if annotated else None)
+
+        if self._encode_cache is None or self._encode_cache_version != self._version:
+            self._encode_cache = {}
+            self._encode_cache_version = self._version
+
+        buf = self._encode_cache.get(key)
+        if buf is None:
+            img_array = self.as_annotated(alpha=alpha) if annotated else self.data
+            ok, enc = cv2.imencode(ext, img_array, params)
+            if not ok:
+                raise IOError("Unable to encode image as {}".format(ext))
+            buf = enc.tobytes()
+            if len(self._encode_cache) >= ENCODE_CACHE_SIZE:
+                # discard the oldest entry
+                del self._encode_cache[next(iter(self._encode_cache))]
+            self._encode_cache[key] = buf
+        return buf
+
+    def save(self, filename, *args, as_annotated=True, writer=None, **kwargs):
         """
         Saves the image data (or the annotated image data) to a file.
         This wraps cv2.imwrite function.
@@ -605,7 +1034,20 @@ class Image(object):
             The filename, including extension, for the saved image
         as_annotated: Boolean
             If True (default) then the annotated version of the image will be saved.
+        writer: pyvision ImageWriter or None
+            If provided, the image is queued on the writer instead of being written
+            synchronously, and filename is interpreted relative to the writer's
+            destination. In this case, other args and kwargs are ignored, as the
+            writer controls the encoding parameters.
         All other args and kwargs are passed on to cv2.imwrite
+
+        Returns
+        -------
+        None, unless a writer is specified, in which case the return value of
+        writer.write(...) is returned.
         """
+        if writer is not None:
+            return writer.write(self, name=filename, as_annotated=as_annotated)
+
         img_array = self.as_annotated() if as_annotated else self.data
         cv2.imwrite(filename, img_array, *args, **kwargs)
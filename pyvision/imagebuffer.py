@@ -4,8 +4,14 @@ Modified: Mar 10, 2016
     Modified for Pyvision 3
 Author: Stephen O'Hara
 """
+import collections
+import concurrent.futures as cf
+import time
+
+import cv2
 import numpy as np
 import pyvision as pv3
+from pyvision.image import encode_params
 
 
 class ImageBuffer:
@@ -17,35 +23,93 @@ class ImageBuffer:
     buffer fills, and older items are dropped off the end. This is convenient
     for streaming input sources, as the user can simply keep adding images
     to this buffer, and internally, the most recent N will be kept available.
+
+    Alternatively, the buffer can retain images by a time window (max_age) and/or
+    a memory budget (max_bytes), so that the same buffer covers the same duration
+    at any frame rate, or uses a predictable amount of memory at any resolution.
+    The oldest images are evicted first. Such a buffer is considered full once it
+    has first had to evict an image.
+
+    The images are stored in a ring of slots, so adding an image only replaces
+    the oldest one. The buffer can also maintain a companion stack of the grayscale
+    versions of its images, see gray_stack(), in which only the slots of newly
+    added images need to be converted.
     """
+    # retention budgets, None for no limit
+    _max_age = None
+    _max_bytes = None
+    _budgeted = False
 
-    def __init__(self, N=5):
+    def __init__(self, N=5, max_age=None, max_bytes=None):
         """
-        @param N: how many image frames to buffer
+        @param N: how many image frames to buffer. When max_age or max_bytes is given,
+        this is the maximum number of frames, and may be None for no limit.
+        @param max_age: If not None, images more than max_age seconds older than the
+        newest image are evicted, see add().
+        @param max_bytes: If not None, the oldest images are evicted while the pixel data
+        of the images in the buffer exceeds this many bytes. The newest image is always kept.
         """
-        self._data = [None for _ in range(N)]
-        self._count = 0
+        if N is None and max_age is None and max_bytes is None:
+            raise ValueError("An ImageBuffer requires at least one of N, max_age or max_bytes.")
         self._max = N
-            
+        self._max_age = max_age
+        self._max_bytes = max_bytes
+        self._budgeted = max_age is not None or max_bytes is not None
+        self._capacity = min(N, 16) if self._budgeted and N is not None else (N or 16)
+        self._slots = [None] * self._capacity
+        self._stamps = np.full(self._capacity, -1, dtype='int64')  # the sequence number of the image in each slot
+        self._times = np.zeros(self._capacity)  # the timestamp of the image in each slot
+        self._nbytes = np.zeros(self._capacity, dtype='int64')  # the size of the image in each slot
+        self._bytes = 0
+        self._head = 0  # the slot of the oldest image
+        self._count = 0
+        self._total = 0  # the number of images ever added
+        self._evicted = False
+        self._gray = None  # the companion grayscale stack, created on first use
+        self._gray_stamps = None
+
     def __getitem__(self, key):
-        return self._data[key]
+        """
+        Indexing follows the order of get_data(), that is, from the oldest to the newest
+        image, preceded by None for each empty slot while a fixed-size buffer is filling.
+        """
+        if isinstance(key, slice):
+            return self._data[key]
+        n = len(self)
+        if key < 0:
+            key += n
+        if not 0 <= key < n:
+            raise IndexError("ImageBuffer index out of range")
+        i = key - (n - self._count)
+        return None if i < 0 else self._slot_image((self._head + i) % self._capacity)
         
     def __len__(self):
         """
         This is a fixed-sized ring buffer, so length is always the number
-        of images that can be stored in the buffer (as initialized with Nframes)
+        of images that can be stored in the buffer (as initialized with Nframes).
+        For a buffer with a time or memory budget, the length is the number of
+        images currently stored.
         """
-        return self._max
+        return self._count if self._budgeted else self._max
     
     def is_full(self):
-        if self._count == self._max:
+        """
+        A fixed-size buffer is full once it holds N images. A buffer with a time or
+        memory budget is full once it has had to evict an image, or holds N images.
+        """
+        if self._count == self._max or (self._budgeted and self._evicted):
             return True
         else:
             return False
             
     def clear(self):
-        self._data = [None for _ in range(self._max)]
+        self._slots = [None] * self._capacity
+        self._stamps[:] = -1
+        self._nbytes[:] = 0
+        self._bytes = 0
+        self._head = 0
         self._count = 0
+        self._evicted = False
             
     def get_count(self):
         """
@@ -58,27 +122,107 @@ class ImageBuffer:
     def get_data(self):
         return self._data
 
+    def get_timestamps(self):
+        """
+        @return: An array of the timestamps of the images in the buffer, from oldest to newest.
+        """
+        return self._times[(self._head + np.arange(self._count)) % self._capacity]
+
+    def get_nbytes(self):
+        """
+        @return: The total size in bytes of the pixel data of the images in the buffer.
+        """
+        return self._bytes
+
+    @property
+    def _data(self):
+        """
+        The list of the images in the buffer, from oldest to newest, preceded by None
+        for each empty slot.
+        """
+        return [self[i] for i in range(len(self))]
+
+    def _slot_image(self, slot):
+        return self._slots[slot]
+
+    def _slot_array(self, slot):
+        return self._slots[slot].data
+
     def first(self):
-        return self._data[0]
+        return self[0]
 
     def last(self):
-        return self._data[-1]
+        return self[-1]
     
     def middle(self):
         mid = int(self._count/2)
-        return self._data[mid]
+        return self[len(self) - self._count + mid]
             
-    def add(self, image):
+    def add(self, image, timestamp=None):
         """
         add an image to the buffer, will kick out the oldest of the buffer is full
         @param  image: image to add to buffer
+        @param timestamp: The time of the image in seconds, such as from VideoInterface.timestamp(),
+        used with max_age. Defaults to the current time.monotonic(). Images should be added
+        in time order.
         """
-        self._data.pop(0)  # remove last, if just beginning, this will be None
-        self._data.append(image)
+        if self._count == self._max:
+            self._evict_oldest()
+        elif self._count == self._capacity:
+            self._grow()
+
+        slot = (self._head + self._count) % self._capacity
+        nbytes = self._item_nbytes(image)
+        self._slots[slot] = image
+        self._stamps[slot] = self._total
+        self._times[slot] = time.monotonic() if timestamp is None else timestamp
+        self._nbytes[slot] = nbytes
+        self._bytes += nbytes
+        self._total += 1
         self._count += 1
-        if self._count > self._max:
-            self._count = self._max
-            
+        self._enforce_budget()
+
+    def _item_nbytes(self, image):
+        return image.data.nbytes if isinstance(image, pv3.Image) else image.nbytes
+
+    def _enforce_budget(self):
+        """
+        Evicts the oldest images of a budgeted buffer until it is within its budgets.
+        """
+        if not self._budgeted or self._count == 0:
+            return
+        newest = self._times[(self._head + self._count - 1) % self._capacity]
+        while self._count > 1 and (
+                (self._max_bytes is not None and self._bytes > self._max_bytes) or
+                (self._max_age is not None and self._times[self._head] < newest - self._max_age)):
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        head = self._head
+        self._slots[head] = None
+        self._stamps[head] = -1
+        self._bytes -= self._nbytes[head]
+        self._nbytes[head] = 0
+        self._head = (head + 1) % self._capacity
+        self._count -= 1
+        self._evicted = True
+
+    def _grow(self):
+        """
+        Doubles the number of slots of a budgeted buffer, up to N.
+        """
+        order = (self._head + np.arange(self._count)) % self._capacity
+        capacity = 2 * self._capacity if self._max is None else min(2 * self._capacity, self._max)
+        self._slots = [self._slots[i] for i in order] + [None] * (capacity - self._count)
+        for name in ("_stamps", "_times", "_nbytes"):
+            old = getattr(self, name)
+            new = np.full(capacity, -1, dtype=old.dtype) if name == "_stamps" else np.zeros(capacity, old.dtype)
+            new[:self._count] = old[order]
+            setattr(self, name, new)
+        self._capacity = capacity
+        self._head = 0
+        self._gray = None  # rebuilt on demand
+
     def fill(self, source):
         """
         If buffer is empty, you can use this function to spool off the first
@@ -94,70 +238,234 @@ class ImageBuffer:
         cur_pos = 0
 
         while not self.is_full():
+            timestamp = None
             if vid_flag:
                 im = source.next()
+                if self._max_age is not None:
+                    timestamp = source.timestamp()  # fill by the video's time, not the clock
             else:
                 im = source[cur_pos]
                 cur_pos += 1
                 cur_pos %= len(source)
-            self.add(im)
+            if timestamp is None:
+                self.add(im)
+            else:
+                self.add(im, timestamp=timestamp)
 
         return
 
+    def gray_stack(self, size=None, ordered=False):
+        """
+        Returns the grayscale versions of the images in the buffer as a stack, which is
+        maintained alongside the buffer. Only the images added since the last call are
+        converted, so this is cheap to call after every add(). Images are assumed not to
+        be modified in place once they are added to the buffer.
+        @param size: A tuple (w,h) of the size of each gray frame, the images being resized
+        as required. If None, then the size of the existing stack is used, or else
+        the size of the newest image.
+        @param ordered: If False (default), the frames of the stack are in the order of the
+        buffer's slots, which is a rotation of the order in which the images were added,
+        and the stack is a read-only view of the companion stack, which changes as
+        images are added. (While a budgeted buffer holds fewer images than it has slots,
+        the stack may be a read-only copy instead.) This is ideal for order-independent statistics, such as the
+        median of each pixel. If True, the frames are ordered from oldest to newest,
+        in a new array.
+        @return: A 3D uint8 array (stack) with dimensions (n,h,w), where n is the number
+        of images in the buffer.
+        """
+        if self._count == 0:
+            raise ValueError("The image buffer is empty.")
+        if size is None:
+            if self._gray is not None:
+                size = (self._gray.shape[2], self._gray.shape[1])
+            else:
+                newest = self._slot_array((self._head + self._count - 1) % self._capacity)
+                size = (newest.shape[1], newest.shape[0])
+        (w, h) = size
+        if self._gray is None or self._gray.shape != (self._capacity, h, w):
+            self._gray = np.zeros((self._capacity, h, w), dtype='uint8')
+            self._gray_stamps = np.full(self._capacity, -1, dtype='int64')
+
+        # convert only the slots whose images have changed
+        stamps = self._stamps
+        for slot in np.flatnonzero((stamps != self._gray_stamps) & (stamps >= 0)):
+            mat = self._slot_array(slot)
+            if (mat.shape[1], mat.shape[0]) != (w, h):
+                mat = cv2.resize(mat, (w, h))
+            if mat.ndim == 3:
+                mat = cv2.cvtColor(mat, cv2.COLOR_BGR2GRAY)
+            self._gray[slot] = mat
+            self._gray_stamps[slot] = stamps[slot]
+
+        (head, count) = (self._head, self._count)
+        if ordered:
+            return self._gray[(head + np.arange(count)) % self._capacity]
+        if count == self._capacity:
+            stack = self._gray[:]
+        elif head + count <= self._capacity:
+            stack = self._gray[head:head + count]
+        else:
+            # only a budgeted buffer's images wrap around the ring without filling it
+            stack = np.concatenate((self._gray[head:], self._gray[:head + count - self._capacity]))
+        stack.flags.writeable = False
+        return stack
+
     def as_image_stack_BW(self, size=None):
         """
         Outputs an image buffer as a 3D numpy array ("stack") of grayscale images.
         @param size: A tuple (w,h) indicating the output size of each frame.
-        If None, then the size of the first image in the buffer will be used.
+        If None, then the size of the newest image in the buffer will be used.
         @return: a 3D array (stack) of the gray scale version of the images
-        in the buffer. The dimensions of the stack are (N,w,h), where N is
-        the number of images (buffer size), w and h are the width and height
-        of each image.        
+        in the buffer, from oldest to newest. The dimensions of the stack are
+        (N,h,w), where N is the number of images in the buffer, w and h are the
+        width and height of each image. See also gray_stack(), which avoids copying.
         """
         if size is None:
-            img0 = self[0]        
-            (w, h) = img0.size
-        else:
-            (w, h) = size
-            
-        f = self.get_count()
-        stack = np.zeros((f, h, w), dtype='uint8')
-        for i, img in enumerate(self._data):
-            # if img is not (w,h) in size, then resize first
-            sz = img.size
-            if (w, h) != sz:
-                img2 = img.resize((w, h))
-                mat = img2.as_grayscale(as_type="CV")
-            else:
-                mat = img.as_grayscale(as_type="CV")
-            stack[i, :, :] = mat
-            
-        return stack
+            size = self.last().size
+        return self.gray_stack(size=size, ordered=True)
     
     def as_montage(self, layout, tile_size=None, **kwargs):
-        (w, h) = self[0].size
         if tile_size is None:
-            tw = w//5
-            th = h//5
-            tw = 32 if tw < 32 else tw
-            th = 24 if th < 24 else th
-            tile_size = (tw, th)
-            
+            tile_size = self._default_tile_size()
         im = pv3.ImageMontage(self._data, layout=layout, tile_size=tile_size, **kwargs)
         return im
-    
+
+    def _default_tile_size(self):
+        (w, h) = self[-1].size
+        tw = w//5
+        th = h//5
+        tw = 32 if tw < 32 else tw
+        th = 24 if th < 24 else th
+        return (tw, th)
+
     def show(self, N=10, window_title="Image Buffer", pos=None, delay=0):
         """
-        @param N: The number of images in the buffer to display at once
+        Displays the most recent images in the buffer side by side. The strip is composed
+        with pv3.compose_montage, which is cheap enough to call on every frame of a video.
+        @param N: The number of the most recent images in the buffer to display
         @param window_title: The window name
         @param pos: The window position
         @param delay: The window display duration 
+        @return: The key code of the key pressed, if any, that dismissed the window.
         """
-        if self[0] is None:
-            return
-        
-        if N <= self._count:
-            im = self.as_montage(layout=(1, N))
-        else:
-            im = self.as_montage(layout=(1, self._count))
-        im.show(window_title=window_title, pos=pos, delay=delay)
+        if self._count == 0:
+            return None
+
+        n = min(N, self._count)
+        strip = pv3.compose_montage(self._data[-n:], layout=(1, n), tile_size=self._default_tile_size(),
+                                    as_type="PV")
+        return strip.show(window_title=window_title, highgui=True, pos=pos, delay=delay)
+
+
+class CompressedImageBuffer(ImageBuffer):
+    """
+    An ImageBuffer that stores its images encoded, as jpeg or png files in memory, which
+    typically takes a tenth of the memory (or less) of the raw pixels. This makes it
+    practical to buffer many seconds of high resolution video, such as for the pre-roll
+    of a motion-triggered clip, see pyvision.video_proc.cliprecorder.
+
+    Images are encoded by a worker thread, so add() returns immediately. Images are
+    decoded whenever they are accessed, so each access returns a new pyvision image.
+    With max_bytes, the budget applies to the encoded sizes (an image still being
+    encoded counts its raw size).
+    """
+
+    def __init__(self, N=5, max_age=None, max_bytes=None, fmt=".jpg", quality=None, num_workers=1,
+                 max_pending=16):
+        """
+        @param N: see ImageBuffer
+        @param max_age: see ImageBuffer
+        @param max_bytes: see ImageBuffer
+        @param fmt: The encoding format, such as ".jpg" (default) or ".png", which is lossless.
+        @param quality: The encoding quality, see pyvision.image.encode_params
+        @param num_workers: The number of encoding threads
+        @param max_pending: The maximum number of images waiting to be encoded. When the encoders
+        fall this far behind, add() waits for them.
+        """
+        ImageBuffer.__init__(self, N=N, max_age=max_age, max_bytes=max_bytes)
+        self.fmt = fmt
+        self.quality = quality
+        self._max_pending = max_pending
+        self._pool = cf.ThreadPoolExecutor(max_workers=num_workers)
+        self._pending = collections.deque()  # (sequence number, future) of the images being encoded
+
+    def add(self, image, timestamp=None):
+        """
+        Queues an image to be encoded, and adds it to the buffer.
+        @param image: A pyvision image or cv2 array, which must not be modified afterwards.
+        @param timestamp: see ImageBuffer.add
+        """
+        self._collect()
+        while len(self._pending) >= self._max_pending:
+            self._pending[0][1].result()
+            self._collect()
+        mat = image.data if isinstance(image, pv3.Image) else image
+        future = self._pool.submit(self._encode, mat)
+        self._pending.append((self._total, future))
+        ImageBuffer.add(self, _PendingEncode(future, mat.nbytes), timestamp=timestamp)
+
+    def _encode(self, mat):
+        ext, params = encode_params(self.fmt, self.quality)
+        ok, buf = cv2.imencode(ext, mat, params)
+        if not ok:
+            raise IOError("Unable to encode image as {}".format(ext))
+        return buf.tobytes()
+
+    def _collect(self):
+        """
+        Stores the finished encodings in their slots, in place of the raw images,
+        updating the byte counts.
+        """
+        while self._pending and self._pending[0][1].done():
+            (stamp, future) = self._pending.popleft()
+            slots = np.flatnonzero(self._stamps == stamp)
+            if len(slots) == 0:
+                continue  # already evicted
+            slot = slots[0]
+            data = future.result()
+            self._slots[slot] = data
+            self._bytes += len(data) - self._nbytes[slot]
+            self._nbytes[slot] = len(data)
+        self._enforce_budget()
+
+    def _item_nbytes(self, item):
+        return item.nbytes if isinstance(item, _PendingEncode) else len(item)
+
+    def _slot_array(self, slot, flags=cv2.IMREAD_UNCHANGED):
+        item = self._slots[slot]
+        data = item.future.result() if isinstance(item, _PendingEncode) else item
+        mat = cv2.imdecode(np.frombuffer(data, dtype='uint8'), flags)
+        if mat is None:
+            raise IOError("Unable to decode buffered image.")
+        return mat
+
+    def _slot_image(self, slot):
+        return pv3.Image(self._slot_array(slot)) if self._slots[slot] is not None else None
+
+    def get_encoded(self, idx):
+        """
+        @param idx: The position of an image in the buffer, from 0 (oldest) to get_count()-1 (newest)
+        @return: The encoded bytes of the image
+        """
+        if not 0 <= idx < self._count:
+            raise IndexError("CompressedImageBuffer index out of range")
+        item = self._slots[(self._head + idx) % self._capacity]
+        return item.future.result() if isinstance(item, _PendingEncode) else item
+
+    def close(self):
+        """
+        Stops the encoding threads, once the queued images are encoded.
+        """
+        self._pool.shutdown(wait=True)
+        self._collect()
+
+
+class _PendingEncode(object):
+    """
+    Occupies the slot of an image that is being encoded.
+    """
+    __slots__ = ("future", "nbytes")
+
+    def __init__(self, future, nbytes):
+        self.future = future
+        self.nbytes = nbytes
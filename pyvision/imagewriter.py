@@ -0,0 +1,302 @@
+"""
+This module defines the pyvision ImageWriter, which saves images
+asynchronously. Images are accepted into a bounded queue and are
+encoded and written to disk by a pool of worker threads, so that
+loops which dump many frames or crops are not stalled on encoding
+and disk I/O.
+
+The destination may be a directory, in which case each image is
+written to its own file, or a single .tar or .zip archive, which
+is much friendlier to the file system when writing millions of
+small images.
+
+Example
+-------
+with pv3.ImageWriter("crops.tar", fmt=".jpg", quality=90) as writer:
+    for idx, crop in enumerate(crops):
+        writer.write(crop, name="crop_{}.jpg".format(idx))
+    print(writer.stats())
+"""
+# pylint: disable=E1101
+
+import io
+import os
+import queue
+import tarfile
+import threading
+import time
+import zipfile
+
+import cv2
+import numpy as np
+
+from .image import Image, encode_params
+
+
+class ImageWriter(object):
+    """
+    Writes pyvision images (or cv2 arrays) to a directory or archive
+    using a pool of background worker threads.
+    """
+
+    def __init__(self, dest, fmt=".jpg", quality=None, as_annotated=False,
+                 max_queue=256, num_workers=4, block=True, copy=True):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        dest: str
+            The output destination. If the path ends with ".tar" or ".zip", then
+            all images will be written into a single archive of that type. Otherwise
+            dest is treated as a directory, which will be created if required.
+        fmt: str
+            The default encoding format, as a file extension, such as ".jpg" or ".png".
+            This is used when the name given to write() has no extension.
+        quality: int or None
+            The encoding quality, see pyvision.image.encode_params for details.
+        as_annotated: boolean
+            If True, then the annotated version of each image is written. Default
+            is False. Note that this differs from Image.save, because computing the
+            annotated image is a full-frame operation performed in the caller's thread.
+        max_queue: int
+            The maximum number of images waiting to be encoded. When the queue is
+            full, write() will either block or drop the image, see block.
+        num_workers: int
+            The number of worker threads used for encoding and writing.
+        block: boolean
+            If True (default), write() blocks when the queue is full, applying
+            backpressure to the producer. If False, the image is dropped instead,
+            and write() returns False.
+        copy: boolean
+            If True (default), the pixel data is copied when queued, so the caller may
+            continue to modify the image. Set False only if the queued images will not
+            be modified until they have been written.
+        """
+        self.dest = dest
+        self.fmt, _ = encode_params(fmt)
+        self.quality = quality
+        self.as_annotated = as_annotated
+        self.block = block
+        self.copy = copy
+
+        ext = os.path.splitext(dest)[1].lower()
+        if ext == ".tar":
+            self._archive = tarfile.open(dest, mode="w")
+        elif ext == ".zip":
+            self._archive = zipfile.ZipFile(dest, mode="w", compression=zipfile.ZIP_STORED)
+        else:
+            self._archive = None
+            os.makedirs(dest, exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()  # guards the archive and the statistics
+        self._errors = []
+        self._closed = False
+
+        self._submitted = 0
+        self._written = 0
+        self._dropped = 0
+        self._bytes_written = 0
+        self._blocked_time = 0.0
+        self._start_time = time.perf_counter()
+        self._end_time = None  # set when closed
+
+        self._workers = [threading.Thread(target=self._work, daemon=True)
+                         for _ in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        except IOError:
+            if exc_type is None:
+                raise
+            # don't hide the exception already propagating from the with block
+
+    def write(self, image, name=None, as_annotated=None):
+        """
+        Queues an image to be encoded and written.
+
+        Parameters
+        ----------
+        image: pyvision Image or cv2 ndarray
+        name: str or None
+            The file name (relative to the destination) to use for this image. If the
+            name has no extension, the writer's format is appended. If None, then
+            a name is generated from the sequence number of the image.
+        as_annotated: boolean or None
+            Overrides the writer's as_annotated setting for this image. Ignored
+            for ndarray inputs.
+
+        Returns
+        -------
+        True if the image was queued, False if it was dropped because the queue
+        was full and the writer was created with block=False.
+        """
+        if self._closed:
+            raise ValueError("Cannot write to an ImageWriter that has been closed.")
+
+        if as_annotated is None:
+            as_annotated = self.as_annotated
+
+        if isinstance(image, Image):
+            if as_annotated:
+                img_array = image.as_annotated()  # already a new array
+            else:
+                img_array = image.data.copy() if self.copy else image.data
+        else:
+            img_array = np.array(image, copy=self.copy)
+
+        with self._lock:
+            seq = self._submitted
+            self._submitted += 1
+
+        if name is None:
+            name = "{:08d}{}".format(seq, self.fmt)
+        elif os.path.splitext(name)[1] == "":
+            name += self.fmt
+
+        if self.block:
+            t0 = time.perf_counter()
+            self._queue.put((name, img_array))
+            waited = time.perf_counter() - t0
+            with self._lock:
+                self._blocked_time += waited
+        else:
+            try:
+                self._queue.put_nowait((name, img_array))
+            except queue.Full:
+                with self._lock:
+                    self._dropped += 1
+                return False
+        return True
+
+    def write_many(self, images, names=None):
+        """
+        Queues a batch of images, see write().
+
+        Parameters
+        ----------
+        images: list of pyvision Images or cv2 ndarrays
+        names: list of str, or None
+
+        Returns
+        -------
+        The number of images that were queued.
+        """
+        if names is not None and len(names) != len(images):
+            raise ValueError("The number of names must match the number of images.")
+        count = 0
+        for idx, img in enumerate(images):
+            name = None if names is None else names[idx]
+            if self.write(img, name=name):
+                count += 1
+        return count
+
+    def flush(self):
+        """
+        Blocks until every image queued so far has been written.
+        """
+        self._queue.join()
+        if self._archive is not None:
+            with self._lock:
+                if isinstance(self._archive, tarfile.TarFile):
+                    self._archive.fileobj.flush()
+                else:
+                    self._archive.fp.flush()
+
+    def close(self):
+        """
+        Waits for all queued images to be written, stops the worker threads,
+        and closes the archive (if any). Raises an IOError if any image
+        could not be encoded or written.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._end_time = time.perf_counter()
+        if self._archive is not None:
+            self._archive.close()
+        if self._errors:
+            raise IOError("ImageWriter failed on {} image(s), first error: {}".format(
+                len(self._errors), self._errors[0]))
+
+    def stats(self):
+        """
+        Returns
+        -------
+        A dictionary of throughput and backpressure statistics:
+        submitted, written, dropped and pending image counts, bytes_written,
+        blocked_seconds (total time producers spent waiting on a full queue),
+        elapsed_seconds (up to when the writer was closed), images_per_second,
+        and bytes_per_second.
+        """
+        with self._lock:
+            end_time = time.perf_counter() if self._end_time is None else self._end_time
+            elapsed = end_time - self._start_time
+            return {"submitted": self._submitted,
+                    "written": self._written,
+                    "dropped": self._dropped,
+                    "pending": self._queue.qsize(),
+                    "bytes_written": self._bytes_written,
+                    "blocked_seconds": self._blocked_time,
+                    "elapsed_seconds": elapsed,
+                    "images_per_second": self._written / elapsed if elapsed > 0 else 0.0,
+                    "bytes_per_second": self._bytes_written / elapsed if elapsed > 0 else 0.0}
+
+    def _work(self):
+        """
+        Worker thread loop, encoding and writing queued images until
+        the sentinel (None) is received.
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            name, img_array = item
+            try:
+                data = self._encode(name, img_array)
+                self._store(name, data)
+                with self._lock:
+                    self._written += 1
+                    self._bytes_written += len(data)
+            except Exception as e:  # pylint: disable=broad-except
+                with self._lock:
+                    self._errors.append("{}: {}".format(name, e))
+            finally:
+                self._queue.task_done()
+
+    def _encode(self, name, img_array):
+        ext, params = encode_params(os.path.splitext(name)[1], self.quality)
+        ok, buf = cv2.imencode(ext, img_array, params)
+        if not ok:
+            raise IOError("Unable to encode image as {}".format(ext))
+        return buf.tobytes()
+
+    def _store(self, name, data):
+        if self._archive is None:
+            path = os.path.join(self.dest, name)
+            dirname = os.path.dirname(path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            with open(path, "wb") as outfile:
+                outfile.write(data)
+        elif isinstance(self._archive, tarfile.TarFile):
+            info = tarfile.TarInfo(name=name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            with self._lock:
+                self._archive.addfile(info, io.BytesIO(data))
+        else:
+            with self._lock:
+                self._archive.writestr(name, data)
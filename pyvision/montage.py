@@ -8,10 +8,18 @@ in a single window. This is useful for visualizing
 a set of results.
 """
 
+import collections
+import concurrent.futures as cf
+import functools
+import os
+import queue
+import threading
+import time
 import pyvision as pv3
 import cv2
 import weakref
 import numpy as np
+from pyvision.parallel import prefetch_map
 
 
 class ImageMontage(object):
@@ -22,14 +30,17 @@ class ImageMontage(object):
     """
 
     def __init__(self, image_list, layout=(2, 4), tile_size=(64, 48), gutter=2, by_row=True, labels='index',
-                 keep_aspect=True, highlight_selected=False):
+                 keep_aspect=True, highlight_selected=False, cache_size=None, num_images=None, prefetch=None):
         """
         Constructor
 
         Parameters
         ----------
-        image_list: list
-            A list of pyvision images that you wish to display as a montage.
+        image_list: list, VideoInterface, or callable
+            The images that you wish to display as a montage. This may be a list of pyvision images,
+            or one of the following lazy sources, from which only the images being shown are loaded:
+            a list of image file paths, a random-access pyvision video (such as a VideoFromFileList),
+            or a function that takes an index and returns the pyvision image at that index.
         layout: tuple (int, int)
             (rows,cols) that indicates the number of tiles to show in a single montage page, oriented in a grid.
         tile_size: tuple (int, int)
@@ -51,11 +62,21 @@ class ImageMontage(object):
             highlight. This will toggle, such that if an image is clicked a second time, the highlighting
             will be removed. The methods get_highlighted and set_highlighted can be used to set/retrieve the
             images in the montage that are highlighted.
+        cache_size: int or None
+            The number of tile thumbnails to keep in a least-recently-used cache, so that scrolling
+            back to a page doesn't re-render its thumbnails. Defaults to four pages' worth. A cached
+            thumbnail is discarded if its image is modified (see Image.mark_modified).
+        num_images: int or None
+            The number of images, required when image_list is a function.
+        prefetch: boolean or None
+            If True, then the thumbnails for the previous and next pages are rendered on a background
+            thread while the current page is shown. None (default) means True for lazy sources.
         """
         self._tileSize = tile_size
         self._rows = layout[0]
         self._cols = layout[1]
-        self._images = image_list
+        (self._images, lazy) = _as_image_source(image_list, num_images)
+        self._lazy = lazy
         self._gutter = gutter
         self._by_row = by_row
         self._txtcolor = (255, 255, 255)
@@ -63,13 +84,19 @@ class ImageMontage(object):
         self._labels = labels
         self._clickHandler = ClickHandler(self)
         self._keep_aspect = keep_aspect
-        self._image_positions = []
         self._select_handler = None
         self._highlighted = highlight_selected
         self._selected_tiles = []  # which images have been selected (or clicked) by user
+        self._thumbnails = collections.OrderedDict()  # LRU cache of the BGR tile thumbnails
+        self._cache_size = 4 * self._rows * self._cols if cache_size is None else cache_size
+        self._cache_lock = threading.Lock()  # the cache is shared with the prefetch thread
+        self._pending = {}  # image index -> future of its thumbnail, being prefetched
+        if prefetch is None:
+            prefetch = lazy
+        self._pool = cf.ThreadPoolExecutor(max_workers=1) if prefetch else None
 
         # check if we need to allow for scroll-arrow padding
-        if self._rows * self._cols < len(image_list):
+        if self._rows * self._cols < len(self._images):
             if by_row:
                 self._xpad = 0
                 self._ypad = 25
@@ -110,23 +137,20 @@ class ImageMontage(object):
             # so display increment arrow
             cv2.fillConvexPoly(self._cvMontageImage, self._incrArrow, (125, 125, 125))
 
-        self._image_positions = []
+        for img_num in range(img_ptr, min(img_ptr + self._rows * self._cols, len(self._images))):
+            self._composite(self._thumbnail(img_num), self._tile_position(img_num - img_ptr), img_num)
+
+        if self._pool is not None:
+            self._prefetch()
+
+    def _tile_position(self, k):
+        """
+        Internal method that returns the (row, col) of the k-th tile of a page.
+        """
         if self._by_row:
-            for row in range(self._rows):
-                for col in range(self._cols):
-                    if img_ptr > len(self._images) - 1:
-                        break
-                    tile = self._images[img_ptr].as_annotated(as_type="PV")
-                    self._composite(tile, (row, col), img_ptr)
-                    img_ptr += 1
-        else:
-            for col in range(self._cols):
-                for row in range(self._rows):
-                    if img_ptr > len(self._images) - 1:
-                        break
-                    tile = self._images[img_ptr].as_annotated(as_type="PV")
-                    self._composite(tile, (row, col), img_ptr)
-                    img_ptr += 1
+            return divmod(k, self._cols)
+        (col, row) = divmod(k, self._rows)
+        return (row, col)
 
     def as_image(self):
         """
@@ -136,6 +160,109 @@ class ImageMontage(object):
         """
         return pv3.Image(self._cvMontageImage)
 
+    def save_pages(self, dest, pattern="page_{:04d}", fmt=".jpg", quality=None, num_workers=4):
+        """
+        Renders every page of the montage, without a display, and writes each page
+        to disk as it is finished, so only one page is held in memory at a time. The
+        thumbnails are rendered in parallel. The pages are drawn without the scroll
+        arrows, and the current page of the montage is unchanged.
+
+        Parameters
+        ----------
+        dest: str
+            A directory, or a .tar or .zip archive, see pv3.ImageWriter
+        pattern: str
+            The name of each page file, formatted with the page number (starting at 0)
+        fmt: str
+            The encoding format of the pages, such as ".jpg" or ".png"
+        quality: int or None
+            The encoding quality, see pyvision.image.encode_params
+        num_workers: int
+            The number of threads rendering thumbnails
+
+        Returns
+        -------
+        The list of the page file names written
+        """
+        page_size = self._rows * self._cols
+        page = np.zeros((self._size[1] - 2 * self._ypad, self._size[0] - 2 * self._xpad, 3), dtype='uint8')
+        names = []
+        thumbs = prefetch_map(self._export_thumbnail, range(len(self._images)),
+                              num_workers=num_workers, read_ahead=page_size)
+        with pv3.ImageWriter(dest, fmt=fmt, quality=quality) as writer:
+            for (img_num, thumb) in thumbs:
+                k = img_num % page_size
+                self._composite(thumb, self._tile_position(k), img_num, canvas=page, origin=(0, 0))
+                if k == page_size - 1 or img_num == len(self._images) - 1:
+                    names.append(pattern.format(len(names)) + writer.fmt)
+                    writer.write(page, name=names[-1])  # the writer copies the page
+                    page[:] = 0
+        return names
+
+    def save_mosaic(self, filename, cols=None, strip_rows=None, num_workers=4):
+        """
+        Renders all of the images as a single mosaic, which may be far larger than
+        could be held in memory. The mosaic is assembled in horizontal strips of tile
+        rows, which are written into a memory-mapped output file one at a time, while
+        the thumbnails of the following tiles are rendered in parallel. Tiles are placed
+        in row-major order, and the current page of the montage is unchanged.
+
+        Parameters
+        ----------
+        filename: str
+            The output file, which must be either a binary .ppm image (which most image
+            tools can read), or a .npy file holding the BGR mosaic as a (h, w, 3) uint8
+            array, which can be opened with np.load(filename, mmap_mode="r").
+        cols: int or None
+            The number of tiles in each row of the mosaic. Defaults to the number of
+            columns in the montage layout.
+        strip_rows: int or None
+            The number of tile rows in each strip. Defaults to the number of rows in the
+            montage layout.
+        num_workers: int
+            The number of threads rendering thumbnails
+
+        Returns
+        -------
+        The (width, height) of the mosaic
+        """
+        cols = self._cols if cols is None else cols
+        strip_rows = self._rows if strip_rows is None else strip_rows
+        (tile_w, tile_h) = self._tileSize
+        gutter = self._gutter
+        rows = -(-len(self._images) // cols)
+        width = cols * (tile_w + gutter) + gutter
+        height = rows * (tile_h + gutter) + gutter
+
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == ".ppm":
+            header = "P6\n{} {}\n255\n".format(width, height).encode("ascii")
+            with open(filename, "wb") as outfile:
+                outfile.write(header)
+                outfile.truncate(len(header) + height * width * 3)
+            mosaic = np.memmap(filename, dtype='uint8', mode="r+", offset=len(header), shape=(height, width, 3))
+        elif ext == ".npy":
+            mosaic = np.lib.format.open_memmap(filename, mode="w+", dtype='uint8', shape=(height, width, 3))
+        else:
+            raise ValueError("The mosaic must be saved as a .ppm or .npy file, not {}".format(filename))
+
+        # each strip holds strip_rows of tiles, and the gutter above them
+        strip = np.zeros((strip_rows * (tile_h + gutter) + gutter, width, 3), dtype='uint8')
+        strip_size = strip_rows * cols
+        thumbs = prefetch_map(self._export_thumbnail, range(len(self._images)),
+                              num_workers=num_workers, read_ahead=strip_size)
+        for (img_num, thumb) in thumbs:
+            (row, col) = divmod(img_num, cols)
+            self._composite(thumb, (row % strip_rows, col), img_num, canvas=strip, origin=(0, 0))
+            if img_num % strip_size == strip_size - 1 or img_num == len(self._images) - 1:
+                y = (row - row % strip_rows) * (tile_h + gutter)
+                rows_h = min(len(strip), height - y)
+                mosaic[y:y + rows_h] = strip[:rows_h, :, ::-1] if ext == ".ppm" else strip[:rows_h]
+                strip[:] = 0
+        mosaic.flush()
+        del mosaic
+        return width, height
+
     def show(self, window_title="Image Montage", pos=None, delay=0):
         """
         Will display the montage image, as well as register the mouse handling callback
@@ -200,32 +327,90 @@ class ImageMontage(object):
         """
         if self._by_row:
             # scroll up/down to expose next/prev row
-            decr_rect = pv3.Rect(0, 0, self._size[0], self._ypad)
-            incr_rect = pv3.Rect(0, self._size[1] - self._ypad, self._size[0], self._ypad)
+            (pt, pad, extent) = (y, self._ypad, self._size[1])
         else:
             # scroll left/right to expose next/prev col
-            decr_rect = pv3.Rect(0, 0, self._xpad, self._size[1])
-            incr_rect = pv3.Rect(self._size[0] - self._xpad, 0, self._xpad, self._size[1])
+            (pt, pad, extent) = (x, self._xpad, self._size[0])
 
-        pt = pv3.Point(x, y)
-        if incr_rect.contains(pt):
-            # print "DEBUG: Increment Region"
+        if pt >= extent - pad:
             return 1
-        elif decr_rect.contains(pt):
-            # print "DEBUG: Decrement Region"
+        elif pt < pad:
             return -1
-        else:
-            # print "DEBUG: Neither Region"
-            for img, imgNum, rect in self._image_positions:
-                if rect.contains(pt):
-                    if imgNum in self._selected_tiles:
-                        self._selected_tiles.remove(imgNum)
-                    else:
-                        self._selected_tiles.append(imgNum)
-                    if self._select_handler is not None:
-                        imgLabel = self._labels[imgNum] if type(self._labels) == list else str(imgNum)
-                        self._select_handler(img, imgNum, {"imgLabel":imgLabel})
-            return 0
+
+        img_num = self._tile_at(x, y)
+        if img_num is not None:
+            if img_num in self._selected_tiles:
+                self._selected_tiles.remove(img_num)
+            else:
+                self._selected_tiles.append(img_num)
+            if self._highlighted:
+                self._redraw_tile(img_num)
+            if self._select_handler is not None:
+                imgLabel = self._labels[img_num] if type(self._labels) == list else str(img_num)
+                self._select_handler(self._images[img_num], img_num, {"imgLabel": imgLabel})
+        return 0
+
+    def _tile_at(self, x, y):
+        """
+        Internal method that returns the index of the image whose tile is at
+        montage pixel (x,y), or None if (x,y) is not within a tile.
+        """
+        (tw, th) = self._tileSize
+        (col, dx) = divmod(x - self._xpad - self._gutter, tw + self._gutter)
+        (row, dy) = divmod(y - self._ypad - self._gutter, th + self._gutter)
+        if not (0 <= row < self._rows and 0 <= col < self._cols) or dx >= tw or dy >= th:
+            return None  # outside the grid, or in a gutter
+        k = row * self._cols + col if self._by_row else col * self._rows + row
+        img_num = self._imgPtr + k
+        return img_num if img_num < len(self._images) else None
+
+    def _tile_origin(self, pos, origin=None):
+        """
+        Internal method that returns the (x,y) of the top left pixel of the tile at
+        pos=(row,col), where origin is the top left corner of the layout grid.
+        """
+        (row, col) = pos
+        (x0, y0) = (self._xpad, self._ypad) if origin is None else origin
+        return (col * (self._tileSize[0] + self._gutter) + self._gutter + x0,
+                row * (self._tileSize[1] + self._gutter) + self._gutter + y0)
+
+    def _redraw_tile(self, img_num):
+        """
+        Internal method that redraws a single tile of the current page, such as when its
+        selection is toggled, without redrawing the whole montage. The highlight is drawn
+        over the tile's border, so a gutter of at least 2 pixels is needed to erase it
+        without damaging the neighboring tiles, otherwise the montage is redrawn.
+        """
+        if self._gutter < 2:
+            self.draw()
+            return
+
+        # erase the tile, and any highlight in the gutter around it
+        pos = self._tile_position(img_num - self._imgPtr)
+        (x, y) = self._tile_origin(pos)
+        (tw, th) = self._tileSize
+        self._cvMontageImage[y - 2:y + th + 2, x - 2:x + tw + 2] = 0
+        self._composite(self._thumbnail(img_num), pos, img_num)
+
+        # restore the highlights of the neighboring tiles, which share the gutter
+        (row, col) = pos
+        for (nrow, ncol) in [(row + dr, col + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)]:
+            if (nrow, ncol) == pos or not (0 <= nrow < self._rows and 0 <= ncol < self._cols):
+                continue
+            k = nrow * self._cols + ncol if self._by_row else ncol * self._rows + nrow
+            if self._imgPtr + k in self._selected_tiles and self._imgPtr + k < len(self._images):
+                self._draw_highlight(self._cvMontageImage, self._tile_origin((nrow, ncol)))
+
+    def _draw_highlight(self, canvas, tile_origin):
+        """
+        Internal method that draws a highlight around the tile at tile_origin=(x,y).
+        """
+        (x, y) = tile_origin
+        cv2.rectangle(canvas,
+                      (x, y),
+                      (x + self._tileSize[0] - 1, y + self._tileSize[1] - 1),
+                      (0, 255, 255),
+                      thickness=4)
 
     def _init_decrement_arrow(self):
         """
@@ -303,45 +488,122 @@ class ImageMontage(object):
 
         self._imgPtr = tmp_ptr
 
-    def _composite(self, img, pos, img_num):
+    def _thumbnail_key(self, img_num):
+        if self._lazy:
+            return (img_num, self._tileSize, self._keep_aspect)
+        img = self._images[img_num]
+        return (img_num, self._tileSize, self._keep_aspect, id(img), img.version)
+
+    def _thumbnail(self, img_num):
+        """
+        Internal method that returns the BGR thumbnail of an image, rendering it
+        with its annotations if it isn't already in the cache.
+        """
+        key = self._thumbnail_key(img_num)
+        with self._cache_lock:
+            thumb = self._thumbnails.get(key)
+            if thumb is not None:
+                self._thumbnails.move_to_end(key)
+                return thumb
+
+        future = self._pending.pop(img_num, None)
+        if future is not None and not future.cancel():
+            return future.result()  # being prefetched, so wait for it
+        return self._render_thumbnail(img_num, key)
+
+    def _export_thumbnail(self, img_num):
+        """
+        Internal method that returns the BGR thumbnail of an image for save_pages or
+        save_mosaic, which may be called by several threads at once. A cached thumbnail
+        is used if there is one, but new thumbnails are not cached, so that exporting
+        doesn't flush the thumbnails of the pages being viewed.
+        """
+        key = self._thumbnail_key(img_num)
+        with self._cache_lock:
+            thumb = self._thumbnails.get(key)
+        if thumb is None:
+            thumb = self._render_thumbnail(img_num, key, cache=False)
+        return thumb
+
+    def _render_thumbnail(self, img_num, key, cache=True):
+        """
+        Internal method that renders the thumbnail of an image, and adds it to the cache
+        unless cache is False. This may be called by the prefetch thread.
+        """
+        tile = self._images[img_num].as_annotated(as_type="PV")
+        thumb = tile.resize(self._tileSize, keep_aspect=self._keep_aspect)
+        if thumb.ndim == 2:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_GRAY2BGR)
+        elif thumb.shape[2] == 1:
+            thumb = cv2.cvtColor(thumb[:, :, 0], cv2.COLOR_GRAY2BGR)
+
+        if cache and self._cache_size > 0:
+            with self._cache_lock:
+                self._thumbnails[key] = thumb
+                if len(self._thumbnails) > self._cache_size:
+                    self._thumbnails.popitem(last=False)  # discard the least recently used
+        return thumb
+
+    def _prefetch(self):
+        """
+        Internal method that queues the rendering of the thumbnails of the previous
+        and next pages on the prefetch thread, and cancels any queued renderings that
+        are no longer needed.
+        """
+        page_size = self._rows * self._cols
+        ptr = self._imgPtr
+        wanted = list(range(ptr + page_size, min(ptr + 2 * page_size, len(self._images)))) + \
+            list(range(max(ptr - page_size, 0), ptr))
+
+        for img_num in list(self._pending):
+            if img_num not in wanted and self._pending[img_num].cancel():
+                del self._pending[img_num]
+
+        for img_num in wanted:
+            if img_num in self._pending:
+                continue
+            key = self._thumbnail_key(img_num)
+            with self._cache_lock:
+                if key in self._thumbnails:
+                    continue
+            self._pending[img_num] = self._pool.submit(self._render_thumbnail, img_num, key)
+
+    def close(self):
+        """
+        Stops the prefetch thread, if any. The montage can still be drawn afterwards.
+        """
+        if self._pool is not None:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending = {}
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _composite(self, thumb, pos, img_num, canvas=None, origin=None):
         """
         Internal method to composite the thumbnail of a given image into the
         correct position, given by (row,col).
 
         Parameters
         ----------
-        img: pyvision Image
-            The image from which a thumbnail will be composited onto the montage
+        thumb: ndarray
+            The BGR thumbnail to be composited onto the montage, see _thumbnail
         pos: tuple
             A tuple (row,col) for the position in the montage layout
         img_num: int
             The image index of the tile being drawn, this helps us display the
             appropriate label in the lower left corner if self._labels is not None.
+        canvas: ndarray or None
+            The BGR image to composite onto. If None, the montage image is used.
+        origin: tuple or None
+            The (x,y) of the top left corner of the layout grid in the canvas, which
+            defaults to just inside the scroll-arrow padding of the montage image.
         """
-        (row, col) = pos
-
-        tile = img.resize(self._tileSize, keep_aspect=self._keep_aspect)
-
-        pos_x = col * (self._tileSize[0] + self._gutter) + self._gutter + self._xpad
-        pos_y = row * (self._tileSize[1] + self._gutter) + self._gutter + self._ypad
-
-        cvImg = self._cvMontageImage
-        cvTile = tile.data
-        roi = pv3.Rect(pos_x, pos_y, self._tileSize[0], self._tileSize[1])
-
-        # Save the position of this image
-        self._image_positions.append([self._images[img_num], img_num, roi])
-
-        depth = cvTile.shape[-1] if len(cvTile.shape) == 3 else 1
-
-        if depth == 1:
-            cvTileBGR = cv2.cvtColor(cvTile, cv2.COLOR_GRAY2BGR)
-        else:
-            cvTileBGR = cvTile
+        (pos_x, pos_y) = self._tile_origin(pos, origin)
+        cvImg = self._cvMontageImage if canvas is None else canvas
 
         # copy pixels of tile onto appropriate location in montage image
-        (minx, miny, maxx, maxy) = pv3.integer_bounds(roi)
-        cvImg[miny:(maxy+1), minx:(maxx+1), :] = cvTileBGR
+        cvImg[pos_y:pos_y + self._tileSize[1], pos_x:pos_x + self._tileSize[0], :] = thumb
 
         if self._labels == 'index':
             # draw image number in lower left corner, respective to ROI
@@ -369,11 +631,155 @@ class ImageMontage(object):
 
         if self._highlighted and (img_num in self._selected_tiles):
             # draw a highlight around this image
-            cv2.rectangle(cvImg,
-                          (int(minx), int(miny)),
-                          (int(maxx), int(maxy)),
-                          (0, 255, 255),
-                          thickness=4)
+            self._draw_highlight(cvImg, (pos_x, pos_y))
+
+
+def compose_montage(batch, layout=None, tile_size=None, gutter=2, by_row=True, labels='index',
+                    out=None, as_type="CV"):
+    """
+    Composes a montage image from a batch of same-sized images, such as the frames in an
+    ImageBuffer, much faster than an ImageMontage. The batch is resized in one step, and
+    laid out into the grid by a single reshaped assignment, and the labels are drawn from
+    cached sprites. The result looks like an ImageMontage page (without scroll arrows),
+    except that the tiles are stretched to the tile size, and there is no click handling.
+
+    Parameters
+    ----------
+    batch: ndarray or list
+        An (N,h,w,c) or (N,h,w) uint8 array of BGR or grayscale images, or a list of
+        pyvision images or cv2 ndarrays that all have the same shape.
+    layout: tuple (int, int) or None
+        (rows,cols) of the montage grid. Defaults to a single row of all the images.
+        If the batch has more images than the grid has tiles, then only the first
+        rows*cols are shown.
+    tile_size: tuple (int, int) or None
+        The size (width, height) of each tile. Defaults to the size of the images. When the
+        image height is an exact multiple of the tile height, the whole batch is resized in a
+        single call, otherwise image by image. Either way, cv2.INTER_AREA is used.
+    gutter: int
+        The width in pixels of the gutter between tiles.
+    by_row: boolean
+        If true, the tiles are placed in row-major order, otherwise in column-major order.
+    labels: list<str>, 'index', or None
+        As for ImageMontage, the label shown at the lower left corner of each tile.
+    out: ndarray or None
+        A (H,W,3) uint8 array of the montage size, in which to compose the montage. Reusing
+        the same array for every frame avoids allocating a new montage image each time.
+    as_type: str
+        "CV" (default) to return the BGR montage as an ndarray, or "PV" for a pyvision image
+
+    Returns
+    -------
+    The montage image
+    """
+    if not isinstance(batch, np.ndarray):
+        batch = np.stack([img.data if isinstance(img, pv3.Image) else img for img in batch])
+    if batch.ndim == 4 and batch.shape[3] == 1:
+        batch = batch[:, :, :, 0]
+    if batch.dtype != np.uint8:
+        batch = batch.astype('uint8')
+    (n, h, w) = batch.shape[:3]
+    (rows, cols) = (1, n) if layout is None else layout
+    (tw, th) = (w, h) if tile_size is None else tile_size
+    n = min(n, rows * cols)
+    batch = batch[:n]
+
+    # resize the batch into a zero-padded array of rows*cols tiles
+    tiles = np.zeros((rows * cols, th, tw) + batch.shape[3:], dtype='uint8')
+    if (w, h) == (tw, th):
+        tiles[:n] = batch
+    elif h % th == 0:
+        # with whole blocks of rows per tile, the area averaging of the batch stacked into one
+        # tall image never mixes two images, so the batch is resized by a single call
+        stacked = np.ascontiguousarray(batch).reshape((n * h, w) + batch.shape[3:])
+        cv2.resize(stacked, (tw, n * th), dst=tiles[:n].reshape((n * th, tw) + batch.shape[3:]),
+                   interpolation=cv2.INTER_AREA)
+    else:
+        for i in range(n):
+            cv2.resize(batch[i], (tw, th), dst=tiles[i], interpolation=cv2.INTER_AREA)
+    if tiles.ndim == 3:
+        tiles = tiles[..., np.newaxis]  # broadcasts to BGR when laid out
+
+    size = (rows * (th + gutter) + gutter, cols * (tw + gutter) + gutter, 3)
+    if out is None:
+        out = np.zeros(size, dtype='uint8')
+    elif out.shape != size or out.dtype != np.uint8:
+        raise ValueError("out must be a uint8 array of shape {}, not {}".format(size, out.shape))
+    else:
+        out[:] = 0
+
+    # a view of the canvas (less the top and left gutters) as a grid of tiles plus their gutters
+    grid = out[gutter:, gutter:]
+    grid.shape = (rows, th + gutter, cols, tw + gutter, 3)  # raises rather than copies
+    if by_row:
+        grid[:, :th, :, :tw] = tiles.reshape((rows, cols) + tiles.shape[1:]).transpose(0, 2, 1, 3, 4)
+    else:
+        grid[:, :th, :, :tw] = tiles.reshape((cols, rows) + tiles.shape[1:]).transpose(1, 2, 0, 3, 4)
+
+    if labels is not None:
+        for i in range(n):
+            lbltext = "%d" % i if labels == 'index' else str(labels[i])
+            sprite = _label_sprite(lbltext, gutter)
+            if sprite is None:
+                continue
+            (row, col) = divmod(i, cols) if by_row else divmod(i, rows)[::-1]
+            (sh, sw) = (min(sprite.shape[0], th), min(sprite.shape[1], tw))
+            y = row * (th + gutter) + gutter + th - sh
+            x = col * (tw + gutter) + gutter
+            out[y:y + sh, x:x + sw] = sprite[sprite.shape[0] - sh:, :sw]
+
+    return pv3.Image(out) if as_type == "PV" else out
+
+
+@functools.lru_cache(maxsize=1024)
+def _label_sprite(lbltext, gutter):
+    """
+    Internal function that renders a tile label, as drawn by ImageMontage._composite,
+    into a small BGR image that is aligned with the bottom left corner of the tile.
+    Returns None for an empty label.
+    """
+    ((tw, th), _) = cv2.getTextSize(lbltext, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+    if tw <= 0 or th <= 0:
+        return None
+    sprite = np.zeros((th + gutter + 1, tw + 2, 3), dtype='uint8')
+    cv2.putText(sprite, lbltext, (1, th - 1), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255))
+    sprite.flags.writeable = False
+    return sprite
+
+
+def _as_image_source(image_list, num_images=None):
+    """
+    Returns a tuple (images, lazy), where images is an indexable sequence of the
+    pyvision images of an ImageMontage, and lazy is True if they are loaded on access.
+    """
+    if isinstance(image_list, pv3.VideoInterface):
+        if not image_list._random_access:
+            raise ValueError("An ImageMontage requires a video that supports random access.")
+        return _LazyImages(image_list.__getitem__, image_list.num_frames), True
+    if callable(image_list):
+        if num_images is None:
+            raise ValueError("num_images is required when the montage images are given by a function.")
+        return _LazyImages(image_list, num_images), True
+    if len(image_list) > 0 and isinstance(image_list[0], str):
+        return _LazyImages(lambda idx: pv3.Image(image_list[idx]), len(image_list)), True
+    return image_list, False
+
+
+class _LazyImages(object):
+    """
+    A read-only sequence of images, which are loaded when accessed.
+    """
+    def __init__(self, loader, num_images):
+        self._loader = loader
+        self._num_images = num_images
+
+    def __len__(self):
+        return self._num_images
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self._num_images:
+            raise IndexError("Image index {} is out of range.".format(idx))
+        return self._loader(idx)
 
 
 class ClickHandler(object):
@@ -401,14 +807,334 @@ class ClickHandler(object):
 
         # print "event",event
         if event == cv2.EVENT_LBUTTONDOWN:
+            # a click on a tile redraws just that tile, if needed, in _check_click_region
             rc = montage._check_click_region(x, y)
             if rc == -1 and montage._imgPtr > 0:
                 # user clicked in the decrement region
                 montage._decr()
+                montage.draw()
             elif rc == 1 and montage._imgPtr < (len(montage._images) - (montage._rows * montage._cols)):
                 montage._incr()
+                montage.draw()
             else:
                 pass # do nothing
 
-            montage.draw()
             cv2.imshow(window, montage._cvMontageImage)
+
+
+# marks the end of a source's frames in its queue
+_END_OF_VIDEO = object()
+
+
+class VideoMontage(pv3.VideoInterface):
+    """
+    Plays several videos side by side, as a grid of tiles in a single video.
+
+    Each source video is decoded, and its frames resized to the tile size, by
+    its own reader thread, so the sources are decoded in parallel. The montage
+    frames are composed into a single, reused canvas, updating only the tiles
+    whose frames have changed.
+
+    The sources are kept in sync either by frame number or by timestamp (see
+    VideoInterface.timestamp). In realtime mode, the montage advances with the
+    wall clock at the given fps, and a source that falls behind skips frames to
+    catch up, while its tile shows its latest frame. Frames that are already late
+    are skipped by the reader thread without being decoded (see VideoInterface.skip),
+    so a source whose decoding can't keep up still stays in sync. Otherwise, every montage frame
+    waits for all of the sources to be decoded up to that point.
+
+    A VideoMontage is itself a pyvision video, so it can be iterated, played
+    (see VideoInterface.play), or saved.
+
+    Example
+    -------
+    vids = [pv3.Video(uri) for uri in camera_uris]
+    vm = pv3.VideoMontage(vids, tile_size=(320, 240), labels=camera_names, sync="time")
+    vm.play()
+    vm.close()
+    """
+
+    def __init__(self, videos, layout=None, tile_size=(320, 240), gutter=2, labels='index',
+                 keep_aspect=True, sync="frame", fps=None, realtime=True, max_queue=4):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        videos: list<VideoInterface>
+            The source videos
+        layout: tuple (int, int) or None
+            (rows,cols) of the montage grid, which must have a tile for each video. Defaults
+            to the smallest nearly-square grid that fits all of the videos.
+        tile_size: tuple (int, int)
+            The size (width, height) of each tile
+        gutter: int
+            The width in pixels of the gutter between tiles
+        labels: list<str>, 'index', or None
+            A label for each video, shown at the lower left corner of its tile. 'index' (default)
+            labels each tile with the position of its video in the list, and None shows no labels.
+        keep_aspect: boolean
+            If true, the aspect ratio of the source frames will be preserved in the tiles.
+        sync: str
+            "frame" (default) to show the frames with the same frame number from each video
+            together, or "time" to show the frames with the same timestamp, measured from the
+            first frame of each video. Use "time" for sources with different frame rates, or
+            live streams.
+        fps: float or None
+            The frame rate of the montage. Defaults to the highest frame rate of the sources,
+            or 30 if none of them are known.
+        realtime: boolean
+            If True (default), the montage is paced by the wall clock, dropping frames from
+            sources that lag behind. If False, every frame is shown (with sync="frame") and
+            the montage advances as fast as the sources are decoded, which is useful for
+            saving a montage to a file.
+        max_queue: int
+            The number of decoded frames each reader thread may get ahead of the montage
+        """
+        if sync not in ("frame", "time"):
+            raise ValueError("sync must be 'frame' or 'time', not {}".format(sync))
+        if layout is None:
+            cols = int(np.ceil(np.sqrt(len(videos))))
+            layout = (int(np.ceil(len(videos) / cols)), cols)
+        if layout[0] * layout[1] < len(videos):
+            raise ValueError("The layout {} has too few tiles for {} videos.".format(layout, len(videos)))
+        pv3.VideoInterface.__init__(self)
+
+        self.videos = videos
+        self._rows, self._cols = layout
+        self._tileSize = tile_size
+        self._gutter = gutter
+        self._labels = labels
+        self._keep_aspect = keep_aspect
+        self._sync = sync
+        self._realtime = realtime
+        self._max_queue = max_queue
+        known = [vid.fps for vid in videos if vid.fps]
+        self.fps = fps if fps is not None else (max(known) if known else 30.0)
+
+        self._canvas = np.zeros((self._rows * (tile_size[1] + gutter) + gutter,
+                                 self._cols * (tile_size[0] + gutter) + gutter, 3), dtype='uint8')
+        self._sources = None  # the reader state of each video, created when playback starts
+        self._stop = threading.Event()
+        self._start_time = None
+
+    def __next__(self):
+        """
+        Composes and returns the next frame of the montage. Note that the returned image
+        wraps the montage canvas, which is overwritten by the following frame.
+        """
+        if self._sources is None:
+            self._start_readers()
+        elif self._stop.is_set():
+            raise StopIteration  # closed
+
+        # the sync target of this frame, as a frame number or a time in seconds
+        if self._realtime:
+            step = int((time.perf_counter() - self._start_time) * self.fps)
+            if self.current_frame_num > 0 and step < self.current_frame_num:
+                # running ahead of the clock, so wait for the time of the next frame
+                time.sleep(max(self._start_time + self.current_frame_num / self.fps - time.perf_counter(), 0))
+                step = self.current_frame_num
+        else:
+            step = self.current_frame_num
+        target = step + 1 if self._sync == "frame" else step / self.fps
+
+        changed = False
+        for (idx, src) in enumerate(self._sources):
+            if self._advance(src, target):
+                self._draw_tile(idx, src.frame)
+                changed = True
+
+        if not changed and all(src.done for src in self._sources):
+            self.close()
+            raise StopIteration
+
+        self.current_frame_num = step + 1
+        self.current_frame = pv3.Image(self._canvas)
+        return self._get_resized()
+
+    def frames(self, copy=False):
+        """
+        A generator of the montage frames, until all of the videos have ended.
+
+        Parameters
+        ----------
+        copy: boolean
+            If False (default), each frame wraps the reused montage canvas, so it is only
+            valid until the next frame is composed. If True, each frame is a copy.
+
+        Returns
+        -------
+        A generator of pyvision images
+        """
+        for frame in self:
+            yield pv3.Image(frame.data.copy()) if copy else frame
+
+    def play(self, window="Video Montage", pos=None, delay=1, **kwargs):
+        """
+        Plays the montage, see VideoInterface.play for the parameters. The default
+        delay is 1 ms, since in realtime mode the montage is already paced by its fps.
+        """
+        return pv3.VideoInterface.play(self, window=window, pos=pos, delay=delay, **kwargs)
+
+    def reset(self):
+        """
+        Stops playback, and resets the montage and all of the source videos to the start.
+        """
+        self.close()
+        self._sources = None
+        pv3.VideoInterface.reset(self)
+        for vid in self.videos:
+            vid.reset()
+        self._canvas[:] = 0
+
+    def dropped_frames(self):
+        """
+        Returns a list of the number of frames of each video that were skipped, rather
+        than shown, to keep up with the montage.
+        """
+        if self._sources is None:
+            return [0] * len(self.videos)
+        return [src.dropped + src.skipped for src in self._sources]
+
+    def close(self):
+        """
+        Stops the reader threads. The montage can be played again after calling reset().
+        """
+        if self._sources is None or self._stop.is_set():
+            return
+        self._stop.set()
+        for src in self._sources:
+            while src.thread.is_alive():
+                try:
+                    src.queue.get(timeout=0.05)  # unblock a reader waiting on a full queue
+                except queue.Empty:
+                    pass
+                src.thread.join(timeout=0.05)
+
+    def _start_readers(self):
+        self._stop.clear()
+        self._sources = [_MontageSource(vid, self._max_queue) for vid in self.videos]
+        self._start_time = time.perf_counter()
+        for src in self._sources:
+            src.thread = threading.Thread(target=self._read_video, args=(src,), daemon=True)
+            src.thread.start()
+
+    def _read_video(self, src):
+        """
+        Reader thread, decodes the frames of a video and queues their tiles, along
+        with their frame numbers or timestamps. In realtime mode, frames that would be
+        replaced before they could be shown are skipped without decoding them.
+        """
+        vid = src.video
+        # the expected interval between the frames' sync keys, to predict the key of the next frame
+        period = 1 if self._sync == "frame" else (1.0 / vid.fps if vid.fps else None)
+        try:
+            first_time = None
+            key = None
+            while not self._stop.is_set():
+                late = self._realtime and key is not None and period is not None and \
+                    key + 2 * period <= self._clock_target()
+                try:
+                    if late:
+                        vid.skip()
+                    else:
+                        img = next(vid)
+                except StopIteration:
+                    break
+                if self._sync == "frame":
+                    key = vid.current_frame_num
+                else:
+                    timestamp = vid.timestamp()
+                    if timestamp is None:
+                        raise ValueError("Video {} has no timestamps, so can't be synchronized by time."
+                                         " Set its fps, or use sync='frame'.".format(self.videos.index(vid)))
+                    first_time = timestamp if first_time is None else first_time
+                    key = timestamp - first_time
+                if late:
+                    src.skipped += 1
+                    continue
+                tile = img.resize(self._tileSize, keep_aspect=self._keep_aspect)
+                if tile.ndim == 2:
+                    tile = cv2.cvtColor(tile, cv2.COLOR_GRAY2BGR)
+                self._put(src, (key, tile))
+        except Exception as e:
+            self._put(src, e)  # re-raised by the montage
+            return
+        self._put(src, _END_OF_VIDEO)
+
+    def _clock_target(self):
+        """
+        The sync target of the montage frame that is due now, by the wall clock.
+        """
+        step = int((time.perf_counter() - self._start_time) * self.fps)
+        return step + 1 if self._sync == "frame" else step / self.fps
+
+    def _put(self, src, item):
+        while not self._stop.is_set():
+            try:
+                src.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _advance(self, src, target):
+        """
+        Advances a source to its latest frame at or before the sync target, without
+        waiting for it in realtime mode.
+
+        Returns
+        -------
+        True if the source has a new frame to show
+        """
+        advanced = False
+        while not src.done:
+            if src.pending is None:
+                try:
+                    item = src.queue.get(block=not self._realtime)
+                except queue.Empty:
+                    break  # the source is lagging, so keep showing its latest frame
+                if item is _END_OF_VIDEO:
+                    src.done = True
+                    break
+                if isinstance(item, Exception):
+                    self.close()
+                    raise item
+                src.pending = item
+            if src.pending[0] > target:
+                break
+            if advanced:
+                src.dropped += 1  # the frame being replaced was never shown
+            (_, src.frame) = src.pending
+            src.pending = None
+            advanced = True
+        return advanced
+
+    def _draw_tile(self, idx, tile):
+        (row, col) = divmod(idx, self._cols)
+        (tw, th) = self._tileSize
+        x = col * (tw + self._gutter) + self._gutter
+        y = row * (th + self._gutter) + self._gutter
+        self._canvas[y:y + th, x:x + tw] = tile
+
+        if self._labels is not None:
+            lbltext = "%d" % idx if self._labels == 'index' else str(self._labels[idx])
+            sprite = _label_sprite(lbltext, self._gutter)
+            if sprite is not None:
+                (sh, sw) = (min(sprite.shape[0], th), min(sprite.shape[1], tw))
+                self._canvas[y + th - sh:y + th, x:x + sw] = sprite[sprite.shape[0] - sh:, :sw]
+
+
+class _MontageSource(object):
+    """
+    The playback state of one video in a VideoMontage.
+    """
+    def __init__(self, video, max_queue):
+        self.video = video
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self.frame = None  # the tile of the frame being shown
+        self.pending = None  # the next (key, tile), which is past the current sync target
+        self.done = False
+        self.dropped = 0  # frames decoded, but replaced before they were shown
+        self.skipped = 0  # frames skipped by the reader, without decoding them
@@ -0,0 +1,58 @@
+"""
+Helpers for running work on thread pools, shared by the modules that decode
+or load images in the background.
+
+Example
+-------
+for (filename, img) in prefetch_map(pv3.Image, filenames, num_workers=4):
+    ...
+"""
+import collections
+import concurrent.futures as cf
+
+
+def prefetch_map(func, items, num_workers=8, read_ahead=64, ordered=True):
+    """
+    Applies func to each of the items using a pool of threads, running up to read_ahead
+    calls ahead of the consumer. This is effective for I/O and for opencv functions,
+    such as image decoding, which release the GIL.
+
+    Parameters
+    ----------
+    func: callable
+        Called with each item
+    items: iterable
+        The items, which are consumed lazily
+    num_workers: int
+        The number of threads
+    read_ahead: int
+        The maximum number of results in flight, which bounds the memory used
+    ordered: boolean
+        If True (default), the results are yielded in the order of the items. Otherwise,
+        they are yielded as they complete, so that a slow item doesn't hold up the others.
+
+    Returns
+    -------
+    A generator of (item, result) tuples. An exception raised by func is re-raised
+    when its result is reached.
+    """
+    pending = collections.OrderedDict()  # future -> item
+    with cf.ThreadPoolExecutor(max_workers=num_workers) as pool:
+        try:
+            for item in items:
+                while len(pending) >= read_ahead:
+                    if ordered:
+                        (future, done_item) = pending.popitem(last=False)
+                        yield done_item, future.result()
+                    else:
+                        finished, _ = cf.wait(pending, return_when=cf.FIRST_COMPLETED)
+                        for future in finished:
+                            yield pending.pop(future), future.result()
+                pending[pool.submit(func, item)] = item
+            futures = list(pending) if ordered else cf.as_completed(list(pending))
+            for future in futures:
+                yield pending.pop(future), future.result()
+        finally:
+            # if the consumer stops early, don't wait for the remaining read-ahead
+            for future in pending:
+                future.cancel()
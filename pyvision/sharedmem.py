@@ -0,0 +1,368 @@
+"""
+Shared-memory backed variants of the pyvision Image and ImageBuffer,
+for pipelines that fan frames out to multiple worker processes.
+
+Pickling a normal pyvision image copies all of its pixel data. A
+SharedImage keeps its pixels in a named block of shared memory
+(see python's multiprocessing.shared_memory), so pickling it only
+transfers a small handle, and the receiving process attaches to the
+same pixels without copying.
+
+A SharedImageBuffer is a fixed-size ring buffer of frames stored in
+a single shared-memory block. A producer process adds frames, and any
+number of consumer processes can attach to the buffer by name. Each
+added frame gets a sequence number, which is a convenient (tiny) handle
+to pass through a queue to the consumers.
+
+Notes
+-----
+Only the pixel data is shared. Annotation layers and metadata are local
+to each process.
+
+The process that creates a shared block owns it, and should call unlink()
+once all processes are finished with it. Other processes should call close().
+Python versions prior to 3.13 may unlink shared memory blocks attached by an
+unrelated (non-child) process when that process exits, so sharing between
+independently launched programs is best done with python 3.13 or newer.
+"""
+from collections import namedtuple
+from multiprocessing import shared_memory
+import time
+
+import numpy as np
+
+from .image import Image
+from .imagebuffer import ImageBuffer
+
+# A small, picklable description of a shared image's pixel data
+SharedImageHandle = namedtuple("SharedImageHandle", ["name", "shape", "dtype", "desc"])
+
+# Layout of the SharedImageBuffer header, an array of int64 values
+_HDR_MAGIC = 0
+_HDR_N = 1
+_HDR_HEIGHT = 2
+_HDR_WIDTH = 3
+_HDR_CHANNELS = 4
+_HDR_DTYPE = 5
+_HDR_TOTAL = 6  # the total number of frames ever added, aka the next sequence number
+_HDR_START = 7  # the sequence number of the first frame added since the buffer was cleared
+_HDR_SLOTS = 16  # per-slot sequence numbers start here, followed by the per-slot timestamps
+_BUFFER_MAGIC = 0x70763362756666  # "pv3buff"
+
+
+def _open_shm(name=None, size=0):
+    """
+    Creates (if name is None) or attaches to (otherwise) a block of shared memory.
+    """
+    if name is None:
+        return shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        # python >= 3.13, don't let this process' resource tracker own the block
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _attach_image(handle):
+    return SharedImage.attach(handle)
+
+
+def _attach_buffer(name):
+    return SharedImageBuffer.attach(name)
+
+
+class SharedImage(Image):
+    """
+    A pyvision image whose pixel data lives in shared memory. It can be
+    used anywhere a pyvision Image can, and pickles as a small handle.
+    """
+    __slots__ = ("_shm",)
+
+    def __init__(self, source, desc="Pyvision Image"):
+        """
+        Constructor, copies the source pixels into a new block of shared memory.
+
+        Parameters
+        ----------
+        source: pyvision Image or cv2 ndarray
+            The image to copy into shared memory. If a pyvision image is provided,
+            its annotations and metadata are copied as well (locally, not shared).
+        desc: str
+            The image description. If source is a pyvision image, then its description
+            is used instead.
+        """
+        src = source.data if isinstance(source, Image) else np.asarray(source)
+        shm = _open_shm(size=src.nbytes)
+        view = np.ndarray(src.shape, dtype=src.dtype, buffer=shm.buf)
+        view[...] = src
+
+        if isinstance(source, Image):
+            desc = source.desc
+        Image.__init__(self, view, desc=desc)
+        self._shm = shm
+
+        if isinstance(source, Image):
+            if source._annotation_data is not None:
+                self.annotation_data = source._annotation_data.copy()
+            self.annotation_transparency = source.annotation_transparency
+            if source._metadata:
+                self.metadata.update(source._metadata)
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Attaches to the shared pixel data of an existing SharedImage, typically
+        one created in another process.
+
+        Parameters
+        ----------
+        handle: SharedImageHandle
+            The handle of the image, see the handle property.
+
+        Returns
+        -------
+        A new SharedImage that views the same pixels as the original.
+        """
+        shm = _open_shm(name=handle.name)
+        view = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=shm.buf)
+        img = cls.__new__(cls)
+        Image.__init__(img, view, desc=handle.desc)
+        img._shm = shm
+        return img
+
+    def __del__(self):
+        # release our view of the shared pixels before the SharedMemory object
+        # is finalized, otherwise it can't close its buffer cleanly
+        self._data = None
+
+    def __reduce_ex__(self, protocol):
+        return _attach_image, (self.handle,)
+
+    @property
+    def handle(self):
+        """
+        A small, picklable SharedImageHandle that other processes can use
+        to attach to this image's pixels.
+        """
+        return SharedImageHandle(self._shm.name, self.data.shape, self.data.dtype.str, self.desc)
+
+    def close(self):
+        """
+        Releases this process' access to the shared pixels. The image may not be
+        used after calling this method. Any other references to the pixel data,
+        such as slices of img.data, must be deleted first.
+        """
+        self._data = None
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Closes and destroys the shared memory block. This should be called once,
+        by the process that created the image, after all other processes are done
+        with it.
+        """
+        self.close()
+        self._shm.unlink()
+
+
+class SharedImageBuffer(ImageBuffer):
+    """
+    An ImageBuffer whose frames are stored in a ring of slots in shared memory,
+    so that producer and consumer processes can share a stream of frames without
+    serializing them. All frames must have the same size, channels, and dtype.
+    Frames returned by the buffer are pyvision images that view the shared slots
+    directly, and so they will be overwritten once the producer wraps around the
+    ring. Copy any frames that must outlive their slot.
+
+    The buffer always holds the N most recent frames: the time and memory budgets
+    (max_age, max_bytes) of the ImageBuffer are not supported. The timestamps of the
+    frames are kept in the shared header, see get_timestamps().
+    """
+
+    def __init__(self, N=5, size=(640, 480), nchannels=3, dtype="uint8"):
+        """
+        Constructor, allocates a new shared buffer.
+
+        Parameters
+        ----------
+        N: int
+            How many frames to buffer
+        size: tuple (w, h)
+            The size of each frame
+        nchannels: int
+            The number of channels of each frame, 1 or 3.
+        dtype: numpy dtype
+            The data type of each frame
+        """
+        (w, h) = size
+        dtype = np.dtype(dtype)
+        frame_shape = (h, w) if nchannels == 1 else (h, w, nchannels)
+        frame_nbytes = int(np.prod(frame_shape)) * dtype.itemsize
+        hdr_nbytes = 8 * (_HDR_SLOTS + 2 * N)
+
+        shm = _open_shm(size=hdr_nbytes + N * frame_nbytes)
+        self._setup(shm, N, frame_shape, dtype)
+
+        hdr = self._header
+        hdr[:] = -1
+        hdr[_HDR_MAGIC] = _BUFFER_MAGIC
+        hdr[_HDR_N] = N
+        hdr[_HDR_HEIGHT] = h
+        hdr[_HDR_WIDTH] = w
+        hdr[_HDR_CHANNELS] = nchannels
+        hdr[_HDR_DTYPE] = ord(dtype.char)
+        hdr[_HDR_TOTAL] = 0
+        hdr[_HDR_START] = 0
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Attaches to an existing shared image buffer by name.
+
+        Parameters
+        ----------
+        name: str
+            The name of the buffer, see the name property.
+
+        Returns
+        -------
+        A SharedImageBuffer viewing the same frames as the original.
+        """
+        shm = _open_shm(name=name)
+        hdr = np.ndarray((_HDR_SLOTS,), dtype="int64", buffer=shm.buf)
+        if hdr[_HDR_MAGIC] != _BUFFER_MAGIC:
+            shm.close()
+            raise ValueError("Shared memory block {} is not a SharedImageBuffer.".format(name))
+        N, h, w, c = (int(x) for x in hdr[[_HDR_N, _HDR_HEIGHT, _HDR_WIDTH, _HDR_CHANNELS]])
+        dtype = np.dtype(chr(hdr[_HDR_DTYPE]))
+        del hdr
+
+        buff = cls.__new__(cls)
+        buff._setup(shm, N, (h, w) if c == 1 else (h, w, c), dtype)
+        return buff
+
+    def _setup(self, shm, N, frame_shape, dtype):
+        self._shm = shm
+        self._max = N
+        self._capacity = N
+        self._header = np.ndarray((_HDR_SLOTS + N,), dtype="int64", buffer=shm.buf)
+        self._times = np.ndarray((N,), dtype="float64", buffer=shm.buf, offset=8 * (_HDR_SLOTS + N))
+        self._frames = np.ndarray((N,) + frame_shape, dtype=dtype,
+                                  buffer=shm.buf, offset=8 * (_HDR_SLOTS + 2 * N))
+        self._gray = None  # the companion grayscale stack, local to this process
+        self._gray_stamps = None
+
+    def __del__(self):
+        self._header = None
+        self._times = None
+        self._frames = None
+
+    def __reduce__(self):
+        return _attach_buffer, (self.name,)
+
+    @property
+    def name(self):
+        """
+        The name of the shared memory block, used by other processes to attach.
+        """
+        return self._shm.name
+
+    @property
+    def _count(self):
+        return int(min(self._header[_HDR_TOTAL] - self._header[_HDR_START], self._max))
+
+    @property
+    def _head(self):
+        return int(self._header[_HDR_TOTAL] - self._count) % self._max
+
+    @property
+    def _stamps(self):
+        # the sequence number of the frame in each slot, -1 while it is being written
+        return self._header[_HDR_SLOTS:]
+
+    @property
+    def _bytes(self):
+        return self._count * self._frames[0].nbytes
+
+    def _slot_image(self, slot):
+        return Image(self._frames[slot])
+
+    def _slot_array(self, slot):
+        return self._frames[slot]
+
+    def add(self, image, timestamp=None):
+        """
+        Copies an image into the next slot of the ring, overwriting the oldest
+        frame if the buffer is full.
+
+        Parameters
+        ----------
+        image: pyvision Image or cv2 ndarray
+            Must match the frame size, channels and dtype of the buffer.
+        timestamp: float or None
+            The time of the image in seconds, see ImageBuffer.add(...).
+            Defaults to the current time.monotonic().
+
+        Returns
+        -------
+        The sequence number of the added frame, which can be passed to get_frame(...)
+        """
+        mat = image.data if isinstance(image, Image) else image
+        if mat.shape != self._frames.shape[1:]:
+            raise ValueError("Image shape {} does not match buffer frame shape {}".format(
+                mat.shape, self._frames.shape[1:]))
+        seq = int(self._header[_HDR_TOTAL])
+        slot = seq % self._max
+        self._header[_HDR_SLOTS + slot] = -1  # slot is being overwritten
+        self._frames[slot] = mat
+        self._times[slot] = time.monotonic() if timestamp is None else timestamp
+        self._header[_HDR_SLOTS + slot] = seq
+        self._header[_HDR_TOTAL] = seq + 1
+        return seq
+
+    def get_frame(self, seq):
+        """
+        Returns the frame with the given sequence number, as returned by add(...).
+
+        Parameters
+        ----------
+        seq: int
+
+        Returns
+        -------
+        A pyvision image that views the shared slot holding the frame.
+
+        Raises an IndexError if the frame has not been added yet, or if
+        it has already been overwritten.
+        """
+        slot = seq % self._max
+        if self._header[_HDR_SLOTS + slot] != seq:
+            raise IndexError("Frame {} is not available in the shared buffer.".format(seq))
+        return Image(self._frames[slot])
+
+    def clear(self):
+        # sequence numbers keep increasing, so that the slot stamps of new frames never match
+        # those of cleared frames, including in the gray stacks of attached buffers
+        self._header[_HDR_SLOTS:] = -1
+        self._header[_HDR_START] = self._header[_HDR_TOTAL]
+        self._gray = None
+        self._gray_stamps = None
+
+    def close(self):
+        """
+        Releases this process' access to the shared buffer. Any images obtained
+        from the buffer must be deleted first.
+        """
+        self._header = None
+        self._times = None
+        self._frames = None
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Closes and destroys the shared memory block. This should be called once,
+        by the process that created the buffer, after all other processes are
+        done with it.
+        """
+        self.close()
+        self._shm.unlink()
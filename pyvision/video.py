@@ -39,6 +39,9 @@ class VideoInterface(object):
         self.current_frame = None
         self.size = size
 
+        # The frame rate of the video, if known, which may also be set by the user.
+        self.fps = None
+
         # Set the following to true when creating a subclass if it
         # supports random access to the frames without seeking. In which
         # case, you must also implement the __getitem__ magic method.
@@ -78,6 +81,24 @@ class VideoInterface(object):
 
         return self._get_resized()
 
+    def timestamp(self):
+        """
+        The time of the current frame, in seconds from the start of the video,
+        or None if not known. The default implementation computes the time from
+        the frame number and the fps attribute.
+        """
+        if self.current_frame_num == 0 or not self.fps:
+            return None
+        return (self.current_frame_num - 1) / self.fps
+
+    def skip(self):
+        """
+        Advances past the next frame without returning it, such as to catch up with
+        a live stream. Subclasses should override this to avoid decoding the frame.
+        Raises StopIteration at the end of the video.
+        """
+        self.__next__()
+
     def next(self):  # python 2 compatibility
         return self.__next__()
 
@@ -310,6 +331,7 @@ class Video(VideoInterface):
         VideoInterface.__init__(self, size=size)
         self.source = video_source
         self.cap = cv2.VideoCapture(video_source)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or None
 
     def __del__(self):
         if self.cap is not None:
@@ -320,6 +342,29 @@ class Video(VideoInterface):
         self.cap.release()
         self.cap = cv2.VideoCapture(self.source)
 
+    def timestamp(self):
+        """
+        The time of the current frame in seconds, as reported by the video capture,
+        which for a stream may be the time since the stream started.
+        """
+        if self.current_frame_num == 0:
+            return None
+        return self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+    def skip(self):
+        """
+        Advances past the next frame, which is grabbed from the video capture
+        but not decoded.
+        """
+        if not self.cap.isOpened():
+            raise ValueError("Error: VideoCapture object has been closed.")
+        if not self.cap.grab():
+            if self.current_frame_num == 0:
+                raise ValueError("Error: Video source can't be read. VideoCapture grab failed.")
+            raise StopIteration
+        self.current_frame_num += 1
+        self.current_frame = None
+
     def __next__(self):
         """
         We wrap the read method of the video capture object for a few reasons.
@@ -377,6 +422,12 @@ class VideoFromFileList(VideoInterface):
         frame = self.filelist[frame_num]
         return pv3.Image(frame)
 
+    def skip(self):
+        if self.current_frame_num >= self.num_frames:
+            raise StopIteration
+        self.current_frame_num += 1
+        self.current_frame = None
+
     def __next__(self):
         """
         For iterating the frames in the video sequence
@@ -416,6 +467,12 @@ class VideoFromImageStack(VideoInterface):
         frame = self.image_stack[frame_num, :, :]
         return pv3.Image(frame)
 
+    def skip(self):
+        if self.current_frame_num >= self.num_frames:
+            raise StopIteration
+        self.current_frame_num += 1
+        self.current_frame = None
+
     def __next__(self):
         """
         For iterating the frames in the video sequence
@@ -136,7 +136,8 @@ class MedianModel(AbstractBGModel):
         A numpy ndarray representing the gray-scale median values of the image stack.
         If you want a pyvision image, just wrap the result in pv3.Image(result).
         """
-        self._imageStack = self._image_buffer.as_image_stack_BW()
+        # the order of the frames doesn't matter, so use the buffer's stack without copying
+        self._imageStack = self._image_buffer.gray_stack()
         medians = np.median(self._imageStack, axis=0)  # median of each pixel jet in stack
         return medians
     
@@ -0,0 +1,157 @@
+"""
+Records video clips of the motion in a video stream, each including a few
+seconds of "pre-roll" from before the motion was first detected.
+
+The pre-roll is kept in a CompressedImageBuffer, so even many seconds of high
+resolution video take little memory. When motion is detected, the buffered
+frames are written to a new clip, followed by each new frame, until there has
+been no motion for hold_time seconds.
+
+Example
+-------
+md = pv3.MotionDetector(method=pv3.BG_SUBTRACT_APPROX_MEDIAN, buff_size=5)
+recorder = pv3.ClipRecorder("clips", pre_roll=3.0, hold_time=2.0, motion_detector=md)
+for img in vid:
+    recorder.process(img, timestamp=vid.timestamp())
+recorder.close()
+print(recorder.clips)
+"""
+import os
+
+import cv2
+import pyvision as pv3
+
+
+class ClipRecorder(object):
+    """
+    Writes the frames around detected motion to video clips, with cv2.VideoWriter.
+    """
+
+    def __init__(self, out_dir, pre_roll=3.0, hold_time=2.0, fps=15, four_cc="MP4V",
+                 name_pattern="clip_{:04d}.mp4", fmt=".jpg", quality=None, motion_detector=None):
+        """
+        Parameters
+        ----------
+        out_dir: str
+            The directory in which the clips are written, created if required
+        pre_roll: float
+            The seconds of video before the motion was first detected to include in each clip
+        hold_time: float
+            A clip ends once there has been no motion for this many seconds
+        fps: int
+            The frame rate of the clips, and of the input frames when no timestamps are given
+        four_cc: str
+            The four_cc code used to encode the clips, default is "MP4V"
+        name_pattern: str
+            The clip file names, formatted with the clip number
+        fmt: str
+            The encoding of the buffered pre-roll frames, ".jpg" (default) or ".png"
+        quality: int or None
+            The encoding quality of the buffered frames, see pyvision.image.encode_params
+        motion_detector: MotionDetector or None
+            The motion detector used by process(...). Not required when calling update(...)
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.pre_roll = pre_roll
+        self.hold_time = hold_time
+        self.fps = fps
+        self.four_cc = four_cc
+        self.name_pattern = name_pattern
+        self.motion_detector = motion_detector
+        self.clips = []  # the file names of the clips written so far
+
+        self._buffer = pv3.CompressedImageBuffer(N=None, max_age=pre_roll, fmt=fmt, quality=quality)
+        self._writer = None
+        self._frame_size = None
+        self._last_motion = None
+        self._frame_num = 0
+
+    def is_recording(self):
+        return self._writer is not None
+
+    def process(self, img, timestamp=None):
+        """
+        Runs the motion detector on the image, and records it as for update(...).
+        There is motion when the detector finds blobs of more than its min_area pixels.
+
+        Returns
+        -------
+        The number of detections, that is of MotionDetector.blobs(), or 0 until the
+        motion detector's buffer is full.
+        """
+        if self.motion_detector is None:
+            raise ValueError("A motion_detector is required to process images.")
+        num_detections = 0
+        if self.motion_detector.detect(img) > 0:
+            num_detections = len(self.motion_detector.blobs())
+        self.update(img, num_detections > 0, timestamp=timestamp)
+        return num_detections
+
+    def update(self, img, motion, timestamp=None):
+        """
+        Adds the next frame of the video stream.
+
+        Parameters
+        ----------
+        img: pyvision image or cv2 ndarray
+        motion: boolean
+            Whether there is motion in this frame
+        timestamp: float or None
+            The time of the frame in seconds, such as from VideoInterface.timestamp().
+            Defaults to the frame number divided by fps.
+        """
+        if timestamp is None:
+            timestamp = self._frame_num / float(self.fps)
+        self._frame_num += 1
+
+        if self._writer is None:
+            self._buffer.add(img, timestamp=timestamp)
+            if motion:
+                self._last_motion = timestamp
+                self._start_clip(img)
+        elif motion or timestamp - self._last_motion <= self.hold_time:
+            if motion:
+                self._last_motion = timestamp
+            self._write(img)
+        else:
+            self._end_clip()
+            self._buffer.add(img, timestamp=timestamp)
+
+    def _start_clip(self, img):
+        mat = img.data if isinstance(img, pv3.Image) else img
+        self._frame_size = (mat.shape[1], mat.shape[0])
+        filename = os.path.join(self.out_dir, self.name_pattern.format(len(self.clips)))
+        self._writer = cv2.VideoWriter(filename=filename,
+                                       fourcc=cv2.VideoWriter_fourcc(*self.four_cc),
+                                       fps=self.fps,
+                                       frameSize=self._frame_size)
+        if not self._writer.isOpened():
+            self._writer = None
+            raise IOError("Unable to open video writer for {}".format(filename))
+        self.clips.append(filename)
+
+        # the pre-roll, oldest first, up to and including this frame
+        for idx in range(self._buffer.get_count()):
+            self._write(self._buffer[idx])
+        self._buffer.clear()
+
+    def _write(self, img):
+        mat = img.data if isinstance(img, pv3.Image) else img
+        if mat.ndim == 2:
+            mat = cv2.cvtColor(mat, cv2.COLOR_GRAY2BGR)
+        if (mat.shape[1], mat.shape[0]) != self._frame_size:
+            mat = cv2.resize(mat, self._frame_size)
+        self._writer.write(mat)
+
+    def _end_clip(self):
+        self._writer.release()
+        self._writer = None
+
+    def close(self):
+        """
+        Ends the clip being recorded, if any, and stops the pre-roll encoder.
+        """
+        if self._writer is not None:
+            self._end_clip()
+        self._buffer.close()
@@ -21,6 +21,12 @@ except ImportError:
 MD_BOUNDING_RECTS = "BOUNDING_RECTS"
 MD_STANDARDIZED_RECTS = "STANDARDIZED_RECTS"
 
+# A row of the blob table computed by MotionDetector.detect(), for each connected
+# component of the foreground mask. bbox is (x, y, w, h), centroid is (cx, cy), and
+# variance is (var_x, cov_xy, var_y), the second central moments divided by the area.
+BLOB_DTYPE = np.dtype([("label", "<i4"), ("area", "<i4"), ("bbox", "<i4", (4,)),
+                       ("centroid", "<f8", (2,)), ("variance", "<f8", (3,))])
+
 
 class MotionDetector(object):
     """
@@ -42,11 +48,14 @@ class MotionDetector(object):
         thresh: Used by the background subtraction to eliminate noise.
         method: Select background subtraction method. See constants defined in
           BackgroundSubtraction module
-        min_area: minimum foreground contour area required for detection
+        min_area: a foreground blob (connected component) must have more than this many
+          pixels to be detected
         rect_filter: a function reference that takes a list of rectangles and
           returns a list filtered in some way. This allows the user to arbitrarily
           define rules to further limit motion detection results based on the geometry
-          of the bounding boxes.
+          of the bounding boxes. When rectangles are requested as a RectArray, the filter
+          is given the RectArray (which iterates as shapely rectangles) and may return
+          either a RectArray or a list of rectangles.
         buff_size: Only used if image_buffer==None. This controls the size of the
           internal image buffer.
         kwargs: additional keyword args will be passed onto the constructor of the background
@@ -70,7 +79,11 @@ class MotionDetector(object):
         
         self._method = method      
         self._bgSubtract = None  # can't initialize until buffer is full...so done in detect()
-        self._contours = []
+        self._blobs = np.zeros(0, dtype=BLOB_DTYPE)  # the blobs of more than min_area pixels
+        self._labels = None  # the label image of the connected components
+        self._num_components = 0
+        self._contours = []  # computed on demand, see _get_contours()
+        self._convexHulls = []
         self._annotateImg = None # a pyvision image for annotation motion detections
         self._rect_type = rect_type
         self._rect_sigma = rect_sigma
@@ -96,18 +109,59 @@ class MotionDetector(object):
         else:
             raise ValueError("Unknown Background Subtraction Method specified.")
                   
-    def _compute_contours(self):
-        mask_array = self._fgMask.as_grayscale()
-        _, contours, _ = cv2.findContours(mask_array, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        self._contours = contours
-            
-    def _compute_convex_hulls(self):
-        hulls = []
-        for contour in self._contours:
-            hull = cv2.convexHull(contour, returnPoints=True)
-            hulls.append(hull)
-        self._convexHulls = hulls
-        
+    def _compute_blobs(self, cv_binary):
+        """
+        Computes the table of the connected components of the foreground mask, keeping
+        those with an area of more than min_area pixels.
+        """
+        (n, labels, stats, centroids) = cv2.connectedComponentsWithStats(cv_binary, connectivity=8)
+        self._labels = labels
+        self._num_components = n - 1
+        self._contours = None
+        self._convexHulls = None
+
+        # the second moments of all the components at once, from their foreground pixels
+        (ys, xs) = np.nonzero(labels)
+        lbl = labels[ys, xs]
+        area = stats[:, cv2.CC_STAT_AREA].astype('float64')
+        (cx, cy) = (centroids[:, 0], centroids[:, 1])
+        var_x = np.bincount(lbl, weights=xs * xs.astype('float64'), minlength=n) / area - cx * cx
+        cov_xy = np.bincount(lbl, weights=xs * ys.astype('float64'), minlength=n) / area - cx * cy
+        var_y = np.bincount(lbl, weights=ys * ys.astype('float64'), minlength=n) / area - cy * cy
+
+        keep = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] > self._minArea) + 1  # not the background
+        blobs = np.zeros(len(keep), dtype=BLOB_DTYPE)
+        blobs["label"] = keep
+        blobs["area"] = stats[keep, cv2.CC_STAT_AREA]
+        blobs["bbox"] = stats[keep, :cv2.CC_STAT_AREA]
+        blobs["centroid"] = centroids[keep]
+        blobs["variance"] = np.stack([var_x[keep], cov_xy[keep], var_y[keep]], axis=1)
+        self._blobs = blobs
+
+    def _get_contours(self):
+        """
+        The external contours of the foreground mask, computed on first use after each detection.
+        """
+        if self._contours is None:
+            mask_array = self._fgMask.as_grayscale()
+            # [-2] is the list of contours for each of the OpenCV 3 and OpenCV 4 return signatures
+            self._contours = cv2.findContours(mask_array, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+        return self._contours
+
+    def _contour_labels(self, contours):
+        """
+        The blob label of each contour, that of the component containing its first point.
+        """
+        if len(contours) == 0:
+            return np.zeros(0, dtype='int32')
+        first_points = np.array([c[0, 0] for c in contours])
+        return self._labels[first_points[:, 1], first_points[:, 0]]
+
+    def _get_convex_hulls(self):
+        if self._convexHulls is None:
+            self._convexHulls = [cv2.convexHull(contour, returnPoints=True) for contour in self._get_contours()]
+        return self._convexHulls
+
     def __call__(self, img, **kwargs):
         self.detect(img, **kwargs)
         return self.get_rects()
@@ -176,15 +230,28 @@ class MotionDetector(object):
         # update the foreground mask
         self._fgMask = pv3.Image(cv_binary)
 
-        # update the detected foreground contours
-        self._compute_contours()
-        self._compute_convex_hulls()
+        # update the table of detected foreground blobs
+        self._compute_blobs(cv_binary)
 
         if convex_hulls:
-            for hull in self._convexHulls:
+            for hull in self._get_convex_hulls():
                 cv2.fillConvexPoly(cv_binary, hull, (255, 255, 255))
 
-        return len(self._contours)
+        return self._num_components
+
+    def blobs(self):
+        """
+        Returns
+        -------
+        The table of the connected components of the foreground mask with an area
+        of more than min_area pixels, as a structured ndarray of BLOB_DTYPE records.
+        The rects and polygons are derived from this table.
+
+        Notes
+        -----
+        You must call detect() before blobs() to see updated results.
+        """
+        return self._blobs
 
     def key_frame(self):
         """
@@ -270,18 +337,24 @@ class MotionDetector(object):
         updated information.
         """
         fg_pix = self.foreground_pixels(bg_color=bg_color)
-        rects = self.get_rects()
+        rects = self.get_rects(as_array=True)
 
         tiles = []
-        for r in rects:
+        for idx in range(len(rects)):
             # for every rectangle, crop from fg_pix image
-            t = fg_pix.crop(r)
+            t = fg_pix.crop(rects[idx:idx+1])
             tiles.append(t)
 
         return tiles
 
-    def get_rects(self):
+    def get_rects(self, as_array=False):
         """
+        Parameters
+        ----------
+        as_array: boolean
+            If True, the rectangles are returned as a pyvision RectArray instead
+            of a list of shapely rectangles.
+
         Returns
         -------
         The bounding boxes of the external contours of the foreground mask. The
@@ -294,14 +367,35 @@ class MotionDetector(object):
         You must call detect() before get_rects() to see updated results.
         """
         if self._rect_type == MD_BOUNDING_RECTS:
-            return self.bounding_rects()
+            return self.bounding_rects(as_array=as_array)
         elif self._rect_type == MD_STANDARDIZED_RECTS:
-            return self.standardized_rects()
+            return self.standardized_rects(as_array=as_array)
         else:
             raise ValueError("Unknown rect type: "+self._rect_type)
 
-    def bounding_rects(self):
+    def _apply_filter(self, rects, as_array):
+        """
+        Applies the user's rect_filter (if any), returning rects in the requested form.
         """
+        if as_array:
+            if self._filter is not None:
+                rects = self._filter(rects)
+                if not isinstance(rects, pv3.RectArray):
+                    rects = pv3.RectArray.from_shapes(rects)
+            return rects
+
+        rects = rects.to_shapes()
+        if self._filter is not None:
+            rects = self._filter(rects)
+        return rects
+
+    def bounding_rects(self, as_array=False):
+        """
+        Parameters
+        ----------
+        as_array: boolean
+            If True, return a pyvision RectArray instead of a list of shapely rectangles.
+
         Returns
         -------
         the bounding boxes of the external contours of the foreground mask.
@@ -310,17 +404,16 @@ class MotionDetector(object):
         -----
         You must call detect() before bounding_rects() to see updated results.
         """
-        # create a list of the top-level contours found in the contours structure
-        rects = [pv3.Rect(*cv2.boundingRect(c)) for c in self._contours
-                 if cv2.contourArea(c) > self._minArea]
-
-        if self._filter is not None:
-            rects = self._filter(rects)
-        
-        return rects
+        rects = pv3.RectArray.from_xywh(self._blobs["bbox"])
+        return self._apply_filter(rects, as_array)
     
-    def standardized_rects(self):
+    def standardized_rects(self, as_array=False):
         """
+        Parameters
+        ----------
+        as_array: boolean
+            If True, return a pyvision RectArray instead of a list of shapely rectangles.
+
         Returns
         -------
         the boxes centered on the target center of mass +- n_sigma*std
@@ -329,27 +422,11 @@ class MotionDetector(object):
         -----
         You must call detect() before standardized_rects() to see updated results.
         """
-        rects = []
-        for contour in self._contours:
-            if cv2.contourArea(contour) > self._minArea:
-                (x, y, w, h) = cv2.boundingRect(contour)
-                moments = cv2.moments(contour)
-                m00 = moments["m00"]
-                m01 = moments["m01"]
-                m10 = moments["m10"]
-                mu02 = moments["mu02"]
-                mu20 = moments["mu20"]
-                cx = m10/m00
-                cy = m01/m00
-                w = 2.0*self._rect_sigma*np.sqrt(mu20/m00)
-                h = 2.0*self._rect_sigma*np.sqrt(mu02/m00)
-                r = pv3.CenteredRect(cx, cy, w, h)
-                rects.append(r)
-        
-        if self._filter is not None:
-            rects = self._filter(rects)
-        
-        return rects
+        variance = self._blobs["variance"]
+        sizes = 2.0 * self._rect_sigma * np.sqrt(np.maximum(variance[:, [0, 2]], 0))
+        centers = self._blobs["centroid"]
+        rects = pv3.RectArray.from_centers(centers, np.reshape(sizes, (-1, 2)))
+        return self._apply_filter(rects, as_array)
     
     def polygons(self, return_all=False):
         """
@@ -368,16 +445,11 @@ class MotionDetector(object):
         -----
         You must call detect() before polygons() to see updated results.
         """
-        # create a list of the top-level contours found in the contours (cv.Seq) structure
-        polys = []
-
-        for contour in self._contours:
-            if return_all or cv2.contourArea(contour) > self._minArea:
-                coords = [pt for pt in contour.squeeze()]
-                poly = sg.Polygon(coords)
-                polys.append(poly)
-
-        return polys
+        contours = self._get_contours()
+        if not return_all:
+            keep = np.isin(self._contour_labels(contours), self._blobs["label"])
+            contours = [c for (c, is_kept) in zip(contours, keep) if is_kept]
+        return [sg.Polygon(contour.reshape(-1, 2)) for contour in contours if len(contour) > 2]
     
     def convex_hulls(self):
         """
@@ -390,7 +462,7 @@ class MotionDetector(object):
         -----
         You must call detect() before convex_hulls() to see updated results.
         """
-        hull_polys = [sg.Polygon(hull.squeeze()) for hull in self._convexHulls
+        hull_polys = [sg.Polygon(hull.squeeze()) for hull in self._get_convex_hulls()
                       if len(hull.squeeze()) > 3]
         return hull_polys
         
@@ -433,8 +505,7 @@ class MotionDetector(object):
                 key_frame.annotate_shape(poly, color=contour_color, thickness=1)
 
         if rect_color is not None:
-            for rect in self.get_rects():
-                key_frame.annotate_shape(rect, color=rect_color, thickness=2)
+            key_frame.annotate_rects(self.get_rects(as_array=True), color=rect_color, thickness=2)
 
         if convex_hull_color is not None:
             for poly in self.convex_hulls():
@@ -4,9 +4,18 @@ author: Stephen O'Hara
 created: April 14, 2016
 """
 
+import json
+import os
+import tarfile
+import tempfile
 import unittest
+from unittest import mock
 import pyvision as pv3
+from pyvision.dataset_tools.extraction import read_index
+from pyvision.dataset_tools.dedup import hamming_distance
 import shapely.geometry as sg
+import numpy as np
+import cv2
 
 
 class TestDatasetTools(unittest.TestCase):
@@ -31,6 +40,282 @@ class TestDatasetTools(unittest.TestCase):
         self.assertTrue(len(crops2) == 2)
         self.assertTupleEqual(crops2[0].size, (300, 300))
 
+    def test_crop_negative_regions(self):
+        print("\nTest 'crop negative regions' function")
+        img = pv3.Image(pv3.IMG_SLEEPYCAT)
+        p1 = sg.Polygon([(200, 200), (200, 400), (380, 380), (395, 210)])
+        p2 = sg.Polygon([(400, 400), (350, 500), (400, 600), (500, 600), (575, 425)])
+
+        crops = pv3.crop_negative_regions(img, [p1, p2], (64, 64), N=20, rng=1)
+        self.assertEqual(len(crops), 20)
+        for crop in crops:
+            self.assertTupleEqual(crop.size, (64, 64))
+            (minx, miny, maxx, maxy) = crop.metadata["crop_bounds"]
+            rect = sg.box(minx, miny, maxx, maxy)
+            self.assertFalse(rect.intersects(p1) or rect.intersects(p2))
+
+        # the same seed gives the same crops
+        crops2 = pv3.crop_negative_regions(img, [p1, p2], (64, 64), N=20, rng=1)
+        self.assertListEqual([c.metadata["crop_bounds"] for c in crops],
+                             [c.metadata["crop_bounds"] for c in crops2])
+
+        # a crop position is only valid if it misses every shape, so this can't be satisfied
+        (w, h) = img.size
+        everything = sg.box(0, 0, w - 1, h - 1)
+        self.assertRaises(ValueError, pv3.crop_negative_regions, img, [everything], (64, 64), N=1)
+
+    def test_random_rect_gen(self):
+        print("\nTest 'random rect gen' function")
+        rects = pv3.random_rect_gen((640, 480), (64, 32), N=1000, rng=5)
+        self.assertEqual(len(rects), 1000)
+        self.assertTrue(np.all(rects.in_bounds((640, 480))))
+        self.assertTrue(np.all(rects.widths == 64) and np.all(rects.heights == 32))
+        self.assertTrue(np.array_equal(rects.bounds, pv3.random_rect_gen((640, 480), (64, 32), N=1000, rng=5).bounds))
+
+        shapes = list(pv3.random_rect_gen((640, 480), (64, 32), N=3, yield_shapes=True))
+        self.assertTupleEqual(shapes[0].bounds[2:], (shapes[0].bounds[0] + 63, shapes[0].bounds[1] + 31))
+
+        # non-overlapping, with at least 5 pixels between rects horizontally or vertically
+        rects = pv3.random_rect_gen((640, 480), (64, 32), N=40, rng=5, min_spacing=5)
+        dx = np.abs(rects.x[:, np.newaxis] - rects.x[np.newaxis, :])
+        dy = np.abs(rects.y[:, np.newaxis] - rects.y[np.newaxis, :])
+        too_close = (dx < 64 + 5) & (dy < 32 + 5)
+        np.fill_diagonal(too_close, False)
+        self.assertFalse(np.any(too_close))
+
+        self.assertRaises(ValueError, pv3.random_rect_gen, (640, 480), (64, 32), N=500, non_overlapping=True)
+
+    def test_extract_crops(self):
+        print("\nTest 'extract crops' function")
+        p1 = [[200, 200], [200, 400], [380, 380], [395, 210]]
+        p2 = [[400, 400], [350, 500], [400, 600], [500, 600], [575, 425]]
+        manifest = [{"image": pv3.IMG_SLEEPYCAT, "shapes": [p1, p2], "labels": ["a", "b"]},
+                    {"image": "no_such_image.jpg", "shapes": []},
+                    {"image": pv3.IMG_SLEEPYCAT, "shapes": [p2]}]
+
+        with tempfile.TemporaryDirectory() as out_dir:
+            manifest_file = os.path.join(out_dir, "manifest.jsonl")
+            with open(manifest_file, "w") as outfile:
+                outfile.writelines(json.dumps(r) + "\n" for r in manifest)
+
+            stats = pv3.extract_crops(manifest_file, out_dir, crop_size=(64, 64), negatives_per_image=3,
+                                      num_workers=2, shard_size=5)
+            self.assertEqual(stats["images"], 3)
+            self.assertEqual(stats["crops"], 2 + 3 + 1 + 3)
+            self.assertEqual(stats["errors"], 1)
+            self.assertEqual(len(stats["shards"]), 2)
+
+            index = {e["record"]: e for e in read_index(out_dir)}
+            self.assertListEqual([c["label"] for c in index[0]["crops"]], ["a", "b", None, None, None])
+            crop = index[2]["crops"][0]
+            with tarfile.open(os.path.join(out_dir, crop["shard"])) as tar:
+                self.assertIn(crop["name"], tar.getnames())
+
+            # simulate an interrupted run, which never finished record 2
+            index_file = os.path.join(out_dir, "index.jsonl")
+            with open(index_file) as infile:
+                lines = [line for line in infile if json.loads(line)["record"] != 2]
+            with open(index_file, "w") as outfile:
+                outfile.writelines(lines)
+                outfile.write('{"record": 2, "ima')
+
+            stats = pv3.extract_crops(manifest_file, out_dir, crop_size=(64, 64), negatives_per_image=3,
+                                      num_workers=0, retry_errors=False)
+            self.assertEqual(stats["skipped"], 2)
+            self.assertEqual(stats["images"], 1)
+            self.assertListEqual(stats["shards"], ["shard-00002.tar"])
+            resumed = [e for e in read_index(out_dir) if e["record"] == 2]
+            self.assertEqual(len(resumed), 1)
+            # negative sampling is reproducible across runs and worker counts
+            self.assertListEqual(resumed[0]["crops"][1:], [dict(c, shard="shard-00002.tar")
+                                                           for c in index[2]["crops"][1:]])
+
+            # by default, resuming retries the images that failed
+            stats = pv3.extract_crops(manifest_file, out_dir, crop_size=(64, 64), num_workers=0)
+            self.assertEqual(stats["skipped"], 2)
+            self.assertEqual(stats["images"], 1)
+            self.assertEqual(stats["errors"], 1)
+            self.assertEqual(read_index(out_dir)[-1]["record"], 1)
+
+        # a malformed shape is reported as an error of its record, without stopping the run
+        # as are records without an image, or with too few labels
+        manifest = [{"image": pv3.IMG_SLEEPYCAT, "shapes": ["POLYGN ((0 0, 1 0, 1 1))"]},
+                    {"image": pv3.IMG_SLEEPYCAT, "shapes": [[[0, 0], [1]]]},
+                    {"image": pv3.IMG_SLEEPYCAT, "shapes": [p1]},
+                    {"shapes": [p1]},
+                    {"image": pv3.IMG_SLEEPYCAT, "shapes": [p1, p2], "labels": ["a"]}]
+        with tempfile.TemporaryDirectory() as out_dir:
+            stats = pv3.extract_crops(manifest, out_dir, crop_size=(64, 64), negatives_per_image=0,
+                                      num_workers=2)
+            self.assertEqual(stats["images"], 5)
+            self.assertEqual(stats["errors"], 4)
+            self.assertEqual(stats["crops"], 1)
+            index = {e["record"]: e for e in read_index(out_dir)}
+            self.assertTrue(index[0]["error"].startswith("Invalid shape"))
+            self.assertTrue(index[1]["error"].startswith("Invalid shape"))
+            self.assertIsNone(index[2]["error"])
+            self.assertIn("no 'image'", index[3]["error"])
+            self.assertIn("1 labels for 2 shapes", index[4]["error"])
+            self.assertListEqual(index[4]["crops"], [])
+
+            # an OpenCV error, here from encoding, only fails its own record
+            stats = pv3.extract_crops(manifest[2:3], os.path.join(out_dir, "xyz"), crop_size=(64, 64),
+                                      fmt=".xyz", num_workers=2)
+            self.assertEqual(stats["errors"], 1)
+
+    def test_tile_archive(self):
+        print("\nTest tile archive writer and reader")
+        img = pv3.Image(pv3.IMG_SLEEPYCAT)
+        rects = pv3.random_rect_gen(img.size, (48, 32), N=20, rng=2)
+        tiles = img.crop_many(rects, as_type="PV")
+        labels = ["even" if i % 2 == 0 else None for i in range(20)]
+
+        with tempfile.TemporaryDirectory() as out_dir:
+            path = os.path.join(out_dir, "tiles")
+            with pv3.TileArchiveWriter(path, fmt=".png") as writer:
+                for tile, label in zip(tiles[:15], labels):
+                    writer.add(tile, label)
+            with pv3.TileArchiveWriter(path, fmt=".png", mode="a") as writer:
+                for tile, label in zip(tiles[15:], labels[15:]):
+                    writer.add(tile.data, label)
+
+            with pv3.TileArchive(path) as archive:
+                self.assertEqual(len(archive), 20)
+                self.assertListEqual(archive.labels, ["even"])
+                self.assertTrue(np.all(archive[17].data == tiles[17].data))
+                self.assertEqual(archive.get_bytes(3), tiles[3].encode(".png", annotated=False))
+                self.assertIsNone(archive.get_label(3))
+
+                generated = list(archive.tiles(start=5, num_workers=3, read_ahead=4))
+                self.assertListEqual([t[0] for t in generated], [str(i) for i in range(5, 20)])
+                self.assertListEqual([t[2] for t in generated], labels[5:])
+                self.assertTrue(np.all(generated[-1][1].data == tiles[19].data))
+
+            # the labels of the index records on disk are readable while the writer is open
+            with pv3.TileArchiveWriter(path, fmt=".png", mode="a") as writer:
+                writer.add(tiles[0], "odd")
+                writer._dat.flush()  # as if the OS wrote the records before a crash
+                writer._idx.flush()
+                with pv3.TileArchive(path) as archive:
+                    self.assertEqual(archive.get_label(20), "odd")
+
+            # crops can be extracted directly into archive shards
+            manifest = [(pv3.IMG_SLEEPYCAT, [sg.box(100, 100, 200, 200)])]
+            stats = pv3.extract_crops(manifest, out_dir, crop_size=(64, 64), negatives_per_image=2,
+                                      num_workers=0, shard_format="archive")
+            self.assertListEqual(stats["shards"], ["shard-00000"])
+            crop = read_index(out_dir)[0]["crops"][2]
+            with pv3.TileArchive(os.path.join(out_dir, crop["shard"])) as archive:
+                self.assertEqual(len(archive), 3)
+                self.assertTupleEqual(archive[crop["name"]].size, (64, 64))
+
+    def test_parallel_tile_generators(self):
+        print("\nTest parallel tile generators")
+        img = pv3.Image(pv3.IMG_SLEEPYCAT)
+        tiles = img.crop_many(pv3.random_rect_gen(img.size, (32, 32), N=30, rng=4), as_type="PV")
+
+        with tempfile.TemporaryDirectory() as tile_dir:
+            filenames = []
+            for idx, tile in enumerate(tiles):
+                filenames.append(os.path.join(tile_dir, "tile_{:03d}.png".format(idx)))
+                tile.save(filenames[-1], as_annotated=False)
+            with open(filenames[7], "wb") as outfile:
+                outfile.write(b"not an image")
+            labels = [str(i % 3) for i in range(30)]
+
+            expected = list(pv3.tiles_from_files(filenames, labels))
+            ordered = list(pv3.tiles_from_files_parallel(filenames, labels, num_workers=4, read_ahead=5))
+            self.assertListEqual([t[0] for t in ordered], [t[0] for t in expected])
+            self.assertListEqual([t[2] for t in ordered], labels)
+            self.assertIsNone(ordered[7][1])
+            self.assertTrue(np.all(ordered[12][1].data == tiles[12].data))
+
+            unordered = list(pv3.tiles_from_dir_parallel(tile_dir, "*.png", read_ahead=5, ordered=False))
+            self.assertSetEqual(set(t[0] for t in unordered), set(os.path.basename(f) for f in filenames))
+            self.assertListEqual([t[2] for t in unordered], [str(i) for i in range(30)])
+
+            # stopping early is fine
+            gen = pv3.tiles_from_dir_parallel(tile_dir, "*.png", read_ahead=5)
+            self.assertEqual(len(next(gen)), 3)
+            gen.close()
+
+    def test_tile_selector(self):
+        print("\nTest TileSelector paging, prefetch, and resume")
+        img = pv3.Image(pv3.IMG_SLEEPYCAT)
+        tiles = img.crop_many(pv3.random_rect_gen(img.size, (32, 32), N=25, rng=6), as_type="PV")
+
+        def tile_gen():
+            for idx, tile in enumerate(tiles):
+                yield ("t{}".format(idx), tile, None)
+
+        shown = []
+
+        def fake_show(montage, window_title=None, **kwargs):
+            # the user selects the second tile on every page
+            shown.append(window_title)
+            montage.set_highlighted([1])
+
+        with tempfile.TemporaryDirectory() as out_dir, \
+                mock.patch.object(pv3.ImageMontage, "show", fake_show), \
+                mock.patch("cv2.destroyWindow"):
+            selection_file = os.path.join(out_dir, "selected.jsonl")
+            ts = pv3.TileSelector(tile_gen(), chunk_size=10, layout=(2, 5), selection_file=selection_file)
+            ts.process_chunk(page_num=1)
+            ts.close()
+            self.assertListEqual(ts.selected, ["t1"])
+
+            # resume the interrupted session
+            ts = pv3.TileSelector(tile_gen(), chunk_size=10, layout=(2, 5), selection_file=selection_file)
+            ts.process_all()
+            self.assertListEqual(ts.selected, ["t1", "t11", "t21"])
+            self.assertListEqual(shown, ["Tile selector: Page {}".format(p) for p in (1, 2, 3)])
+            with open(selection_file) as infile:
+                pages = [json.loads(line) for line in infile]
+            self.assertListEqual([len(p["ids"]) for p in pages], [10, 10, 5])
+            self.assertIsNone(ts._pool)
+
+            # the prefetch thread is stopped when leaving a session early, or when it fails
+            with pv3.TileSelector(tile_gen(), chunk_size=10, layout=(2, 5)) as ts:
+                ts.process_chunk(page_num=1)
+                self.assertIsNotNone(ts._pool)
+            self.assertIsNone(ts._pool)
+            ts = pv3.TileSelector(tile_gen(), chunk_size=10, layout=(2, 5))
+            with mock.patch.object(pv3.ImageMontage, "show", side_effect=KeyboardInterrupt):
+                self.assertRaises(KeyboardInterrupt, ts.process_all)
+            self.assertIsNone(ts._pool)
+
+    def test_dedup(self):
+        print("\nTest perceptual hash deduplication")
+        img = pv3.Image(pv3.IMG_SLEEPYCAT)
+        tiles = img.crop_many(pv3.random_rect_gen(img.size, (64, 64), N=30, rng=8, non_overlapping=True),
+                              as_type="PV")
+        brightened = [pv3.Image(cv2.add(t.data, 4)) for t in tiles]
+
+        hashes = pv3.phash(tiles)
+        self.assertEqual(hashes.dtype, np.uint64)
+        self.assertEqual(pv3.phash(tiles[3]), hashes[3])
+
+        index = pv3.PHashIndex(max_distance=6)
+        index.add(hashes, ids=["t{}".format(i) for i in range(30)])
+        near = index.query(pv3.phash(brightened[5]))
+        self.assertEqual(near[0][0], "t5")
+
+        # the multi-index lookup finds the same hashes as a brute force search
+        for query in pv3.phash(brightened):
+            dists = hamming_distance(index.hashes, query)
+            expected = set("t{}".format(i) for i in np.flatnonzero(dists <= 6))
+            self.assertSetEqual(set(tile_id for (tile_id, _) in index.query(query)), expected)
+
+        items = [("t{}".format(i), t, None) for (i, t) in enumerate(tiles)] + [("bad", None, None)] + \
+                [("dup{}".format(i), t, None) for (i, t) in enumerate(brightened)]
+        unique = list(pv3.dedup_tiles(iter(items), max_distance=6, batch_size=16))
+        unique_ids = [item[0] for item in unique]
+        self.assertIn("bad", unique_ids)
+        self.assertFalse(any(tile_id.startswith("dup") for tile_id in unique_ids))
+        # a list can be given directly, rather than a generator
+        self.assertListEqual([item[0] for item in pv3.dedup_tiles(items, max_distance=6, batch_size=16)],
+                             unique_ids)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+import pyvision as pv3
+
+
+class TestRectArray(unittest.TestCase):
+    def test_conversions(self):
+        print("\nTest RectArray conversions to/from shapely")
+        rects = pv3.RectArray.from_xywh([(10, 20, 30, 40), (0, 0, 5, 5)])
+        self.assertEqual(len(rects), 2)
+        self.assertTupleEqual(rects[0].bounds, pv3.Rect(10, 20, 30, 40).bounds)
+        self.assertTrue(np.all(rects.xywh == [(10, 20, 30, 40), (0, 0, 5, 5)]))
+        self.assertTrue(np.all(rects.area() == [1200, 25]))
+
+        centered = pv3.RectArray.from_centers([(50, 60)], (21, 10))
+        self.assertTupleEqual(centered[0].bounds, pv3.CenteredRect(50, 60, 21, 10).bounds)
+
+        shapes = [pv3.Rect(1, 2, 3, 4), pv3.Rect(5, 6, 7, 8)]
+        rects2 = pv3.RectArray.from_shapes(shapes)
+        self.assertListEqual([r.bounds for r in rects2], [s.bounds for s in shapes])
+        self.assertEqual(len(rects2[0:1]), 1)
+
+    def test_vectorized_ops(self):
+        print("\nTest RectArray vectorized operations")
+        rects = pv3.RectArray.from_xywh([(0, 0, 10, 10), (5, 5, 10, 10), (95, 45, 10, 10)])
+        self.assertListEqual(list(rects.in_bounds((100, 50))), [True, True, False])
+
+        clipped = rects.clip((100, 50))
+        self.assertTrue(np.all(clipped.in_bounds((100, 50))))
+        self.assertEqual(clipped.area()[2], 25)
+
+        inter = rects.intersection(rects[0])
+        self.assertListEqual(list(inter.area()), [100, 25, 0])
+        self.assertListEqual(list(inter.is_empty()), [False, False, True])
+        union = rects.union(rects[0])
+        self.assertTupleEqual(tuple(union.bounds[1]), (0, 0, 14, 14))
+
+        iou = rects.iou(rects)
+        self.assertTupleEqual(iou.shape, (3, 3))
+        self.assertTrue(np.allclose(np.diag(iou), 1.0))
+        self.assertAlmostEqual(iou[0, 1], 25.0 / 175.0)
+        self.assertEqual(iou[0, 2], 0.0)
+
+    def test_crop_and_annotate(self):
+        print("\nTest RectArray with Image crop and annotation")
+        img = pv3.Image(pv3.IMG_DRIVEWAY)
+        rect = pv3.Rect(20, 50, 100, 100)
+        rects = pv3.RectArray.from_shapes([rect])
+        self.assertTrue(np.all(img.crop(rects).data == img.crop(rect).data))
+        self.assertRaises(pv3.OutOfBoundsError, img.crop, pv3.RectArray.from_xywh((-40, 300, 80, 80)))
+
+        img2 = pv3.Image(pv3.IMG_DRIVEWAY)
+        img.annotate_shape(rect, color=pv3.RGB_RED, thickness=2)
+        img2.annotate_shape(rects, color=pv3.RGB_RED, thickness=2)
+        self.assertTrue(np.all(img.annotation_data == img2.annotation_data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ from unittest import TestCase
 import pyvision as pv3
 import numpy as np
 import cv2
+import pickle
 
 
 class TestImage(TestCase):
@@ -27,6 +28,45 @@ class TestImage(TestCase):
         bad_rect = pv3.Rect(-40, 300, 80, 80)
         self.assertRaises(pv3.OutOfBoundsError, img.crop, bad_rect)
 
+    def test_crop_many(self):
+        print("\nTest Image 'crop_many' Method")
+        img = pv3.Image(pv3.IMG_DRIVEWAY)
+        rects = pv3.RectArray.from_xywh([(20, 50, 100, 100), (200, 10, 100, 100), (0, 0, 100, 100)])
+        batch = img.crop_many(rects)
+        self.assertTupleEqual(batch.shape, (3, 100, 100, 3))
+        for i in range(3):
+            self.assertTrue(np.all(batch[i] == img.crop(rects[i:i+1]).data))
+
+        # resized directly into the batch, same as cropping then resizing
+        small = img.crop_many(rects, out_size=(32, 24))
+        self.assertTupleEqual(small.shape, (3, 24, 32, 3))
+        self.assertTrue(np.all(small[1] == cv2.resize(batch[1], (32, 24))))
+
+        # pyvision images view the batch and carry the crop bounds
+        tiles = img.crop_many(rects, as_type="PV")
+        self.assertTupleEqual(tiles[1].metadata["crop_bounds"], img.crop(rects[1:2]).metadata["crop_bounds"])
+        self.assertIs(tiles[0].data.base, tiles[2].data.base)  # one batch array, not copies
+
+        gray = pv3.Image(img.as_grayscale())
+        self.assertTupleEqual(gray.crop_many(rects).shape, (3, 100, 100))
+
+        # varying sizes require an out_size
+        mixed = pv3.RectArray.from_xywh([(20, 50, 100, 100), (200, 10, 50, 100)])
+        self.assertRaises(ValueError, img.crop_many, mixed)
+        self.assertTupleEqual(img.crop_many(mixed, out_size=(64, 64)).shape, (2, 64, 64, 3))
+
+        # out of bounds rects raise, unless a pad_mode is given
+        bad = pv3.RectArray.from_xywh([(20, 50, 80, 80), (-40, 300, 80, 80)])
+        self.assertRaises(pv3.OutOfBoundsError, img.crop_many, bad)
+        padded = img.crop_many(bad, pad_mode="constant", pad_value=7)
+        self.assertTrue(np.all(padded[1][:, :40] == 7))
+        self.assertTrue(np.all(padded[1][:, 40:] == img.data[300:380, 0:40]))
+        edge = img.crop_many(bad, pad_mode="edge")
+        self.assertTrue(np.all(edge[1][:, 0] == img.data[300:380, 0]))
+        reflect = img.crop_many(bad, pad_mode="reflect")
+        expected = cv2.copyMakeBorder(img.data, 0, 0, 40, 0, cv2.BORDER_REFLECT_101)[300:380, 0:80]
+        self.assertTrue(np.all(reflect[1] == expected))
+
     def test_mask(self):
         print("\nTest Image 'annotate_mask' Method")
         img = pv3.Image(pv3.IMG_DRIVEWAY)
@@ -35,3 +75,77 @@ class TestImage(TestCase):
         img.annotate_mask(mask)
         masked_image = img.as_annotated()  # what we get
         self.assertTrue(np.allclose(masked_image, mask_target))
+
+    def test_encode(self):
+        print("\nTest Image 'encode' Method")
+        img = pv3.Image(pv3.IMG_DRIVEWAY)
+        buf = img.encode(".png", annotated=False)
+        decoded = cv2.imdecode(np.frombuffer(buf, dtype='uint8'), cv2.IMREAD_UNCHANGED)
+        self.assertTrue(np.all(decoded == img.data))
+
+        # repeated requests with the same parameters are served from the cache
+        jpg1 = img.encode("jpg", quality=80)
+        self.assertIs(jpg1, img.encode(".jpg", quality=80))
+        self.assertIsNot(jpg1, img.encode(".jpg", quality=50))
+
+        # annotating the image invalidates the cached results
+        img.annotate_rect((10, 10), (100, 100), color=pv3.RGB_RED, thickness=-1)
+        jpg2 = img.encode("jpg", quality=80)
+        self.assertIsNot(jpg1, jpg2)
+        self.assertNotEqual(jpg1, jpg2)
+
+    def test_pickle(self):
+        print("\nTest Image pickling with out-of-band buffers")
+        img = pv3.Image(pv3.IMG_DRIVEWAY, desc="driveway")
+        img.metadata["frame"] = 12
+
+        # an image without annotations only needs a buffer for its data
+        buffers = []
+        payload = pickle.dumps(img, protocol=5, buffer_callback=buffers.append)
+        self.assertEqual(len(buffers), 1)
+        self.assertLess(len(payload), 1024)
+        img2 = pickle.loads(payload, buffers=buffers)
+        self.assertEqual(img2.desc, "driveway")
+        self.assertDictEqual(img2.metadata, {"frame": 12})
+        self.assertTrue(np.all(img2.data == img.data))
+        self.assertTrue(np.all(img2.as_annotated() == img.as_annotated()))
+
+        # the data can be drawn on in place, whether the buffers are read-only (copied) or not
+        received = pickle.loads(payload, buffers=[bytes(buf.raw()) for buf in buffers])
+        received.annotate_rect((0, 0), (10, 10), color=pv3.RGB_RED, thickness=-1)
+        received.data[:10, :10] = 0
+        writable = [bytearray(buf.raw()) for buf in buffers]
+        received = pickle.loads(payload, buffers=writable)
+        received.data[:10, :10] = 0
+        self.assertTrue(np.all(np.frombuffer(writable[0], dtype='uint8')[:10] == 0))  # a view, not a copy
+
+        # annotations are transferred when present
+        img.annotate_circle((100, 100), 20, color=pv3.RGB_GREEN, thickness=-1)
+        buffers = []
+        payload = pickle.dumps(img, protocol=5, buffer_callback=buffers.append)
+        self.assertEqual(len(buffers), 2)
+        img3 = pickle.loads(payload, buffers=buffers)
+        self.assertTrue(np.all(img3.annotation_data == img.annotation_data))
+
+        # older protocols still round-trip
+        img4 = pickle.loads(pickle.dumps(img, protocol=4))
+        self.assertTrue(np.all(img4.as_annotated() == img.as_annotated()))
+
+    def test_compact(self):
+        print("\nTest Image compact representation")
+        img = pv3.Image(np.zeros((48, 64), dtype='uint8'))
+        self.assertFalse(hasattr(img, "__dict__"))
+        self.assertTupleEqual(img.size, (64, 48))
+        self.assertEqual(img.nchannels, 1)
+
+        # annotations layer and metadata are allocated on first use
+        self.assertTrue(np.all(img.as_annotated()[:, :, 0] == img.data))
+        self.assertIsNone(img._annotation_data)
+        self.assertIsNone(img._metadata)
+        img.metadata["source"] = "test"
+        img.annotate_point((10, 10), color=pv3.RGB_WHITE)
+        self.assertTupleEqual(img.annotation_data.shape, (48, 64, 3))
+        self.assertEqual(img.metadata["source"], "test")
+
+        # unreadable sources still raise AttributeError
+        self.assertRaises(AttributeError, pv3.Image, "no_such_file.jpg")
@@ -1,5 +1,8 @@
 import unittest
+from unittest import mock
 import pyvision as pv3
+import numpy as np
+import cv2
 
 
 class TestImageBuffer(unittest.TestCase):
@@ -34,5 +37,130 @@ class TestImageBuffer(unittest.TestCase):
         # im_img = im.as_image()
         # im_img.save("test.jpg")
 
+    def test_gray_stack(self):
+        print("\nTesting Image Buffer grayscale stack")
+        vid = pv3.Video(pv3.VID_PRIUS, size=(320, 240))
+        ib = pv3.ImageBuffer(N=6)
+        for _ in range(4):
+            ib.add(vid.next())
+        self.assertTupleEqual(ib.gray_stack().shape, (4, 240, 320))
+
+        ib.fill(vid)
+        stack = ib.gray_stack()
+        self.assertFalse(stack.flags.writeable)
+        ordered = ib.as_image_stack_BW()
+        self.assertTrue(np.all(ordered[-1] == ib.last().as_grayscale()))
+        self.assertTrue(np.all(ordered[0] == ib.first().as_grayscale()))
+
+        with mock.patch("cv2.cvtColor", wraps=cv2.cvtColor) as cvt:
+            # only the newly added frame is converted
+            ib.add(vid.next())
+            stack = ib.gray_stack()
+            self.assertEqual(cvt.call_count, 1)
+        ordered = ib.as_image_stack_BW()
+        self.assertTrue(np.all(ordered[-1] == ib.last().as_grayscale()))
+        self.assertTrue(np.all(np.sort(stack, axis=0) == np.sort(ordered, axis=0)))
+
+        # the median model uses the stack, in whatever order
+        model = pv3.MedianModel(ib)
+        self.assertTrue(np.all(model._get_median_vals() == np.median(ordered, axis=0)))
+
+        # a different size rebuilds the stack
+        self.assertTupleEqual(ib.gray_stack(size=(160, 120)).shape, (6, 120, 160))
+        ib.clear()
+        self.assertRaises(ValueError, ib.gray_stack)
+
+    def test_budgeted_buffer(self):
+        print("\nTesting Image Buffer time and memory budgets")
+        frames = [pv3.Image(np.full((24, 32), i, dtype='uint8')) for i in range(100)]
+
+        # a one second window at 8 fps holds 9 frames, however many slots that takes
+        ib = pv3.ImageBuffer(N=None, max_age=1.0)
+        for (i, frame) in enumerate(frames[:9]):
+            ib.add(frame, timestamp=i / 8.0)
+        self.assertFalse(ib.is_full())
+        for (i, frame) in enumerate(frames[9:40], 9):
+            ib.add(frame, timestamp=i / 8.0)
+        self.assertTrue(ib.is_full())
+        self.assertEqual(len(ib), 9)
+        self.assertIs(ib.first(), frames[31])
+        self.assertIs(ib.middle(), frames[35])
+        self.assertIs(ib.last(), frames[39])
+        self.assertTrue(np.all(ib.get_timestamps() == np.arange(31, 40) / 8.0))
+        self.assertListEqual(ib.get_data(), frames[31:40])
+
+        # the gray stack follows the retained frames as they wrap around the ring
+        self.assertListEqual(sorted(ib.gray_stack()[:, 0, 0]), list(range(31, 40)))
+        for (i, frame) in enumerate(frames[40:45], 40):
+            ib.add(frame, timestamp=i / 8.0)
+        self.assertListEqual(sorted(ib.gray_stack()[:, 0, 0]), list(range(36, 45)))
+        self.assertListEqual(list(ib.as_image_stack_BW()[:, 0, 0]), list(range(36, 45)))
+
+        # a memory budget of 5 frames, with at most 4 frames
+        ib = pv3.ImageBuffer(N=None, max_bytes=5 * 24 * 32)
+        for frame in frames[:7]:
+            ib.add(frame)
+        self.assertEqual(ib.get_count(), 5)
+        self.assertEqual(ib.get_nbytes(), 5 * 24 * 32)
+        self.assertIs(ib.first(), frames[2])
+        ib = pv3.ImageBuffer(N=4, max_bytes=5 * 24 * 32)
+        ib.fill(frames)
+        self.assertEqual(ib.get_count(), 4)
+        ib.clear()
+        self.assertFalse(ib.is_full())
+        self.assertEqual(ib.get_nbytes(), 0)
+
+        # filling from a video uses the video's timestamps
+        vid = pv3.Video(pv3.VID_PRIUS, size=(160, 120))
+        ib = pv3.ImageBuffer(N=None, max_age=0.5)
+        ib.fill(vid)
+        self.assertLess(vid.current_frame_num, 20)  # the first eviction, at 24.5 fps
+        self.assertTrue(0.4 < ib.get_timestamps()[-1] - ib.get_timestamps()[0] <= 0.5)
+        self.assertRaises(ValueError, pv3.ImageBuffer, N=None)
+
+    def test_compressed_buffer(self):
+        print("\nTesting Compressed Image Buffer")
+        vid = pv3.Video(pv3.VID_PRIUS, size=(320, 240))
+        frames = [vid.next() for _ in range(12)]
+
+        # lossless encoding returns the same pixels, oldest to newest
+        ib = pv3.CompressedImageBuffer(N=8, fmt=".png", num_workers=2, max_pending=3)
+        ib.fill(frames)
+        self.assertTrue(ib.is_full())
+        self.assertEqual(ib.get_count(), 8)
+        for frame in frames[8:]:
+            ib.add(frame)
+        for (img, frame) in zip(ib.get_data(), frames[4:]):
+            self.assertTrue(np.all(img.data == frame.data))
+        gray = cv2.cvtColor(frames[-1].data, cv2.COLOR_BGR2GRAY)
+        self.assertTrue(np.all(ib.as_image_stack_BW()[-1] == gray))
+        self.assertTrue(ib.get_encoded(0).startswith(b"\x89PNG"))
+        self.assertRaises(IndexError, ib.get_encoded, 8)
+
+        # the memory budget applies to the jpeg sizes, once encoded
+        ib = pv3.CompressedImageBuffer(N=None, max_bytes=3 * 320 * 240 * 3, max_pending=1)
+        for frame in frames:
+            ib.add(frame)
+        ib.close()
+        self.assertEqual(ib.get_count(), 12)
+        self.assertLess(ib.get_nbytes(), 12 * 320 * 240 * 3 // 5)
+        self.assertEqual(ib.get_nbytes(), sum(len(ib.get_encoded(i)) for i in range(12)))
+        self.assertTupleEqual(ib.last().size, (320, 240))
+
+    def test_buffer_show(self):
+        print("\nTesting Image Buffer 'show' Method")
+        vid = pv3.Video(pv3.VID_PRIUS, size=(320, 240))
+        ib = pv3.ImageBuffer(N=8)
+        for _ in range(5):
+            ib.add(vid.next())
+
+        with mock.patch.object(pv3.Image, "show", autospec=True, return_value=-1) as show:
+            self.assertEqual(ib.show(N=4), -1)
+        strip = show.call_args[0][0]
+        self.assertTupleEqual(strip.size, (4 * 66 + 2, 52))
+        # the most recent image is on the right, with its label in the lower left corner
+        expected = cv2.resize(ib.last().data, (64, 48), interpolation=cv2.INTER_AREA)
+        self.assertTrue(np.all(strip.data[2:30, 200:264] == expected[:28]))
+
 if __name__ == '__main__':
     unittest.main()
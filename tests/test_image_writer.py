@@ -0,0 +1,84 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import unittest
+import zipfile
+
+import cv2
+import numpy as np
+import pyvision as pv3
+
+
+class TestImageWriter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        img = pv3.Image(pv3.IMG_DRIVEWAY)
+        cls.crops = [img.crop(pv3.Rect(10 * i, 20, 64, 64)) for i in range(12)]
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_write_directory(self):
+        print("\nTest ImageWriter writing to a directory")
+        dest = os.path.join(self.out_dir, "crops")
+        with pv3.ImageWriter(dest, fmt=".png", num_workers=3, max_queue=4) as writer:
+            for idx, crop in enumerate(self.crops):
+                crop.save("crop_{}".format(idx), writer=writer)
+        stats = writer.stats()
+        self.assertEqual(stats["written"], len(self.crops))
+        self.assertEqual(stats["pending"], 0)
+
+        # png is lossless, so we should read back exactly what was written
+        tile = cv2.imread(os.path.join(dest, "crop_3.png"))
+        self.assertTrue(np.all(tile == self.crops[3].data))
+
+    def test_write_archives(self):
+        print("\nTest ImageWriter writing to tar and zip archives")
+        tar_file = os.path.join(self.out_dir, "crops.tar")
+        with pv3.ImageWriter(tar_file, quality=90) as writer:
+            writer.write_many(self.crops)
+        with tarfile.open(tar_file) as tf:
+            names = sorted(tf.getnames())
+            self.assertEqual(len(names), len(self.crops))
+            buf = tf.extractfile(names[0]).read()
+        tile = cv2.imdecode(np.frombuffer(buf, dtype='uint8'), cv2.IMREAD_COLOR)
+        self.assertTupleEqual(tile.shape, (64, 64, 3))
+
+        zip_file = os.path.join(self.out_dir, "crops.zip")
+        with pv3.ImageWriter(zip_file) as writer:
+            writer.write_many(self.crops, names=["c{}.jpg".format(i) for i in range(len(self.crops))])
+        with zipfile.ZipFile(zip_file) as zf:
+            self.assertEqual(len(zf.namelist()), len(self.crops))
+
+    def test_write_error(self):
+        print("\nTest ImageWriter reports encoding failures on close")
+        writer = pv3.ImageWriter(self.out_dir)
+        writer.write(self.crops[0], name="bad.not_a_format")
+        self.assertRaises(IOError, writer.close)
+
+        # the exception raised within a with block isn't replaced by the writer's error
+        with self.assertRaises(KeyError):
+            with pv3.ImageWriter(self.out_dir) as writer:
+                writer.write(self.crops[0], name="bad.not_a_format")
+                raise KeyError("body")
+        with self.assertRaises(IOError):
+            with pv3.ImageWriter(self.out_dir) as writer:
+                writer.write(self.crops[0], name="bad.not_a_format")
+
+    def test_stats_after_close(self):
+        print("\nTest ImageWriter stats stop the clock on close")
+        with pv3.ImageWriter(self.out_dir) as writer:
+            writer.write_many(self.crops)
+        stats = writer.stats()
+        time.sleep(0.05)
+        self.assertEqual(writer.stats()["elapsed_seconds"], stats["elapsed_seconds"])
+        self.assertEqual(stats["written"], len(self.crops))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+Import-time regression tests. Importing the top-level package should
+not import any of the heavy dependencies, which are instead loaded
+when the names that need them are first used.
+"""
+import os
+import subprocess
+import sys
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("cv2", "numpy", "shapely", "matplotlib", "pkg_resources")
+
+IMPORT_SCRIPT = """
+import sys, time
+t0 = time.perf_counter()
+import pyvision as pv3
+print(time.perf_counter() - t0)
+print(",".join(m for m in {heavy} if m in sys.modules))
+img = pv3.Image(pv3.IMG_DRIVEWAY)
+print(pv3.Image is sys.modules["pyvision.image"].Image)
+print(pv3.POLY_SLEEPYCAT.area > 0)
+"""
+
+
+class TestImport(unittest.TestCase):
+    def test_import_time(self):
+        print("\nTest import time of the pyvision package")
+        script = IMPORT_SCRIPT.format(heavy=repr(HEAVY_MODULES))
+        out = subprocess.check_output([sys.executable, "-c", script], cwd=REPO_DIR)
+        (elapsed, loaded, same_class, poly_ok) = out.decode().splitlines()
+        print("import pyvision: {:.1f} ms".format(1000 * float(elapsed)))
+        self.assertEqual(loaded, "", "heavy modules imported eagerly: " + loaded)
+        self.assertEqual(same_class, "True")
+        self.assertEqual(poly_ok, "True")
+
+    def test_public_names(self):
+        print("\nTest lazily resolved public names")
+        import pyvision as pv3
+        for name in pv3.__all__:
+            self.assertTrue(hasattr(pv3, name), name)
+        self.assertIn("MotionDetector", dir(pv3))
+        self.assertRaises(AttributeError, getattr, pv3, "NoSuchThing")
+
+
+if __name__ == '__main__':
+    unittest.main()
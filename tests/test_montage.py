@@ -0,0 +1,242 @@
+import itertools
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import pyvision as pv3
+import numpy as np
+import cv2
+
+
+class TestImageMontage(unittest.TestCase):
+    def setUp(self):
+        img = pv3.Image(pv3.IMG_SLEEPYCAT)
+        rects = pv3.random_rect_gen(img.size, (120, 90), N=20, rng=1)
+        self.images = img.crop_many(rects, as_type="PV")
+        self.images[3] = pv3.Image(self.images[3].as_grayscale())
+
+    def test_thumbnail_cache(self):
+        print("\nTesting Image Montage thumbnail cache")
+        imnt = pv3.ImageMontage(self.images, layout=(2, 4), tile_size=(64, 48))
+        first_page = imnt.as_image().data.copy()
+
+        with mock.patch.object(pv3.Image, "resize", autospec=True, side_effect=pv3.Image.resize) as resize:
+            # scrolling forward renders the new row, scrolling back is served from the cache
+            imnt._incr()
+            imnt.draw()
+            self.assertEqual(resize.call_count, 4)
+            imnt._decr()
+            imnt.draw()
+            self.assertEqual(resize.call_count, 4)
+            self.assertTrue(np.all(imnt.as_image().data == first_page))
+
+            # annotating an image invalidates its cached thumbnail
+            self.images[1].annotate_rect((0, 0), (60, 60), color=pv3.RGB_RED, thickness=-1)
+            imnt.draw()
+            self.assertEqual(resize.call_count, 5)
+            self.assertFalse(np.all(imnt.as_image().data == first_page))
+
+    def test_lazy_sources(self):
+        print("\nTesting Image Montage with lazy image sources")
+        expected = pv3.ImageMontage(self.images, layout=(2, 4), tile_size=(64, 48)).as_image().data
+
+        loaded = []
+
+        def loader(idx):
+            loaded.append(idx)
+            return self.images[idx]
+
+        imnt = pv3.ImageMontage(loader, num_images=len(self.images), layout=(2, 4), tile_size=(64, 48))
+        self.assertTrue(np.all(imnt.as_image().data == expected))
+
+        # only the visible page and the next page (prefetched) are loaded
+        for future in list(imnt._pending.values()):
+            future.result()
+        self.assertSetEqual(set(loaded), set(range(16)))
+
+        # scrolling to the prefetched images doesn't load them again
+        imnt._incr()
+        imnt._incr()
+        imnt.draw()
+        for future in list(imnt._pending.values()):
+            future.result()
+        imnt.close()
+        self.assertListEqual(sorted(loaded), list(range(20)))
+
+        self.assertRaises(ValueError, pv3.ImageMontage, loader, layout=(2, 4))
+
+        with tempfile.TemporaryDirectory() as img_dir:
+            paths = [os.path.join(img_dir, "{}.png".format(i)) for i in range(len(self.images))]
+            for img, path in zip(self.images, paths):
+                img.save(path, as_annotated=False)
+
+            imnt = pv3.ImageMontage(paths, layout=(2, 4), tile_size=(64, 48))
+            self.assertTrue(np.all(imnt.as_image().data == expected))
+            imnt.close()
+
+            vid = pv3.VideoFromFileList(paths)
+            imnt = pv3.ImageMontage(vid, layout=(2, 4), tile_size=(64, 48), prefetch=False)
+            self.assertTrue(np.all(imnt.as_image().data == expected))
+
+    def test_export(self):
+        print("\nTesting Image Montage export of pages and mosaics")
+        imnt = pv3.ImageMontage(self.images, layout=(2, 4), tile_size=(64, 48))
+        shown = imnt.as_image().data.copy()
+
+        with tempfile.TemporaryDirectory() as out_dir:
+            names = imnt.save_pages(out_dir, fmt=".png")
+            self.assertListEqual(names, ["page_0000.png", "page_0001.png", "page_0002.png"])
+            # the first page matches the montage, less the scroll arrow padding
+            page = pv3.Image(os.path.join(out_dir, names[0]))
+            self.assertTrue(np.all(page.data == shown[imnt._ypad:-imnt._ypad]))
+            self.assertTupleEqual(pv3.Image(os.path.join(out_dir, names[2])).size, page.size)
+
+            # the mosaic tiles match the montage tiles, assembled over several strips
+            mosaic_file = os.path.join(out_dir, "mosaic.ppm")
+            (w, h) = imnt.save_mosaic(mosaic_file, cols=6, strip_rows=1)
+            self.assertTupleEqual((w, h), (6 * 66 + 2, 4 * 50 + 2))
+            mosaic = pv3.Image(mosaic_file).data
+            self.assertTupleEqual(mosaic.shape, (h, w, 3))
+            self.assertTrue(np.all(mosaic[2:50, 2:66] == shown[27:75, 2:66]))  # image 0
+            self.assertTrue(np.all(mosaic[52:100, 2:66] == page.data[52:100, 134:198]))  # image 6
+            self.assertTrue(np.all(mosaic[152:, 134:] == 0))  # past the last image
+
+            npy_file = os.path.join(out_dir, "mosaic.npy")
+            imnt.save_mosaic(npy_file, cols=6, num_workers=2)
+            self.assertTrue(np.all(np.load(npy_file, mmap_mode="r") == mosaic))
+            self.assertRaises(ValueError, imnt.save_mosaic, os.path.join(out_dir, "mosaic.jpg"))
+
+        # exporting doesn't change the montage
+        self.assertTrue(np.all(imnt.as_image().data == shown))
+
+    def test_click_selection(self):
+        print("\nTesting Image Montage click handling")
+        imnt = pv3.ImageMontage(self.images, layout=(3, 4), tile_size=(64, 48), highlight_selected=True)
+        selected = []
+        imnt.set_select_handler(lambda img, img_num, info: selected.append((img_num, info["imgLabel"])))
+        handler = imnt._clickHandler
+
+        with mock.patch("cv2.imshow"), mock.patch.object(imnt, "draw", wraps=imnt.draw) as draw:
+            # scroll down one row, then select image 6 (row 0, col 2) and its neighbor 11
+            handler.onClick(cv2.EVENT_LBUTTONDOWN, 10, imnt._size[1] - 5, None, "montage")
+            self.assertEqual(imnt._imgPtr, 4)
+            self.assertEqual(draw.call_count, 1)
+            handler.onClick(cv2.EVENT_LBUTTONDOWN, 2 * 66 + 2, 25 + 2, None, "montage")
+            handler.onClick(cv2.EVENT_LBUTTONDOWN, 3 * 66 + 65, 25 + 50 + 49, None, "montage")
+            # clicks in a gutter select nothing
+            handler.onClick(cv2.EVENT_LBUTTONDOWN, 66, 40, None, "montage")
+            handler.onClick(cv2.EVENT_LBUTTONDOWN, 40, 25 + 50, None, "montage")
+            self.assertEqual(draw.call_count, 1)  # selections only redraw their own tiles
+        self.assertListEqual(imnt.get_highlighted(), [6, 11])
+        self.assertListEqual(selected, [(6, "6"), (11, "11")])
+
+        # toggling tiles gives the same montage as drawing it from scratch
+        imnt._check_click_region(3 * 66 + 30, 25 + 30)  # image 7, which neighbors both
+        imnt._check_click_region(2 * 66 + 30, 25 + 30)  # image 6, unselected
+        incremental = imnt.as_image().data.copy()
+        imnt.draw()
+        self.assertTrue(np.all(imnt.as_image().data == incremental))
+        self.assertListEqual(imnt.get_highlighted(), [7, 11])
+
+    def test_compose_montage(self):
+        print("\nTesting compose_montage of an image batch")
+        img = pv3.Image(pv3.IMG_SLEEPYCAT)
+        batch = img.crop_many(pv3.random_rect_gen(img.size, (64, 48), N=7, rng=1))
+        images = [pv3.Image(tile) for tile in batch]
+
+        # without resizing, the layout and labels match an ImageMontage page
+        for by_row in (True, False):
+            expected = pv3.ImageMontage(images, layout=(2, 4), tile_size=(64, 48), by_row=by_row).as_image().data
+            self.assertTrue(np.all(pv3.compose_montage(batch, layout=(2, 4), by_row=by_row) == expected))
+
+        # resizing the batch at once (exact factor) or tile by tile matches resizing each image
+        for tile_size in [(32, 24), (40, 30)]:
+            montage = pv3.compose_montage(images, layout=(2, 4), tile_size=tile_size, labels=None, as_type="PV")
+            (tw, th) = tile_size
+            self.assertTupleEqual(montage.size, (4 * (tw + 2) + 2, 2 * (th + 2) + 2))
+            tile_6 = montage.data[th + 4:2 * th + 4, 2 * tw + 6:3 * tw + 6]
+            self.assertTrue(np.all(tile_6 == cv2.resize(batch[6], tile_size, interpolation=cv2.INTER_AREA)))
+
+        # grayscale batches, composed into a reused output array
+        gray = np.stack([cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY) for tile in batch])
+        out = np.zeros((28, 7 * 34 + 2, 3), dtype='uint8')
+        montage = pv3.compose_montage(gray, tile_size=(32, 24), out=out)
+        self.assertIs(montage, out)
+        self.assertTrue(np.all(out[2:26, 2:34, 0] == out[2:26, 2:34, 2]))
+        self.assertRaises(ValueError, pv3.compose_montage, gray, tile_size=(30, 24), out=out)
+
+
+class TestVideoMontage(unittest.TestCase):
+    def setUp(self):
+        # two "videos" of constant frames, whose pixel values identify the frames
+        self.stack_a = np.stack([np.full((48, 64), i, dtype='uint8') for i in range(10)])
+        self.stack_b = np.stack([np.full((48, 64), 100 + i, dtype='uint8') for i in range(20)])
+
+    def test_sync_by_frame(self):
+        print("\nTesting Video Montage synchronized by frame number")
+        vids = [pv3.VideoFromImageStack(self.stack_a), pv3.VideoFromImageStack(self.stack_b)]
+        vm = pv3.VideoMontage(vids, tile_size=(64, 48), realtime=False)
+        self.assertTupleEqual(vm._canvas.shape, (52, 134, 3))
+
+        frames = list(vm.frames(copy=True))
+        self.assertEqual(len(frames), 20)
+        # the shorter video holds its last frame
+        self.assertListEqual([int(f.data[2, 2, 0]) for f in frames], list(range(10)) + [9] * 10)
+        self.assertListEqual([int(f.data[2, 68, 0]) for f in frames], list(range(100, 120)))
+        self.assertListEqual(vm.dropped_frames(), [0, 0])
+
+        # without copies, each frame is the same reused canvas
+        vm.reset()
+        frame = next(vm.frames())
+        self.assertIs(frame.data, vm._canvas)
+        vm.close()
+
+    def test_sync_by_time(self):
+        print("\nTesting Video Montage synchronized by timestamp")
+        vid_a = pv3.VideoFromImageStack(self.stack_a)
+        vid_b = pv3.VideoFromImageStack(self.stack_b)
+        vm = pv3.VideoMontage([vid_a, vid_b], tile_size=(64, 48), sync="time", realtime=False)
+        self.assertRaises(ValueError, list, vm.frames())  # there are no timestamps without an fps
+
+        # the second video has twice the frame rate, so every other frame is dropped
+        vid_a.fps = 10
+        vid_b.fps = 20
+        vm.reset()
+        self.assertEqual(vm.fps, 30)
+        vm = pv3.VideoMontage([vid_a, vid_b], tile_size=(64, 48), sync="time", realtime=False, labels=None)
+        self.assertEqual(vm.fps, 20)
+        vm.fps = 10
+        frames = [(int(f.data[2, 2, 0]), int(f.data[2, 68, 0])) for f in vm.frames()]
+        self.assertListEqual(frames[:3], [(0, 100), (1, 102), (2, 104)])
+        self.assertListEqual(vm.dropped_frames(), [0, 9])
+
+    def test_realtime(self):
+        print("\nTesting Video Montage realtime playback with a slow source")
+
+        class SlowVideo(pv3.VideoFromImageStack):
+            # decoding takes longer than a montage frame, but skipping a frame is cheap
+            def __next__(self):
+                time.sleep(0.03)
+                return pv3.VideoFromImageStack.__next__(self)
+
+        stack = np.stack([np.full((48, 64), i % 256, dtype='uint8') for i in range(300)])
+        slow = SlowVideo(stack)
+        vm = pv3.VideoMontage([pv3.VideoFromImageStack(stack), slow], tile_size=(64, 48), fps=50, labels=None)
+        lags = []
+        for frame in itertools.islice(vm.frames(), 50):
+            # frame number k shows the stack value k - 1
+            (fast_num, slow_num) = (int(frame.data[2, 2, 0]) + 1, int(frame.data[2, 68, 0]) + 1)
+            self.assertLessEqual(fast_num, vm.current_frame_num)  # never ahead of the montage
+            self.assertLessEqual(slow_num, vm.current_frame_num)
+            lags.append(vm.current_frame_num - slow_num)
+        vm.close()
+
+        # the slow source skips frames rather than falling ever further behind
+        self.assertGreater(vm._sources[1].skipped, 0)
+        self.assertGreater(vm.dropped_frames()[1], 10)
+        self.assertLessEqual(max(lags[-10:]), 5)
+        self.assertLess(slow.current_frame_num, 70)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import pyvision as pv3
+import numpy as np
+import cv2
+
+
+class TestMotionDetector(unittest.TestCase):
+    def setUp(self):
+        # two large blobs and a speck of noise on a black background
+        frame = np.zeros((120, 160, 3), dtype='uint8')
+        cv2.rectangle(frame, (10, 20), (40, 50), (255, 255, 255), -1)
+        cv2.circle(frame, (120, 80), 15, (200, 200, 200), -1)
+        frame[100:103, 60:63] = 255
+        self.frame = pv3.Image(frame)
+        self.bg = pv3.Image(np.zeros_like(frame))
+
+    def test_blob_table(self):
+        print("\nTesting Motion Detector blob table")
+        md = pv3.MotionDetector(method=pv3.BG_SUBTRACT_STATIC, bg_image=self.bg, buff_size=1,
+                                thresh=20, min_area=100)
+        self.assertEqual(md.detect(self.frame), 3)
+        blobs = md.blobs()
+        self.assertEqual(len(blobs), 2)  # the noise is below min_area
+
+        # the table agrees with the contours of the foreground mask
+        mask = md.foreground_mask().as_grayscale()
+        contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+        large = sorted(cv2.boundingRect(c) for c in contours if cv2.contourArea(c) > 100)
+        self.assertListEqual(sorted(tuple(b) for b in blobs["bbox"].tolist()), large)
+        for blob in blobs:
+            component = md._labels == blob["label"]
+            self.assertEqual(blob["area"], component.sum())
+            (ys, xs) = np.nonzero(component)
+            self.assertTrue(np.allclose(blob["centroid"], (xs.mean(), ys.mean())))
+            self.assertTrue(np.allclose(blob["variance"], (xs.var(), np.cov(xs, ys, bias=True)[0, 1], ys.var())))
+
+        # the rects and polygons are those of the blobs
+        rects = md.bounding_rects(as_array=True)
+        self.assertEqual(len(rects), 2)
+        self.assertEqual(len(md.standardized_rects()), 2)
+        polys = md.polygons()
+        self.assertEqual(len(polys), 2)
+        self.assertEqual(len(md.polygons(return_all=True)), 3)
+        for poly in polys:
+            self.assertTrue(any(r.contains(poly.centroid) for r in rects.to_shapes()))
+        self.assertEqual(len(md.convex_hulls()), 3)
+        self.assertTupleEqual(md.annotate_frame().size, (160, 120))
+
+        # nothing detected on the background
+        self.assertEqual(md.detect(self.bg), 0)
+        self.assertEqual(len(md.blobs()), 0)
+        self.assertEqual(len(md.get_rects()), 0)
+        self.assertListEqual(md.polygons(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import multiprocessing
+import pickle
+import unittest
+
+import numpy as np
+import pyvision as pv3
+
+
+def _sum_frame(shared_buffer, seq, results):
+    # runs in a child process, receives the buffer as a (pickled) handle
+    results.put(int(shared_buffer.get_frame(seq).data.sum()))
+    shared_buffer.close()
+
+
+class TestSharedMemory(unittest.TestCase):
+    def test_shared_image(self):
+        print("\nTest SharedImage pickles as a handle")
+        img = pv3.Image(pv3.IMG_DRIVEWAY)
+        shared = pv3.SharedImage(img)
+        try:
+            self.assertTrue(np.all(shared.data == img.data))
+
+            payload = pickle.dumps(shared)
+            self.assertLess(len(payload), 1024)  # no pixel data
+
+            other = pickle.loads(payload)
+            self.assertTupleEqual(other.size, img.size)
+            # both images view the same pixels
+            shared.data[0:10, 0:10] = 0
+            self.assertTrue(np.all(other.data[0:10, 0:10] == 0))
+            other.close()
+        finally:
+            shared.unlink()
+
+    def test_shared_image_buffer(self):
+        print("\nTest SharedImageBuffer shared between processes")
+        vid = pv3.Video(pv3.VID_PRIUS, size=(320, 240))
+        ib = pv3.SharedImageBuffer(N=8, size=(320, 240))
+        try:
+            ib.fill(vid)
+            self.assertTrue(ib.is_full())
+            seq = ib.add(vid.next())
+            self.assertEqual(seq, 8)
+            self.assertTrue(np.all(ib.last().data == ib.get_frame(seq).data))
+            self.assertRaises(IndexError, ib.get_frame, 0)  # overwritten
+
+            # attaching by name sees the same frames as the producer
+            other = pv3.SharedImageBuffer.attach(ib.name)
+            self.assertEqual(other.get_count(), 8)
+            self.assertTrue(np.all(other.first().data == ib.first().data))
+            other.close()
+
+            results = multiprocessing.Queue()
+            proc = multiprocessing.Process(target=_sum_frame, args=(ib, seq, results))
+            proc.start()
+            proc.join()
+            self.assertEqual(results.get(timeout=10), int(ib.last().data.sum()))
+
+            # an attached buffer's gray stack follows the producer's frames
+            other = pv3.SharedImageBuffer.attach(ib.name)
+            self.assertTrue(np.all(other.as_image_stack_BW()[-1] == ib.last().as_grayscale()))
+            ib.add(vid.next())
+            self.assertTrue(np.all(other.as_image_stack_BW() == ib.as_image_stack_BW()))
+            self.assertTupleEqual(other.gray_stack().shape, (8, 240, 320))
+            other.close()
+        finally:
+            ib.unlink()
+
+    def test_shared_buffer_timestamps(self):
+        print("\nTest SharedImageBuffer timestamps and sizes")
+        ib = pv3.SharedImageBuffer(N=4, size=(32, 24), nchannels=1)
+        try:
+            self.assertEqual(ib.get_nbytes(), 0)
+            self.assertEqual(len(ib.get_timestamps()), 0)
+            for i in range(6):
+                ib.add(np.full((24, 32), i, dtype='uint8'), timestamp=i / 10.0)
+            self.assertTrue(np.all(ib.get_timestamps() == np.arange(2, 6) / 10.0))
+            self.assertEqual(ib.get_nbytes(), 4 * 24 * 32)
+
+            # the timestamps are shared with attached buffers
+            other = pv3.SharedImageBuffer.attach(ib.name)
+            self.assertTrue(np.all(other.get_timestamps() == ib.get_timestamps()))
+            other.close()
+
+            ib.add(np.zeros((24, 32), dtype='uint8'))
+            self.assertGreater(ib.get_timestamps()[-1], 0.5)  # the current time.monotonic()
+        finally:
+            ib.unlink()
+
+    def test_shared_buffer_clear(self):
+        print("\nTest SharedImageBuffer clear and refill")
+        ib = pv3.SharedImageBuffer(N=4, size=(32, 24), nchannels=1)
+        try:
+            other = pv3.SharedImageBuffer.attach(ib.name)
+            for value in (10, 20, 30):
+                ib.add(np.full((24, 32), value, dtype='uint8'))
+            self.assertListEqual(list(ib.gray_stack()[:, 0, 0]), [10, 20, 30])
+            self.assertListEqual(list(other.gray_stack()[:, 0, 0]), [10, 20, 30])
+
+            # neither gray stack returns the cleared frames
+            ib.clear()
+            self.assertEqual(other.get_count(), 0)
+            for value in (1, 2, 3):
+                ib.add(np.full((24, 32), value, dtype='uint8'))
+            self.assertFalse(ib.is_full())
+            self.assertListEqual(list(ib.gray_stack(ordered=True)[:, 0, 0]), [1, 2, 3])
+            self.assertListEqual(list(other.gray_stack(ordered=True)[:, 0, 0]), [1, 2, 3])
+            self.assertListEqual(sorted(other.gray_stack()[:, 0, 0]), [1, 2, 3])
+
+            # the ring wraps from where the frames since the clear started
+            for value in (4, 5):
+                ib.add(np.full((24, 32), value, dtype='uint8'))
+            self.assertTrue(other.is_full())
+            self.assertListEqual([int(img.data[0, 0]) for img in other.get_data()], [2, 3, 4, 5])
+            self.assertListEqual(list(other.as_image_stack_BW()[:, 0, 0]), [2, 3, 4, 5])
+            other.close()
+        finally:
+            ib.unlink()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
+import os
+import tempfile
 import unittest
 import pyvision as pv3
 import numpy as np
+import cv2
 
 
 class TestVideo(unittest.TestCase):
@@ -28,6 +31,25 @@ class TestVideo(unittest.TestCase):
         vid.seek_to(12)
         self.assertTrue(vid.current_frame_num == 12)
 
+    def test_video_skip(self):
+        print("\nTest Video 'skip' Method")
+        vid = pv3.Video(pv3.VID_PRIUS)
+        frames = [vid.next().data.copy() for _ in range(4)]
+        timestamp = vid.timestamp()
+        frames.append(vid.next().data.copy())
+        vid.reset()
+        vid.next()
+        for _ in range(3):
+            vid.skip()  # grabbed, not decoded
+        self.assertEqual(vid.current_frame_num, 4)
+        self.assertEqual(vid.timestamp(), timestamp)
+        self.assertTrue(np.all(vid.next().data == frames[4]))
+
+        stack = pv3.VideoFromImageStack(np.zeros((2, 8, 8), dtype='uint8'))
+        stack.skip()
+        stack.next()
+        self.assertRaises(StopIteration, stack.skip)
+
     def test_video_from_image_stack(self):
         print("\nTest VideoFromImageStack using an Image Buffer")
         vid = pv3.Video(pv3.VID_PRIUS, size=(320, 240))
@@ -47,5 +69,78 @@ class TestVideo(unittest.TestCase):
         self.assertTupleEqual(imgA.size, (320, 240))
         self.assertTrue(np.all(imgA.data == X[30, :, :]))
 
+class TestClipRecorder(unittest.TestCase):
+    def test_pre_roll_and_hold(self):
+        print("\nTesting Clip Recorder pre-roll and hold time")
+        frames = [np.full((48, 64, 3), 5 * i, dtype='uint8') for i in range(40)]
+        # motion in frames 10-11 and 30, at 10 fps
+        motion = [i in (10, 11, 30) for i in range(40)]
+
+        with tempfile.TemporaryDirectory() as out_dir:
+            recorder = pv3.ClipRecorder(out_dir, pre_roll=0.5, hold_time=0.35, fps=10, four_cc="MJPG",
+                                        name_pattern="clip_{:04d}.avi", fmt=".png")
+            for (frame, is_motion) in zip(frames, motion):
+                recorder.update(frame, is_motion)
+                if is_motion:
+                    self.assertTrue(recorder.is_recording())
+            recorder.close()
+            self.assertFalse(recorder.is_recording())
+            self.assertEqual(len(recorder.clips), 2)
+
+            # each clip is the half second of pre-roll, the motion, and the hold time
+            for (clip, first, last) in zip(recorder.clips, (5, 25), (14, 33)):
+                cap = cv2.VideoCapture(clip)
+                values = []
+                while True:
+                    ok, frame = cap.read()
+                    if not ok:
+                        break
+                    values.append(int(round(frame[24, 32].mean())) // 5)
+                cap.release()
+                self.assertListEqual(values, list(range(first, last + 1)))
+
+        self.assertRaises(ValueError, recorder.process, frames[0])
+
+    def test_process_min_area(self):
+        print("\nTesting Clip Recorder triggered by a motion detector")
+        bg = np.zeros((120, 160, 3), dtype='uint8')
+        noise = bg.copy()
+        noise[100:103, 60:63] = 255  # a speck, below min_area
+        moving = noise.copy()
+        cv2.rectangle(moving, (10, 20), (40, 50), (255, 255, 255), -1)
+
+        with tempfile.TemporaryDirectory() as out_dir:
+            md = pv3.MotionDetector(method=pv3.BG_SUBTRACT_STATIC, bg_image=pv3.Image(bg), buff_size=1,
+                                    thresh=20, min_area=100)
+            out_dir = os.path.join(out_dir, "clips")  # created by the recorder
+            recorder = pv3.ClipRecorder(out_dir, pre_roll=0.2, hold_time=0.2, fps=10, four_cc="MJPG",
+                                        name_pattern="clip_{:04d}.avi", motion_detector=md)
+            counts = [recorder.process(pv3.Image(noise)) for _ in range(5)]
+            self.assertListEqual(counts, [0] * 5)
+            self.assertFalse(recorder.is_recording())
+            self.assertListEqual(recorder.clips, [])
+
+            self.assertEqual(recorder.process(pv3.Image(moving)), 1)
+            self.assertTrue(recorder.is_recording())
+            recorder.close()
+            self.assertEqual(len(recorder.clips), 1)
+            self.assertTrue(os.path.isfile(recorder.clips[0]))
+
+        # a blob of exactly min_area pixels is not motion, as for MotionDetector.blobs()
+        md = pv3.MotionDetector(method=pv3.BG_SUBTRACT_STATIC, bg_image=pv3.Image(bg), buff_size=1,
+                                thresh=20, min_area=0)
+        md.detect(pv3.Image(moving))
+        area = int(md.blobs()["area"].max())
+        with tempfile.TemporaryDirectory() as out_dir:
+            for (min_area, expected) in [(area, 0), (area - 1, 1)]:
+                md = pv3.MotionDetector(method=pv3.BG_SUBTRACT_STATIC, bg_image=pv3.Image(bg), buff_size=1,
+                                        thresh=20, min_area=min_area)
+                recorder = pv3.ClipRecorder(out_dir, fps=10, four_cc="MJPG", name_pattern="clip_{:04d}.avi",
+                                            motion_detector=md)
+                self.assertEqual(recorder.process(pv3.Image(moving)), expected)
+                self.assertEqual(recorder.is_recording(), expected > 0)
+                recorder.close()
+
+
 if __name__ == '__main__':
     unittest.main()